@@ -0,0 +1,503 @@
+"""Streaming batch conversion of CSV, JSON Lines and raw binary files.
+
+Rows are read lazily and pushed through a generator pipeline in
+fixed-size chunks, so memory use does not depend on the input size.
+Raw float arrays are memory-mapped and converted chunk by chunk with
+NumPy, writing straight into the mapped output. Large files can also be
+split into byte-range shards and converted by a pool of processes.
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from converter_engine import ConversionEngine
+from converter_rate_cache import RateCache, is_rate_cache
+from converter_units import UNIT_DEFINITIONS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CHUNK_SIZE = 10000
+BINARY_CHUNK_SIZE = 1 << 20
+FORMATS = ("csv", "jsonl")
+BINARY_DTYPES = {"float64": "<f8", "float32": "<f4"}
+MIN_SHARD_BYTES = 1 << 20
+SHARDS_PER_WORKER = 4
+
+# Per-process state of a parallel conversion, set by _init_worker()
+_worker = {}
+
+
+class BatchCancelled(Exception):
+    """Raised when a parallel conversion is cancelled"""
+
+
+def chunked(rows, size=CHUNK_SIZE):
+    """Group an iterable of rows into lists of at most size rows"""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def convert_chunks(chunks, column, scale, offset, target=None):
+    """Convert one column of every row, chunk by chunk.
+
+    Empty cells are passed through unchanged. The result is written back
+    into column, or into target when it is given.
+    """
+    target = target or column
+    row_number = 0
+    for chunk in chunks:
+        for row in chunk:
+            row_number += 1
+            value = row.get(column)
+            if value is None or value == "":
+                row[target] = value
+                continue
+            try:
+                row[target] = float(value) * scale + offset
+            except (TypeError, ValueError):
+                raise ValueError(f"Row {row_number}: cannot convert {value!r} in column '{column}'")
+        yield chunk
+
+
+def convert_csv(source, dest, column, scale, offset, target=None, chunk_size=CHUNK_SIZE):
+    """Stream a CSV file through the converter, return the number of rows"""
+    reader = csv.DictReader(source)
+    fieldnames = list(reader.fieldnames or [])
+    if column not in fieldnames:
+        raise ValueError(f"Column '{column}' not found in CSV header")
+    if target and target not in fieldnames:
+        fieldnames.append(target)
+
+    writer = csv.DictWriter(dest, fieldnames=fieldnames, lineterminator="\n")
+    writer.writeheader()
+    count = 0
+    for chunk in convert_chunks(chunked(reader, chunk_size), column, scale, offset, target):
+        writer.writerows(chunk)
+        count += len(chunk)
+    return count
+
+
+def convert_jsonl(source, dest, column, scale, offset, target=None, chunk_size=CHUNK_SIZE):
+    """Stream a JSON Lines file through the converter, return the number of rows"""
+    rows = (json.loads(line) for line in source if line.strip())
+    count = 0
+    for chunk in convert_chunks(chunked(rows, chunk_size), column, scale, offset, target):
+        dest.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in chunk)
+        count += len(chunk)
+    return count
+
+
+def convert_binary(input_path, output_path, scale, offset, dtype="float64",
+                   chunk_size=BINARY_CHUNK_SIZE):
+    """Convert a raw little-endian float file, return the number of values.
+
+    Both files are memory-mapped and every chunk is converted directly
+    into the output mapping. With output_path None (or the input path)
+    the file is converted in place.
+    """
+    if np is None:
+        raise RuntimeError("Binary conversion requires NumPy (pip install numpy)")
+
+    dtype = np.dtype(BINARY_DTYPES[dtype])
+    size = os.path.getsize(input_path)
+    if size % dtype.itemsize:
+        raise ValueError(f"File size {size} is not a multiple of {dtype.itemsize} bytes")
+    count = size // dtype.itemsize
+
+    in_place = output_path is None or (
+        os.path.exists(output_path) and os.path.samefile(input_path, output_path))
+    if count == 0:
+        if not in_place:
+            open(output_path, "wb").close()
+        return 0
+
+    if in_place:
+        source = dest = np.memmap(input_path, dtype=dtype, mode="r+", shape=(count,))
+    else:
+        source = np.memmap(input_path, dtype=dtype, mode="r", shape=(count,))
+        dest = np.memmap(output_path, dtype=dtype, mode="w+", shape=(count,))
+
+    for start in range(0, count, chunk_size):
+        stop = min(start + chunk_size, count)
+        out = dest[start:stop]
+        np.multiply(source[start:stop], scale, out=out)
+        if offset:
+            np.add(out, offset, out=out)
+
+    dest.flush()
+    del source, dest
+    return count
+
+
+def split_ranges(path, shards, align_lines=True, start=0, quote=None):
+    """Split a file into byte ranges [(start, end)].
+
+    With align_lines every boundary is moved forward to the start of the
+    next line, so no record is cut in half. With quote (b'"' for CSV) it
+    is only placed after a newline outside quoted fields, i.e. after an
+    even number of quote characters since start, so a quoted field that
+    spans lines stays in one shard. This reads the file once.
+    """
+    size = os.path.getsize(path)
+    step = max((size - start) // max(shards, 1), MIN_SHARD_BYTES)
+    bounds = [start]
+    quotes = 0  # quote characters in [start, counted)
+    counted = start
+    with open(path, "rb") as f:
+        position = start + step
+        while position < size:
+            if align_lines:
+                f.seek(position - 1)
+                f.readline()
+                position = f.tell()
+                if quote:
+                    f.seek(counted)
+                    while counted < position:
+                        block = f.read(min(position - counted, 1 << 20))
+                        if not block:
+                            break
+                        quotes += block.count(quote)
+                        counted += len(block)
+                    while quotes % 2 and counted < size:
+                        line = f.readline()
+                        quotes += line.count(quote)
+                        counted += len(line)
+                    position = counted
+            if position >= size:
+                break
+            if position > bounds[-1]:
+                bounds.append(position)
+            position += step
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def read_lines(path, start, end):
+    """Yield the text lines of a byte range of a file"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        position = start
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode("utf-8")
+
+
+def _init_worker(units, category, from_unit, to_unit, rates=None):
+    """Build this process' own copy of the conversion tables"""
+    # Ctrl+C is handled by the parent, which cancels the pool cleanly
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    engine = ConversionEngine(units)
+    if rates:
+        engine.set_rates(rates)
+    _worker["engine"] = engine
+    _worker["affine"] = engine.affine(category, from_unit, to_unit)
+
+
+def _convert_text_shard(fmt, path, start, end, out_path, column, target, header):
+    """Convert the lines of one shard into out_path, return the row count"""
+    scale, offset = _worker["affine"]
+    lines = read_lines(path, start, end)
+    count = 0
+    try:
+        with open(out_path, "w", encoding="utf-8", newline="") as dest:
+            if fmt == "jsonl":
+                rows = (json.loads(line) for line in lines if line.strip())
+                for chunk in convert_chunks(chunked(rows), column, scale, offset, target):
+                    dest.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in chunk)
+                    count += len(chunk)
+            else:
+                fieldnames = header + [target] if target and target not in header else header
+                reader = csv.DictReader(lines, fieldnames=header)
+                writer = csv.DictWriter(dest, fieldnames=fieldnames, lineterminator="\n")
+                for chunk in convert_chunks(chunked(reader), column, scale, offset, target):
+                    writer.writerows(chunk)
+                    count += len(chunk)
+    except ValueError as e:
+        raise ValueError(f"Shard at byte {start}: {e}")
+    return count
+
+
+def _convert_binary_shard(path, out_path, dtype, start, stop):
+    """Convert values [start, stop) of a raw float file, return the count"""
+    scale, offset = _worker["affine"]
+    dtype = np.dtype(BINARY_DTYPES[dtype])
+    count = stop - start
+    in_place = os.path.samefile(path, out_path)
+    dest = np.memmap(out_path, dtype=dtype, mode="r+",
+                     offset=start * dtype.itemsize, shape=(count,))
+    source = dest if in_place else np.memmap(path, dtype=dtype, mode="r",
+                                             offset=start * dtype.itemsize, shape=(count,))
+    for first in range(0, count, BINARY_CHUNK_SIZE):
+        last = min(first + BINARY_CHUNK_SIZE, count)
+        out = dest[first:last]
+        np.multiply(source[first:last], scale, out=out)
+        if offset:
+            np.add(out, offset, out=out)
+    dest.flush()
+    del source, dest
+    return count
+
+
+def convert_parallel(input_path, output_path, units, category, from_unit, to_unit,
+                     fmt="csv", column=None, target=None, dtype=None, workers=None,
+                     progress=None, cancel=None, rates=None):
+    """Convert a large file with a pool of worker processes.
+
+    The input is split into byte-range shards (on line boundaries for
+    text, on value boundaries for binary). Each worker builds its own
+    ConversionEngine and converts whole shards; text shards are written
+    to temporary files and stitched together in order, binary shards
+    are written straight into the memory-mapped output. CSV shards start
+    at record boundaries, so quoted fields may span several lines.
+
+    progress(rows, rows_per_second) is called as shards finish. Setting
+    the cancel event (or Ctrl+C) stops the pool and raises
+    BatchCancelled. rates is a {"EUR": units per USD} table for the
+    currency category. Returns the number of rows or values converted.
+    """
+    workers = workers or os.cpu_count() or 1
+    shards = workers * SHARDS_PER_WORKER
+    header = None
+    tmp_dir = None
+
+    if dtype:
+        if np is None:
+            raise RuntimeError("Binary conversion requires NumPy (pip install numpy)")
+        itemsize = np.dtype(BINARY_DTYPES[dtype]).itemsize
+        size = os.path.getsize(input_path)
+        if size % itemsize:
+            raise ValueError(f"File size {size} is not a multiple of {itemsize} bytes")
+        if output_path is None:
+            output_path = input_path
+        elif not (os.path.exists(output_path) and os.path.samefile(input_path, output_path)):
+            with open(output_path, "wb") as f:
+                f.truncate(size)
+        count = size // itemsize
+        step = max(-(-count // shards), MIN_SHARD_BYTES // itemsize)
+        tasks = [(_convert_binary_shard, input_path, output_path, dtype,
+                  first, min(first + step, count))
+                 for first in range(0, count, step)]
+    else:
+        data_start = 0
+        if fmt == "csv":
+            with open(input_path, "rb") as f:
+                header_line = f.readline()
+                data_start = f.tell()
+            header = next(csv.reader([header_line.decode("utf-8")]), [])
+            if column not in header:
+                raise ValueError(f"Column '{column}' not found in CSV header")
+        out_dir = os.path.dirname(os.path.abspath(output_path)) if output_path != "-" else None
+        tmp_dir = tempfile.mkdtemp(prefix="convector-", dir=out_dir)
+        tasks = [(_convert_text_shard, fmt, input_path, start, end,
+                  os.path.join(tmp_dir, f"shard{i:06d}"), column, target, header)
+                 for i, (start, end) in enumerate(
+                     split_ranges(input_path, shards, start=data_start,
+                                  quote=b'"' if fmt == "csv" else None))]
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(units, category, from_unit, to_unit, rates))
+    started = time.monotonic()
+    rows = 0
+    try:
+        pending = {executor.submit(*task) for task in tasks}
+        while pending:
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            if cancel is not None and cancel.is_set():
+                raise BatchCancelled("Conversion cancelled")
+            for future in done:
+                rows += future.result()
+            if done and progress:
+                elapsed = max(time.monotonic() - started, 1e-9)
+                progress(rows, rows / elapsed)
+    except BaseException as e:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        if isinstance(e, KeyboardInterrupt):
+            raise BatchCancelled("Conversion cancelled") from None
+        raise
+    executor.shutdown(wait=True)
+
+    if tmp_dir:
+        # Stitch the shard outputs back together in input order
+        dest = open_stream(output_path, "w")
+        try:
+            if header is not None:
+                fieldnames = header + [target] if target and target not in header else header
+                csv.writer(dest, lineterminator="\n").writerow(fieldnames)
+            dest.flush()
+            for task in tasks:
+                with open(task[5], "r", encoding="utf-8", newline="") as part:
+                    shutil.copyfileobj(part, dest)
+        finally:
+            if dest is not sys.stdout:
+                dest.close()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return rows
+
+
+def build_parser():
+    """Command line options of the batch converter"""
+    parser = argparse.ArgumentParser(
+        description="Convert a column of a CSV or JSON Lines file, or a raw float "
+                    "array, between units.")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="input file, '-' for stdin (default)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="output file, '-' for stdout (default)")
+    parser.add_argument("-f", "--format", choices=FORMATS,
+                        help="input format (default: from file extension, else csv)")
+    parser.add_argument("-c", "--column", help="column to convert (CSV and JSON Lines)")
+    parser.add_argument("--into", metavar="COLUMN",
+                        help="write results to this column instead of replacing the input")
+    parser.add_argument("--category",
+                        help="category ID or name: "
+                             + ", ".join(category[0] for category in UNIT_DEFINITIONS)
+                             + ", 'compound' for unit expressions such as km/h, "
+                               "or 'currency' with --rates")
+    parser.add_argument("--rates", metavar="FILE",
+                        help="currency rates for --category currency: the app's "
+                             "currency_rates.bin or a saved API response")
+    parser.add_argument("--from", dest="from_unit",
+                        help="source unit: symbol (kg, °C), name or label")
+    parser.add_argument("--to", dest="to_unit",
+                        help="target unit: symbol (kg, °C), name or label")
+    parser.add_argument("-e", "--eval", metavar="EXPRESSION",
+                        help="evaluate an expression such as \"3 ft 2 in to cm\" and exit")
+    parser.add_argument("--binary", choices=list(BINARY_DTYPES),
+                        help="treat input as a raw little-endian float array")
+    parser.add_argument("--in-place", action="store_true",
+                        help="with --binary, convert the input file in place")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="split the input file into shards and convert them with "
+                             "this many processes (0 = one per CPU)")
+    parser.add_argument("--chunk-size", type=int,
+                        help=f"rows per chunk (default {CHUNK_SIZE}, "
+                             f"{BINARY_CHUNK_SIZE} values with --binary)")
+    return parser
+
+
+def load_rates(path):
+    """Read a {"EUR": units per USD} table from the app's currency_rates.bin,
+    an API response or a plain JSON object"""
+    if is_rate_cache(path):
+        with RateCache(path) as cache:
+            return cache.as_dict()
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    for key in ("rates", "conversion_rates"):
+        if isinstance(data.get(key), dict):
+            return data[key]
+    return data
+
+
+def open_stream(path, mode):
+    """Open a file, or return stdin/stdout for '-'"""
+    if path == "-":
+        return sys.stdin if "r" in mode else sys.stdout
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def report_progress(rows, rate):
+    """Print conversion progress on stderr"""
+    print(f"\r{rows} rows, {rate:,.0f} rows/s", end="", file=sys.stderr, flush=True)
+
+
+def main(argv, units=None):
+    """Run the batch converter, with unit labels from load_units() if given"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.eval:
+        try:
+            value, category, unit = ConversionEngine(units).evaluate(args.eval)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        print(f"{value:.10g} {unit}")
+        return 0
+
+    if not (args.category and args.from_unit and args.to_unit):
+        parser.error("--category, --from and --to are required")
+    if args.in_place and not args.binary:
+        parser.error("--in-place needs --binary")
+    if args.binary:
+        if args.input == "-":
+            parser.error("--binary needs an input file")
+        if args.output == "-" and not args.in_place:
+            parser.error("--binary needs an output file or --in-place")
+    elif not args.column:
+        parser.error("--column is required for CSV and JSON Lines")
+    elif "-" not in (args.input, args.output) and os.path.exists(args.input) \
+            and os.path.exists(args.output) and os.path.samefile(args.input, args.output):
+        # Opening the output would empty the input before it is read
+        parser.error("--output must not be the input file")
+    if args.workers != 1 and args.input == "-":
+        parser.error("--workers needs an input file")
+
+    fmt = args.format
+    if fmt is None:
+        fmt = "jsonl" if args.input.endswith((".jsonl", ".ndjson")) else "csv"
+
+    try:
+        engine = ConversionEngine(units)
+        rates = load_rates(args.rates) if args.rates else None
+        if rates:
+            engine.set_rates(rates)
+        scale, offset = engine.affine(args.category, args.from_unit, args.to_unit)
+
+        if args.workers != 1:
+            output = None if args.in_place else args.output
+            count = convert_parallel(
+                args.input, output, units, args.category, args.from_unit, args.to_unit,
+                fmt, args.column, args.into, args.binary, args.workers or None,
+                progress=report_progress, rates=rates)
+            print(f"\nConverted {count} {'values' if args.binary else 'rows'}",
+                  file=sys.stderr)
+            return 0
+
+        if args.binary:
+            output = None if args.in_place else args.output
+            count = convert_binary(args.input, output, scale, offset, args.binary,
+                                   max(args.chunk_size or BINARY_CHUNK_SIZE, 1))
+            print(f"Converted {count} values", file=sys.stderr)
+            return 0
+
+        convert = convert_jsonl if fmt == "jsonl" else convert_csv
+
+        source = open_stream(args.input, "r")
+        dest = open_stream(args.output, "w")
+        try:
+            count = convert(source, dest, args.column, scale, offset,
+                            args.into, max(args.chunk_size or CHUNK_SIZE, 1))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if dest is not sys.stdout:
+                dest.close()
+    except BatchCancelled as e:
+        print(f"\n{e}", file=sys.stderr)
+        return 130
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Converted {count} rows", file=sys.stderr)
+    return 0
@@ -0,0 +1,140 @@
+"""Dimensional analysis for compound units such as km/h, kWh/100km,
+g/cm³ or Pa·s.
+
+Compound units are built from the units of the Mass, Length, Time,
+Energy, Pressure, Volume, Area and Speed categories. Every unit maps to
+a dimension vector over (mass, length, time) and a factor to SI; two
+expressions convert only when their vectors match. Parsed expressions
+and derived factors are kept in LRU caches, so a repeated compound
+conversion costs a single multiply.
+"""
+import re
+from functools import lru_cache
+
+# Category ID -> (dimension vector (M, L, T), factor of the category base unit to SI)
+DIMENSIONS = {
+    "mass": ((1, 0, 0), 1.0),       # kg
+    "length": ((0, 1, 0), 1.0),     # m
+    "time": ((0, 0, 1), 1.0),       # s
+    "energy": ((1, 2, -2), 1.0),    # J
+    "pressure": ((1, -1, -2), 1.0), # Pa
+    "volume": ((0, 3, 0), 0.001),   # L
+    "area": ((0, 2, 0), 1.0),       # m²
+    "speed": ((0, 1, -1), 1.0),     # m/s
+}
+DIMENSION_NAMES = ("M", "L", "T")
+DIMENSIONLESS = (0, 0, 0)
+
+TOKEN = re.compile(r"\s*(?:(\*\*|\^)\s*([-+]?\d+)|([*·⋅×/()])|([^\s*·⋅×/^()]+))")
+NUMBER_PREFIX = re.compile(r"(\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)(.*)$")
+EXPONENT_SUFFIX = re.compile(r"(.*?[^\d⁰¹²³⁴⁵⁶⁷⁸⁹⁻])(⁻?[⁰¹²³⁴⁵⁶⁷⁸⁹]+|\d+)$")
+SUPERSCRIPTS = str.maketrans("⁰¹²³⁴⁵⁶⁷⁸⁹⁻", "0123456789-")
+
+
+def format_dimension(dims):
+    """Readable form of a dimension vector, e.g. 'M L^-1 T^-2'"""
+    parts = []
+    for name, power in zip(DIMENSION_NAMES, dims):
+        if power == 1:
+            parts.append(name)
+        elif power:
+            parts.append(f"{name}^{power}")
+    return " ".join(parts) or "dimensionless"
+
+
+class Dimensions:
+    """Parser and factor cache for compound unit expressions"""
+
+    def __init__(self, registry, cache_size=1024):
+        self.categories = [registry.categories[category_id] for category_id in DIMENSIONS]
+        # Bound per instance, so every engine has its own caches
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+        self.factor = lru_cache(maxsize=cache_size)(self._factor)
+
+    def _find(self, symbol):
+        """Return (factor to SI, dimension vector) of a simple unit, or None"""
+        for aliases in ("aliases", "folded"):
+            key = symbol if aliases == "aliases" else symbol.casefold()
+            for category in self.categories:
+                unit = getattr(category, aliases).get(key)
+                if unit is not None:
+                    dims, si = DIMENSIONS[category.id]
+                    return unit.scale * si, dims
+        return None
+
+    def _term(self, word):
+        """Return (factor, dimension vector) of one word such as 100km or cm³"""
+        number = 1.0
+        match = NUMBER_PREFIX.match(word)
+        if match:
+            number = float(match.group(1))
+            word = match.group(2)
+            if not word:
+                return number, DIMENSIONLESS
+
+        found = self._find(word)
+        if found is None:
+            # Trailing power: cm3, cm³, s⁻¹
+            match = EXPONENT_SUFFIX.match(word)
+            if match:
+                found = self._find(match.group(1))
+                if found is not None:
+                    power = int(match.group(2).translate(SUPERSCRIPTS))
+                    factor, dims = found
+                    found = factor ** power, tuple(d * power for d in dims)
+        if found is None:
+            raise ValueError(f"Unknown unit: {word}")
+        return number * found[0], found[1]
+
+    def _parse(self, text):
+        """Return (factor to SI, dimension vector) of a compound unit expression"""
+        factor = 1.0
+        dims = DIMENSIONLESS
+        sign = 1
+        last = None  # (factor, dims) of the previous term, for ^ powers
+        position = 0
+        text = text.strip()
+        if not text:
+            raise ValueError("Empty unit expression")
+
+        while position < len(text):
+            match = TOKEN.match(text, position)
+            if not match or match.end() == position:
+                raise ValueError(f"Cannot parse unit expression: {text}")
+            position = match.end()
+            power, operator, word = match.group(2), match.group(3), match.group(4)
+
+            if power is not None:
+                if last is None:
+                    raise ValueError(f"Power without a unit in: {text}")
+                # Replace the previous term with its power
+                term_factor, term_dims = last
+                power = int(power)
+                factor /= term_factor ** sign
+                dims = tuple(d - sign * t for d, t in zip(dims, term_dims))
+                last = term_factor ** power, tuple(t * power for t in term_dims)
+            elif operator == "/":
+                # Everything after a slash is in the denominator, so
+                # W/m·K and W/(m·K) both mean W/(m·K); parentheses only group
+                sign = -1
+                last = None
+                continue
+            elif operator is not None:
+                last = None
+                continue
+            else:
+                last = self._term(word)
+
+            term_factor, term_dims = last
+            factor *= term_factor ** sign
+            dims = tuple(d + sign * t for d, t in zip(dims, term_dims))
+        return factor, dims
+
+    def _factor(self, from_text, to_text):
+        """Return the multiplier converting from_text into to_text"""
+        from_factor, from_dims = self.parse(from_text)
+        to_factor, to_dims = self.parse(to_text)
+        if from_dims != to_dims:
+            raise ValueError(f"Incompatible units: {from_text} is {format_dimension(from_dims)}, "
+                             f"{to_text} is {format_dimension(to_dims)}")
+        return from_factor / to_factor
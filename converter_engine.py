@@ -0,0 +1,199 @@
+"""Headless conversion engine shared by the GUI and the batch tools.
+
+The engine does not import tkinter: it compiles every category of the
+unit registry into a matrix of (scale, offset) pairs once, so a
+conversion is a single indexed multiply-add. Units are looked up by
+any alias, including the labels of the table returned by
+UniversalConverter.load_units().
+Compound units such as km/h or g/cm³ go through the "compound"
+pseudo-category, see converter_dimensions.py, and free-form expressions
+such as "3 ft 2 in to cm" through evaluate(), see converter_expressions.py.
+Currency rates are set with set_rates(), which precomputes the cross-rate
+matrix, so a currency pair is one indexed read as well.
+NumPy is optional and only needed for convert_many(); it is imported on
+the first call, so the window never loads it.
+"""
+import math
+
+from converter_dimensions import Dimensions
+from converter_expressions import Expressions
+from converter_units import UnitRegistry
+
+# Pseudo-category for compound unit expressions (km/h, kWh/100km, Pa·s)
+COMPOUND = "compound"
+
+
+def compose(first, second):
+    """Chain two (scale, offset) conversions into one: second(first(x))"""
+    a1, b1 = first
+    a2, b2 = second
+    return a2 * a1, a2 * b1 + b2
+
+
+def unit_affine(from_unit, to_unit):
+    """Precompose two units' affine maps to the base unit into (scale, offset)"""
+    # Scales and offsets may be exact Fractions (Temperature)
+    return (float(from_unit.scale / to_unit.scale),
+            float((from_unit.offset - to_unit.offset) / to_unit.scale))
+
+
+def cross_rates(scales):
+    """N x N matrix (nested lists) of scales[i] / scales[j]"""
+    # Scales are positive, or NaN for a currency without a rate
+    return [[a / b for b in scales] for a in scales]
+
+
+def numpy():
+    """The numpy module, imported on first use"""
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("convert_many() requires NumPy (pip install numpy)") from None
+    return numpy
+
+
+def as_array(data, dtype):
+    """data as an ndarray. A byte buffer (bytes, bytearray, mmap) is read
+    as packed dtype items, not converted byte by byte; a typed buffer
+    (array.array, memoryview) keeps its own item type."""
+    np = numpy()
+    if isinstance(data, np.ndarray):
+        return data
+    try:
+        view = memoryview(data)
+    except TypeError:
+        return np.asarray(data, dtype=dtype)
+    if view.format in ("B", "b", "c"):
+        return np.frombuffer(data, dtype=dtype)
+    return np.asarray(view)
+
+
+def code(unit):
+    """Symbol of a unit, e.g. EUR for currency.EUR"""
+    return unit.id.partition(".")[2]
+
+
+class ConversionEngine:
+    """Precompiled conversion tables for every category of the unit registry.
+
+    Every unit is an affine map to its base unit, so every pair of units
+    of a category is precomposed into one (scale, offset) and any
+    conversion, Temperature included, is value * scale + offset.
+    """
+
+    def __init__(self, units=None, currency_units=None, history=None):
+        # Units are resolved through the registry, so any alias works:
+        # canonical IDs, symbols and the labels of the given load_units() table
+        self.registry = UnitRegistry()
+        if units is not None:
+            self.registry.add_labels(units)
+        if currency_units is not None:
+            self.registry.add_currencies(currency_units)
+
+        # category ID -> [[(scale, offset)]], or for categories whose rates
+        # change at runtime (currencies) an N x N matrix of scales, see set_rates()
+        self.pairs = {}
+        for category in self.registry.categories.values():
+            if not category.fixed:
+                self.pairs[category.id] = cross_rates(category.scales)
+            else:
+                self.pairs[category.id] = [
+                    [unit_affine(from_unit, to_unit) for to_unit in category.units]
+                    for from_unit in category.units
+                ]
+        self.history = history  # RateHistory for as_of= currency conversions
+        self.dimensions = Dimensions(self.registry)
+        self.expressions = Expressions(self)
+
+    def lookup(self, category, from_unit, to_unit):
+        """Return (category, from_unit, to_unit) resolved to registry objects"""
+        category = self.registry.category(category)
+        return (category,
+                self.registry.resolve(from_unit, category),
+                self.registry.resolve(to_unit, category))
+
+    def affine(self, category, from_unit, to_unit, as_of=None):
+        """Return (scale, offset) such that result = value * scale + offset.
+
+        as_of (a date, datetime, ISO string or unix time) uses the
+        currency rates in effect at that time, see converter_rate_history.py.
+        """
+        if category == COMPOUND:
+            return self.dimensions.factor(from_unit, to_unit), 0.0
+        category, from_unit, to_unit = self.lookup(category, from_unit, to_unit)
+        pairs = self.pairs[category.id]
+        if not category.fixed:
+            if as_of is not None:
+                return self._history().cross_rate(code(from_unit), code(to_unit), as_of), 0.0
+            scale = float(pairs[from_unit.index][to_unit.index])
+            if math.isnan(scale):
+                raise ValueError(f"No rate for {from_unit.label} -> {to_unit.label}")
+            return scale, 0.0
+        return pairs[from_unit.index][to_unit.index]
+
+    def set_rates(self, rates):
+        """Store a {"EUR": units per USD} table and rebuild the cross-rate matrix"""
+        category = self.registry.set_rates(rates)
+        self.pairs[category.id] = cross_rates(category.scales)
+        return category
+
+    def _history(self):
+        if self.history is None:
+            raise ValueError("No currency rate history for as_of conversions")
+        return self.history
+
+    def factor(self, category, from_unit, to_unit):
+        """Return the multiplier for a pair of units without an offset"""
+        scale, offset = self.affine(category, from_unit, to_unit)
+        if offset:
+            raise ValueError(f"{category} has no constant conversion factor")
+        return scale
+
+    def chain(self, category, *units):
+        """Collapse a chain of conversions u0 -> u1 -> ... into one (scale, offset)"""
+        result = (1.0, 0.0)
+        for from_unit, to_unit in zip(units, units[1:]):
+            result = compose(result, self.affine(category, from_unit, to_unit))
+        return result
+
+    def convert(self, value, category, from_unit, to_unit, as_of=None):
+        """Convert a single value"""
+        scale, offset = self.affine(category, from_unit, to_unit, as_of)
+        return value * scale + offset
+
+    def evaluate(self, text):
+        """Evaluate an expression such as "12.5 psi -> bar".
+
+        Returns (value, category label, unit label).
+        """
+        return self.expressions.evaluate(text)
+
+    def convert_many(self, values, category, from_unit, to_unit, out=None, as_of=None,
+                     dtype="float64"):
+        """Convert a NumPy array or buffer of values in one vectorized pass.
+
+        Byte buffers (bytes, bytearray, mmap) hold packed dtype values,
+        typed buffers such as array.array their own. Pass out=values to convert in place without allocating;
+        out may be a writable buffer as well. For currencies, as_of may
+        also be a sequence of dates, one per value, to convert a whole
+        ledger at the rates of its transaction dates.
+        """
+        np = numpy()
+        values = as_array(values, dtype)
+        if values.dtype.kind != "f":
+            values = values.astype(dtype)
+        if out is not None:
+            out = as_array(out, dtype)
+
+        if category != COMPOUND and np.ndim(as_of) > 0:
+            # One date per value: a ledger at the rates of its transaction dates
+            found, source, target = self.lookup(category, from_unit, to_unit)
+            if not found.fixed:
+                scale = np.asarray(self._history().cross_rates(code(source), code(target), as_of))
+                return np.multiply(values, scale, out=out)
+            as_of = None
+        scale, offset = self.affine(category, from_unit, to_unit, as_of)
+        result = np.multiply(values, scale, out=out)
+        if offset:
+            np.add(result, offset, out=result)
+        return result
@@ -0,0 +1,114 @@
+"""Conversion expressions such as "12.5 psi -> bar" or "3 ft 2 in to cm".
+
+An expression is one or more quantities (a number and a unit, joined by
++ or - or just written one after another) followed by a separator
+(->, →, =, to, in, as) and the target unit. Units are resolved through
+the unit registry, falling back to compound units (km/h, g/cm³).
+
+Numbers are lifted out before parsing, so "3 ft 2 in to cm" and
+"5 ft 11 in to cm" share the template "# ft # in to cm". Each template
+is compiled once into a closure over its precomposed factors and kept in
+an LRU cache.
+"""
+import re
+from functools import lru_cache
+
+# A number that is not part of a unit such as m3, kWh/100km or s^-2
+NUMBER = re.compile(r"(?<![\w.^/*])(?<!\^[-+])(\d+(?:\.\d*)?|\.\d+)(?:[eE]([-+]?\d+))?")
+SYMBOL_SEPARATOR = re.compile(r"^(.*\S)\s*(?:->|→|=>|=)\s*(\S.*)$")
+WORD_SEPARATOR = re.compile(r"^(.*\S)\s+(?:to|in|as)\s+(\S.*)$", re.IGNORECASE)
+TRAILING_SIGN = re.compile(r"^(.*?)\s*([+-])\s*$", re.S)
+
+
+def normalize(text):
+    """Split an expression into its template and its numbers"""
+    numbers = []
+
+    def lift(match):
+        numbers.append(float(match.group(0)))
+        return "#"
+
+    template = NUMBER.sub(lift, text.strip())
+    return " ".join(template.split()), numbers
+
+
+class Expressions:
+    """Compiler and template cache for conversion expressions"""
+
+    def __init__(self, engine, cache_size=512):
+        self.engine = engine
+        self.compile = lru_cache(maxsize=cache_size)(self._compile)
+
+    def evaluate(self, text):
+        """Evaluate an expression, return (value, category label, unit label)"""
+        template, numbers = normalize(text)
+        function, category, unit = self.compile(template)
+        return function(numbers), category, unit
+
+    def _split(self, template):
+        """Return the source quantities and the target unit of a template"""
+        match = SYMBOL_SEPARATOR.match(template) or WORD_SEPARATOR.match(template)
+        if not match:
+            raise ValueError("Add a target unit, e.g. '12.5 psi -> bar'")
+        source, target = match.group(1), match.group(2).strip()
+
+        parts = source.split("#")
+        prefix = parts[0].strip()
+        if prefix not in ("", "+", "-") or len(parts) < 2:
+            raise ValueError(f"Expression must start with a number: {source}")
+
+        terms = []  # (sign, unit text)
+        sign = -1.0 if prefix == "-" else 1.0
+        for i, part in enumerate(parts[1:], 1):
+            next_sign = 1.0
+            if i < len(parts) - 1:
+                match = TRAILING_SIGN.match(part)
+                if match:
+                    part = match.group(1)
+                    next_sign = -1.0 if match.group(2) == "-" else 1.0
+            unit = part.strip()
+            if not unit:
+                raise ValueError("Every number needs a unit")
+            terms.append((sign, unit))
+            sign = next_sign
+        return terms, target
+
+    def _resolve(self, units, target):
+        """Return (category, [(scale, offset)], target label) for the units"""
+        registry = self.engine.registry
+        for category in registry.categories.values():
+            if not category.fixed:
+                continue
+            to_unit = category.get(target)
+            if to_unit is None:
+                continue
+            from_units = [category.get(unit) for unit in units]
+            if all(from_units):
+                pairs = self.engine.pairs[category.id]
+                pairs = [pairs[unit.index][to_unit.index] for unit in from_units]
+                return category.label, pairs, to_unit.label
+
+        # Compound units such as km/h or kWh/100km
+        pairs = [(self.engine.dimensions.factor(unit, target), 0.0) for unit in units]
+        return "Compound", pairs, target
+
+    def _compile(self, template):
+        """Compile a template into (function(numbers), category, unit)"""
+        terms, target = self._split(template)
+        category, pairs, unit = self._resolve([unit for _, unit in terms], target)
+
+        if len(pairs) == 1:
+            (sign, _), (scale, offset) = terms[0], pairs[0]
+            scale *= sign
+
+            def function(numbers):
+                return numbers[0] * scale + offset
+        else:
+            if any(offset for _, offset in pairs):
+                raise ValueError(f"{category} values cannot be added")
+            scales = [sign * scale for (sign, _), (scale, _) in zip(terms, pairs)]
+
+            def function(numbers):
+                return sum(number * scale for number, scale in zip(numbers, scales))
+
+        return function, category, unit
@@ -0,0 +1,358 @@
+"""Structured conversion history with indexes for the search box.
+
+Every conversion is a HistoryRecord holding canonical IDs (category
+"mass", units "mass.kg"), not display text, so the journal reads the
+same in every language and records can be filtered without parsing
+strings. Display text is made from the registry labels on demand.
+
+History keeps the newest records, numbered from 1 in the order they
+were added, and indexes their numbers by category, by unit and by
+(from, to) unit pair. Given the registry, the first search for free
+text also indexes the records by the words of their display text,
+and the index is kept up to date as records come and go. A Query
+resolves the words of the search box against the registry: words
+naming a category or unit select index lists, any other word selects
+the records under every text word containing it. The lists are
+intersected, so filtering 100000 records only visits the matching
+ones.
+"""
+import time
+from collections import deque
+from functools import lru_cache
+from heapq import merge
+
+from converter_engine import COMPOUND
+
+UNITS = "units"
+CURRENCY = "currency"
+EXPRESSION = "expression"
+NOTE = "note"  # a message such as "History loaded", not a conversion
+
+SEPARATORS = {"->", "→", "=>", "=", "to", "in", "as"}
+
+
+class HistoryRecord:
+    """One conversion: value from_unit -> result to_unit"""
+
+    __slots__ = ("time", "mode", "category", "from_unit", "to_unit", "value", "result", "text")
+
+    def __init__(self, mode, category=None, from_unit=None, to_unit=None,
+                 value=None, result=None, time=None):
+        self.time = time                # unix time
+        self.mode = mode                # UNITS, CURRENCY, EXPRESSION or NOTE
+        self.category = category        # category ID
+        self.from_unit = from_unit      # unit ID, None for expressions
+        self.to_unit = to_unit          # unit ID, or the unit text of compound units
+        self.value = value              # number, or the expression / message text
+        self.result = result
+        self.text = None                # display text, made by describe()
+
+    def as_dict(self):
+        """The journal form of the record"""
+        return {"time": self.time, "mode": self.mode, "category": self.category,
+                "from": self.from_unit, "to": self.to_unit,
+                "input": self.value, "output": self.result}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Read a journal line; plain {"time", "text"} lines become notes"""
+        if "mode" not in data:
+            return cls(NOTE, value=data.get("text", ""), time=data.get("time"))
+        return cls(data["mode"], data.get("category"), data.get("from"), data.get("to"),
+                   data.get("input"), data.get("output"), data.get("time"))
+
+    def __repr__(self):
+        return f"HistoryRecord({self.mode!r}, {self.from_unit!r} -> {self.to_unit!r})"
+
+
+def make_record(registry, mode, category, from_unit, to_unit, value, result):
+    """A HistoryRecord for display labels (or any alias), stamped now"""
+    try:
+        category = registry.category(category).id
+    except ValueError:
+        category = COMPOUND
+    ids = []
+    for unit in (from_unit, to_unit):
+        found = registry.get(unit, category) if unit is not None and category != COMPOUND else None
+        ids.append(found.id if found is not None else unit)
+    return HistoryRecord(mode, category, ids[0], ids[1], value, result, int(time.time()))
+
+
+def note(text):
+    """A message for the history panel, stamped now"""
+    return HistoryRecord(NOTE, value=text, time=int(time.time()))
+
+
+def read_records(journal, count):
+    """The last count records of a HistoryJournal, oldest first"""
+    return [HistoryRecord.from_dict(data) for data in journal.tail(count)]
+
+
+def describe(record, registry):
+    """Display text of a record in the registry's language"""
+    if record.text is None:
+        if record.mode == NOTE:
+            record.text = str(record.value)
+        else:
+            category, from_label, to_label = _labels(registry, record.category,
+                                                     record.from_unit, record.to_unit)
+            if record.mode == EXPRESSION:
+                record.text = f"{record.value} → {record.result:.6f} {to_label} ({category})"
+            else:
+                record.text = f"{record.value} {from_label} → {record.result:.6f} {to_label} ({category})"
+    return record.text
+
+
+@lru_cache(maxsize=4096)
+def _labels(registry, category, from_unit, to_unit):
+    """(category label, from label, to label); a history repeats few unit pairs"""
+    if category == COMPOUND:
+        return "Compound", from_unit, to_unit
+    category = registry.category(category)
+    return (category.label,) + tuple(_label(category, unit) for unit in (from_unit, to_unit))
+
+
+def _label(category, unit_id):
+    unit = category.get(unit_id) if unit_id is not None else None
+    return unit.label if unit is not None else unit_id
+
+
+class History:
+    """The newest maxlen records, with indexes and an optional search"""
+
+    def __init__(self, maxlen, registry=None):
+        self.maxlen = maxlen
+        self.registry = registry  # needed for the text index
+        self.records = deque()
+        self.first = 1        # number of records[0]
+        self.by_category = {}  # category ID -> deque of record numbers, ascending
+        self.by_unit = {}      # unit ID -> deque of record numbers
+        self.by_pair = {}      # (from unit ID, to unit ID) -> deque of record numbers
+        # casefolded word of the display text -> record number, or a deque
+        # of them once the word repeats (most numbers occur only once);
+        # None until word_index() builds it
+        self.by_word = None
+        self.query = None
+        self.matches = None    # numbers of the records matching the query
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, number):
+        return self.records[number - self.first]
+
+    @property
+    def last(self):
+        """Number of the newest record, 0 before the first one"""
+        return self.first + len(self.records) - 1
+
+    def append(self, record):
+        """Add a record; True when it matches the current search"""
+        number = self.first + len(self.records)
+        self.records.append(record)
+        for index, key in self._keys(record):
+            index.setdefault(key, deque()).append(number)
+        if self.by_word is not None:
+            self._index_words(record, number)
+        if len(self.records) > self.maxlen:
+            self._drop_oldest()
+
+        if self.matches is None:
+            return True
+        if self.query.matches(record):
+            self.matches.append(number)
+            return True
+        return False
+
+    def _drop_oldest(self):
+        record = self.records.popleft()
+        # The oldest number is at the front of each of its index lists
+        for index, key in self._keys(record):
+            numbers = index[key]
+            numbers.popleft()
+            if not numbers:
+                del index[key]
+        if self.by_word is not None:
+            for word in self._words(record):
+                numbers = self.by_word[word]
+                if type(numbers) is int:
+                    del self.by_word[word]
+                else:
+                    numbers.popleft()
+                    if not numbers:
+                        del self.by_word[word]
+        if self.matches and self.matches[0] == self.first:
+            self.matches.popleft()
+        self.first += 1
+
+    def _keys(self, record):
+        if record.mode == NOTE:
+            return
+        yield self.by_category, record.category
+        yield self.by_unit, record.to_unit
+        if record.from_unit is not None:
+            if record.from_unit != record.to_unit:
+                yield self.by_unit, record.from_unit
+            yield self.by_pair, (record.from_unit, record.to_unit)
+
+    def _words(self, record):
+        return set(describe(record, self.registry).casefold().split())
+
+    def _index_words(self, record, number):
+        for word in self._words(record):
+            numbers = self.by_word.get(word)
+            if numbers is None:
+                self.by_word[word] = number
+            elif type(numbers) is int:
+                self.by_word[word] = deque((numbers, number))
+            else:
+                numbers.append(number)
+
+    def word_index(self):
+        """The text index (needs the registry), built on first use"""
+        if self.by_word is None:
+            self.by_word = {}
+            for number, record in enumerate(self.records, self.first):
+                self._index_words(record, number)
+        return self.by_word
+
+    def reset(self, records):
+        """Replace every record, keeping the search"""
+        self.records.clear()
+        self.by_category.clear()
+        self.by_unit.clear()
+        self.by_pair.clear()
+        self.by_word = None
+        self.first = 1
+        self.matches = None
+        for record in records:
+            self.append(record)
+        self.search(self.query)
+
+    def clear(self):
+        self.reset(())
+
+    def search(self, query):
+        """Show only the records matching query (None or empty: all)"""
+        self.query = query or None
+        self.matches = None if self.query is None else deque(self.query.select(self))
+
+    def visible(self):
+        """How many records the search lets through"""
+        return len(self.records) if self.matches is None else len(self.matches)
+
+    def visible_number(self, index):
+        """Number of the index-th visible record, newest first"""
+        if self.matches is None:
+            return self.last - index
+        return self.matches[-1 - index]
+
+
+class Query:
+    """The words of the search box, resolved against a unit registry.
+
+    A word naming a category keeps that category, a word naming a unit
+    keeps conversions from or to it; two unit words such as "kg lb" (or
+    "kg -> lb") keep conversions from the first to the second. Other
+    words must appear in the display text; a query word has no spaces,
+    so it appears in the text exactly when it is part of one of the
+    words History indexes.
+    """
+
+    def __init__(self, text, registry):
+        self.registry = registry
+        self.categories = set()
+        self.units = []  # one set of unit IDs per unit word, in query order
+        self.words = []
+        for word in text.split():
+            if word.casefold() in SEPARATORS:
+                continue
+            try:
+                self.categories.add(registry.category(word).id)
+                continue
+            except ValueError:
+                pass
+            units = {unit.id for category in registry.categories.values()
+                     for unit in (category.get(word),) if unit is not None}
+            if units:
+                self.units.append(units)
+            else:
+                self.words.append(word.casefold())
+
+    def __bool__(self):
+        return bool(self.categories or self.units or self.words)
+
+    def matches(self, record):
+        """Whether a record passes every filter of the query"""
+        if record.mode == NOTE:
+            return not (self.categories or self.units) and self._has_words(record)
+        if self.categories and record.category not in self.categories:
+            return False
+        units = self.units
+        if len(units) >= 2 and not (record.from_unit in units[0] and record.to_unit in units[1]):
+            return False
+        for ids in units[2:] if len(units) >= 2 else units:
+            if record.from_unit not in ids and record.to_unit not in ids:
+                return False
+        return self._has_words(record)
+
+    def _has_words(self, record):
+        if not self.words:
+            return True
+        text = (record.text or describe(record, self.registry)).casefold()
+        for word in self.words:
+            if word not in text:
+                return False
+        return True
+
+    def select(self, history):
+        """Numbers of the matching records of a History, ascending"""
+        candidates = []
+        if self.categories:
+            candidates.append(list(merge(*(history.by_category.get(category, ())
+                                           for category in self.categories))))
+        if len(self.units) >= 2:
+            candidates.append(list(merge(*(history.by_pair.get((source, target), ())
+                                           for source in self.units[0] for target in self.units[1]))))
+        elif self.units:
+            numbers = merge(*(history.by_unit.get(unit, ()) for unit in self.units[0]))
+            # A record between two units of the same word is listed under both
+            candidates.append(_unique(numbers) if len(self.units[0]) > 1 else list(numbers))
+        indexed = history.registry is not None
+        if indexed and self.words:
+            by_word = history.word_index()
+            candidates.extend(_containing(by_word, word) for word in self.words)
+        if not candidates:
+            # Words only and no text index: every display text is searched
+            return [number for number, record in enumerate(history, history.first)
+                    if self._has_words(record)]
+        smallest = min(candidates, key=len)
+        if len(self.units) <= 2 and (indexed or not self.words):
+            # The index lists decide alone: the records in all of them
+            if len(candidates) == 1:
+                return smallest
+            others = [set(numbers) for numbers in candidates if numbers is not smallest]
+            return [number for number in smallest if all(number in numbers for numbers in others)]
+        records = list(history)  # indexing the deque itself walks its blocks
+        return [number for number in smallest if self.matches(records[number - history.first])]
+
+
+def _containing(by_word, word):
+    """Ascending numbers of the records with a text word containing word"""
+    lists = [(numbers,) if type(numbers) is int else numbers
+             for text_word, numbers in by_word.items() if word in text_word]
+    if len(lists) == 1:
+        return list(lists[0])
+    return sorted(set().union(*lists))
+
+
+def _unique(numbers):
+    """Ascending numbers without repeats"""
+    result = []
+    for number in numbers:
+        if not result or result[-1] != number:
+            result.append(number)
+    return result
@@ -0,0 +1,153 @@
+"""Export of the persisted conversion history.
+
+export_history() streams the history journal (converter_history.jsonl)
+line by line into plain text, CSV, JSON Lines or, when pyarrow is
+installed, Parquet, so memory use does not grow with the history. The
+file type follows the extension of the target. Progress is reported as
+the fraction of the journal read, and the export stops soon after
+cancelled is set. Rows go to a temporary file that replaces the target
+only once the export is complete.
+
+HistoryExport runs one export on a worker thread for the window.
+"""
+import csv
+import json
+import os
+from datetime import datetime
+from importlib.util import find_spec
+from itertools import islice
+
+from converter_history import HistoryRecord, describe
+from converter_tasks import Background
+
+COLUMNS = ("time", "mode", "category", "from", "to", "input", "output", "text")
+PROGRESS_LINES = 1000  # journal lines between progress reports
+PARQUET_BATCH = 10000  # rows per Parquet row group
+
+
+class ExportCancelled(Exception):
+    """Raised inside the export when it is cancelled"""
+
+
+def parquet_available():
+    """Whether pyarrow is installed, without importing it"""
+    return find_spec("pyarrow") is not None
+
+
+def history_rows(journal_path, registry, progress=None, cancelled=None):
+    """Yield one tuple per journal record, in COLUMNS order"""
+    if not os.path.exists(journal_path):
+        return
+    size = os.path.getsize(journal_path) or 1
+    done = 0
+    with open(journal_path, "rb") as f:
+        for count, line in enumerate(f, 1):
+            done += len(line)
+            if count % PROGRESS_LINES == 0:
+                if cancelled is not None and cancelled.is_set():
+                    raise ExportCancelled()
+                if progress is not None:
+                    progress(min(done / size, 1.0))
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue  # torn line
+            if not isinstance(data, dict):
+                continue
+            record = HistoryRecord.from_dict(data)
+            when = datetime.fromtimestamp(record.time).isoformat(sep=" ") if record.time else ""
+            yield (when, record.mode, record.category, record.from_unit, record.to_unit,
+                   record.value, record.result, describe(record, registry))
+
+
+def write_text(rows, path, title):
+    """Numbered display text, as the Save History button always wrote it"""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"{title}:\n")
+        f.write("=" * 50 + "\n")
+        for count, row in enumerate(rows, 1):
+            f.write(f"{count}. {row[-1]}\n")
+    return count
+
+
+def write_csv(rows, path):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+    return count
+
+
+def write_jsonl(rows, path):
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for count, row in enumerate(rows, 1):
+            f.write(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n")
+    return count
+
+
+def write_parquet(rows, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # input holds numbers and expression text alike, so it is stored as text
+    schema = pa.schema([(name, pa.float64() if name == "output" else pa.string())
+                        for name in COLUMNS])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        while True:
+            batch = list(islice(rows, PARQUET_BATCH))
+            if not batch:
+                break
+            columns = [list(column) for column in zip(*batch)]
+            columns[5] = [None if value is None else str(value) for value in columns[5]]
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema))
+            count += len(batch)
+    return count
+
+
+WRITERS = {".csv": write_csv, ".jsonl": write_jsonl, ".parquet": write_parquet}
+
+
+def export_history(journal_path, path, registry, title="Conversion History",
+                   progress=None, cancelled=None):
+    """Write the journal to path, return the number of rows written"""
+    writer = WRITERS.get(os.path.splitext(path)[1].lower())
+    if writer is write_parquet and not parquet_available():
+        raise ValueError("Parquet export needs pyarrow")
+    rows = history_rows(journal_path, registry, progress, cancelled)
+    tmp_path = path + ".part"
+    try:
+        count = writer(rows, tmp_path) if writer else write_text(rows, tmp_path, title)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if progress is not None:
+        progress(1.0)
+    return count
+
+
+class HistoryExport(Background):
+    """One history export on a worker thread; done is the fraction read"""
+
+    def __init__(self, journal_path, path, registry, title="Conversion History"):
+        self.journal_path = journal_path
+        self.path = path
+        self.registry = registry
+        self.title = title
+        self.done = 0.0
+        super().__init__(self._export, name="history-export")
+
+    def _export(self):
+        return export_history(self.journal_path, self.path, self.registry, self.title,
+                              self._progress, self.cancelled)
+
+    def _progress(self, done):
+        self.done = done
@@ -0,0 +1,129 @@
+"""Append-only journal of the conversion history.
+
+One JSON object per line (a HistoryRecord.as_dict(), see
+converter_history.py), appended as conversions happen. Appends are
+buffered and written by flush(), which the window calls from a timer
+and on exit, so a burst of conversions costs one write and one fsync.
+
+tail() reads blocks backwards from the end of the file until it has the
+requested number of lines, so startup does not parse the whole log. A
+line torn by a crash is skipped. When the file grows past max_bytes it
+is compacted on a worker thread: its last lines, at most keep of them
+and half of max_bytes, are copied as they are into a new file that
+replaces it in one atomic rename. Entries queued meanwhile are written
+by the first flush() after it.
+"""
+import json
+import os
+
+from converter_tasks import Background, atomic_write
+
+BLOCK_SIZE = 64 * 1024
+MAX_BYTES = 32 * 1024 * 1024
+KEEP = 100000
+
+
+class HistoryJournal:
+    """Buffered JSONL history file"""
+
+    def __init__(self, path, max_bytes=MAX_BYTES, keep=KEEP):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self._pending = []  # encoded lines not written yet
+        self._compaction = None  # Background compact() while it runs
+
+    def append(self, record):
+        """Queue one record (a JSON object) for the next flush()"""
+        self._pending.append(json.dumps(record, ensure_ascii=False) + "\n")
+
+    @property
+    def pending(self):
+        """Entries waiting for flush()"""
+        return len(self._pending)
+
+    def flush(self, wait=False):
+        """Write the queued entries, fsync, compact when the file is too big.
+
+        While a compaction runs the entries stay queued, unless wait is
+        set (on exit): then it is waited for, they are written and a
+        compaction they make due runs before flush() returns.
+        """
+        if not self._compacted(wait) or not self._pending:
+            return
+        data = "".join(self._pending).encode("utf-8")
+        with open(self.path, "a+b") as f:
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data  # end a line torn by a crash
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        self._pending.clear()
+        if size > self.max_bytes:
+            if wait:
+                self.compact()
+            else:
+                self._compaction = Background(self.compact, name="compact-history")
+
+    def _compacted(self, wait):
+        """Whether no compaction is running; raises the error of a failed one"""
+        if self._compaction is None:
+            return True
+        if not wait and self._compaction.poll() is None:
+            return False
+        compaction, self._compaction = self._compaction, None
+        compaction.result()
+        return True
+
+    def tail(self, count):
+        """The last count records, oldest first"""
+        if count <= 0 or not os.path.exists(self.path):
+            return []
+        with open(self.path, "rb") as f:
+            position = f.seek(0, os.SEEK_END)
+            blocks = []
+            newlines = 0
+            # count + 1 newlines: the first line of the data may be partial
+            while position > 0 and newlines <= count:
+                step = min(BLOCK_SIZE, position)
+                position -= step
+                f.seek(position)
+                blocks.append(f.read(step))
+                newlines += blocks[-1].count(b"\n")
+        lines = b"".join(reversed(blocks)).split(b"\n")
+        if position > 0:
+            lines = lines[1:]
+        records = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # empty or torn line
+            if isinstance(record, dict):
+                records.append(record)
+        return records[-count:]
+
+    def compact(self):
+        """Rewrite the file with its last lines, at most keep of them and
+        half of max_bytes"""
+        with open(self.path, "rb") as f:
+            position = max(f.seek(0, os.SEEK_END) - self.max_bytes // 2, 0)
+            f.seek(position)
+            data = f.read()
+        if position > 0:
+            cut = data.find(b"\n")  # the first line is cut
+            data = data[cut + 1:] if cut >= 0 else b""
+        excess = data.count(b"\n", 0, -1) + 1 - self.keep
+        if excess > 0:
+            data = data.split(b"\n", excess)[-1]
+        atomic_write(self.path, data)
+
+    def clear(self):
+        """Drop every entry, written or queued"""
+        self._compacted(True)
+        self._pending.clear()
+        if os.path.exists(self.path):
+            atomic_write(self.path, b"")
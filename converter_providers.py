@@ -0,0 +1,204 @@
+"""Pluggable sources of currency rates.
+
+Every provider returns a RateResponse whose data has the shape of the
+exchangerate-api.com response ({"result": "success",
+"conversion_rates": {"EUR": units per USD}, ...}), so the window does
+not care where the rates came from:
+
+* HttpProvider: any URL answering like the API, including the API itself
+* FileProvider: a JSON file, or the newest JSON file of a directory
+* StubServer: a local HTTP server for tests, used with an HttpProvider
+
+Extra providers are configured in converter_api.json:
+
+    "providers": [{"type": "file", "path": "rates/"},
+                  {"type": "http", "url": "http://127.0.0.1:8000/latest/USD"}]
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from converter_rates import DEFAULT_TIMEOUT, LatencyHistogram, RateClient, RateResponse
+
+
+class Provider:
+    """A source of rate tables"""
+
+    metered = False  # True when requests count against the monthly quota
+
+    def __init__(self, name):
+        self.name = name
+        self.latency = LatencyHistogram()
+        self.counted = 0  # of sent, already recorded against the quota
+
+    @property
+    def sent(self):
+        """Requests sent so far, for quota accounting"""
+        return 0
+
+    def fetch(self, validators=None, cancelled=None):
+        """Return a RateResponse, not_modified when validators still match"""
+        raise NotImplementedError
+
+    def timed_fetch(self, validators=None, cancelled=None):
+        """fetch(), recording its latency, failed fetches included"""
+        started = time.monotonic()
+        try:
+            return self.fetch(validators, cancelled)
+        finally:
+            self.latency.observe(time.monotonic() - started)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r})"
+
+
+class HttpProvider(Provider):
+    """Rates from a URL answering like the exchangerate-api.com API"""
+
+    def __init__(self, name, url, client=None, metered=False):
+        super().__init__(name)
+        self.url = url
+        self.client = client or RateClient()
+        self.metered = metered
+
+    @property
+    def sent(self):
+        return self.client.sent
+
+    def fetch(self, validators=None, cancelled=None):
+        return self.client.fetch(self.url, validators, cancelled)
+
+
+class FileProvider(Provider):
+    """Rates from a JSON file, or the newest JSON file of a directory.
+
+    The file may be an API response, the app's currency_rates.json or a
+    plain {"EUR": units per USD} object.
+    """
+
+    def __init__(self, name, path):
+        super().__init__(name)
+        self.path = path
+
+    def newest(self):
+        """Path of the file to read"""
+        if not os.path.isdir(self.path):
+            return self.path
+        files = [entry for entry in os.scandir(self.path)
+                 if entry.is_file() and entry.name.endswith(".json")]
+        if not files:
+            raise ValueError(f"No .json files in {self.path}")
+        return max(files, key=lambda entry: entry.stat().st_mtime_ns).path
+
+    def fetch(self, validators=None, cancelled=None):
+        path = self.newest()
+        stat = os.stat(path)
+        tag = f"{os.path.basename(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+        if validators and validators.get("etag") == tag:
+            return RateResponse(None, validators, not_modified=True)
+
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict) and "conversion_rates" not in data:
+            data = {"result": "success", "conversion_rates": data.get("rates", data)}
+        if isinstance(data, dict):
+            # Rates without a publication time are as old as their file
+            data.setdefault("time_last_update_unix", int(stat.st_mtime))
+        return RateResponse(data, {"etag": tag, "last_modified": None})
+
+
+class StubServer:
+    """Local HTTP server answering every GET with a fixed rates response.
+
+        with StubServer({"USD": 1.0, "EUR": 0.9}) as stub:
+            provider = HttpProvider("stub", stub.url)
+
+    delay (seconds) simulates a slow provider, status (e.g. 429) a failing
+    one. Responses carry an ETag and If-None-Match is answered with 304.
+    """
+
+    def __init__(self, rates, port=0, delay=0.0, status=200):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.delay = delay
+        self.status = status
+        self.requests = 0
+        self.set_rates(rates)
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                stub.requests += 1
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if stub.status != 200:
+                    self.send_response(stub.status)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                elif self.headers.get("If-None-Match") == stub.etag:
+                    self.send_response(304)
+                    self.send_header("ETag", stub.etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                else:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("ETag", stub.etag)
+                    self.send_header("Content-Length", str(len(stub.body)))
+                    self.end_headers()
+                    self.wfile.write(stub.body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    def set_rates(self, rates):
+        """Serve new rates from now on"""
+        self.body = json.dumps({"result": "success", "base_code": "USD",
+                                "time_last_update_unix": int(time.time()),
+                                "conversion_rates": rates}).encode("utf-8")
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/latest/USD"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def build_providers(config=(), api_url=None, client=None):
+    """The exchangerate-api.com provider (when api_url is given) followed by
+    the providers of the "providers" list of converter_api.json"""
+    providers = []
+    if api_url:
+        providers.append(HttpProvider("exchangerate-api", api_url, client, metered=True))
+    for entry in config:
+        kind = entry.get("type")
+        if kind == "file":
+            providers.append(FileProvider(entry.get("name", f"file:{entry['path']}"), entry["path"]))
+        elif kind == "http":
+            providers.append(HttpProvider(entry.get("name", f"http:{entry['url']}"), entry["url"],
+                                          RateClient(entry.get("timeout", DEFAULT_TIMEOUT))))
+        else:
+            raise ValueError(f"Unknown rate provider type: {kind}")
+    return providers
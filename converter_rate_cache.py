@@ -0,0 +1,148 @@
+"""Binary currency rate cache, memory-mapped at startup.
+
+Layout (little-endian):
+
+    header   magic b"CVRC", version u16, code width u16, count u32,
+             metadata length u32, last update i64 (unix time)
+    codes    count ISO codes, NUL-padded to the code width
+    padding  to a multiple of 8 bytes
+    rates    count float64, units per USD, indexed like the codes
+    metadata UTF-8 JSON (HTTP validators), only parsed when asked for
+
+Loading maps the file and reads the rates straight out of the mapping,
+nothing is parsed. Writes go to a temporary file that replaces the
+cache in one rename, so a crash never leaves a half-written cache.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime
+
+from converter_tasks import atomic_write
+
+MAGIC = b"CVRC"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIq")
+
+
+def write_rate_cache(path, rates, last_update, validators=None):
+    """Save a {"EUR": units per USD} table with its unix update time"""
+    codes = [code.encode("ascii") for code in rates]
+    width = max(map(len, codes), default=3)
+    table = b"".join(code.ljust(width, b"\0") for code in codes)
+    padding = -(HEADER.size + len(table)) % 8
+    values = array("d", (float(rate) for rate in rates.values()))
+    if sys.byteorder != "little":
+        values.byteswap()
+    meta = json.dumps({"validators": validators or {}}).encode("utf-8")
+    atomic_write(path, b"".join((
+        HEADER.pack(MAGIC, VERSION, width, len(codes), len(meta), int(last_update)),
+        table, b"\0" * padding, values.tobytes(), meta)))
+
+
+def is_rate_cache(path):
+    """Whether path starts with the binary cache magic"""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class RateCache:
+    """A rate cache file, memory-mapped read-only; use as a context manager"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, width, count, meta_length, self.last_update = \
+                HEADER.unpack_from(self._map)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} rate cache")
+            start = HEADER.size + width * count
+            start += -start % 8
+            self._meta = start + 8 * count
+            if len(self._map) != self._meta + meta_length:
+                raise ValueError(f"{path} is truncated")
+
+            table = self._map[HEADER.size:HEADER.size + width * count]
+            self.codes = [table[i:i + width].rstrip(b"\0").decode("ascii")
+                          for i in range(0, len(table), width)]
+            if sys.byteorder == "little":
+                self.rates = memoryview(self._map)[start:self._meta].cast("d")
+            else:
+                self.rates = array("d", self._map[start:self._meta])
+                self.rates.byteswap()
+        except Exception:
+            self._map.close()
+            raise
+
+    @property
+    def validators(self):
+        """HTTP validators saved with the rates, per provider"""
+        meta = json.loads(self._map[self._meta:].decode("utf-8") or "{}")
+        return meta.get("validators", {})
+
+    def as_dict(self):
+        """The {"EUR": units per USD} table"""
+        return dict(zip(self.codes, self.rates))
+
+    def close(self):
+        if isinstance(self.rates, memoryview):
+            self.rates.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LegacyRateCache:
+    """The rates of the old currency_rates.json, shaped like a RateCache"""
+
+    def __init__(self, path):
+        with open(path, "r") as f:
+            data = json.load(f)
+        self.codes = list(data["rates"])
+        self.rates = list(data["rates"].values())
+        self.last_update = int(datetime.strptime(data["last_update"], "%Y-%m-%d").timestamp())
+        # Validators were a single flat dict before there were several providers
+        self.validators = {name: validators for name, validators in data.get("validators", {}).items()
+                           if isinstance(validators, dict)}
+
+    def as_dict(self):
+        return dict(zip(self.codes, self.rates))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def load_rate_cache(path, legacy_path=None):
+    """Open the binary cache, falling back to the old JSON cache once.
+
+    Returns a RateCache or LegacyRateCache, None when neither file exists.
+    """
+    if os.path.exists(path):
+        return RateCache(path)
+    if legacy_path and os.path.exists(legacy_path):
+        return LegacyRateCache(legacy_path)
+    return None
+
+
+def read_rates(path, legacy_path=None):
+    """Return (rates, validators, last update datetime) of the saved cache,
+    None when there is none"""
+    cache = load_rate_cache(path, legacy_path)
+    if cache is None:
+        return None
+    with cache:
+        return cache.as_dict(), cache.validators, datetime.fromtimestamp(cache.last_update)
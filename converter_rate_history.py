@@ -0,0 +1,144 @@
+"""Append-only history of currency rate snapshots, for as-of conversions.
+
+Every fetched rate table is stored in SQLite as one snapshot row plus
+one row per currency. Snapshots are keyed by the time of the rates
+(the API's time_last_update_unix), so fetching the same rates twice
+stores them once. The UNIQUE index on that time makes the as-of lookup
+a single B-tree seek. For whole ledgers, cross_rates() loads the
+snapshot times once and bisects them for every date.
+
+As-of means the last snapshot at or before the given time; a date
+before the first snapshot raises ValueError, as no rates are known for
+it. A plain date stands for the end of that day.
+"""
+import sqlite3
+import time
+from bisect import bisect_right
+from datetime import date, datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    taken INTEGER NOT NULL UNIQUE  -- unix time of the rates
+);
+CREATE TABLE IF NOT EXISTS rates (
+    snapshot INTEGER NOT NULL REFERENCES snapshots(id),
+    code TEXT NOT NULL,
+    rate REAL NOT NULL,  -- units per USD
+    PRIMARY KEY (snapshot, code)
+) WITHOUT ROWID;
+"""
+
+
+def timestamp(value):
+    """Unix time of a datetime, date, ISO string or number"""
+    if isinstance(value, str):
+        value = value.strip()
+        value = date.fromisoformat(value) if len(value) == 10 else datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day, 23, 59, 59).timestamp()
+    return float(value)
+
+
+def before_first(as_of, first):
+    """The error for a time earlier than every snapshot"""
+    return ValueError(f"No currency rates saved for {as_of}, "
+                      f"the first are from {datetime.fromtimestamp(first):%Y-%m-%d}")
+
+
+class RateHistory:
+    """Date-indexed store of rate snapshots"""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = None  # opened on first use, so an unused store creates no file
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path)
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def add(self, rates, taken=None):
+        """Store a {"EUR": units per USD} table, return its snapshot ID.
+
+        taken is the unix time of the rates (default: now). A snapshot
+        with the same time is kept as it is.
+        """
+        taken = int(time.time() if taken is None else taken)
+        with self.db:
+            cursor = self.db.execute("INSERT OR IGNORE INTO snapshots (taken) VALUES (?)", (taken,))
+            if not cursor.rowcount:
+                return self.db.execute("SELECT id FROM snapshots WHERE taken = ?",
+                                       (taken,)).fetchone()[0]
+            snapshot = cursor.lastrowid
+            self.db.executemany("INSERT INTO rates (snapshot, code, rate) VALUES (?, ?, ?)",
+                                ((snapshot, code, float(rate)) for code, rate in rates.items()))
+        return snapshot
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+
+    def snapshot(self, as_of):
+        """Return (snapshot ID, unix time) of the snapshot in effect at as_of"""
+        row = self.db.execute("SELECT id, taken FROM snapshots WHERE taken <= ? "
+                              "ORDER BY taken DESC LIMIT 1", (timestamp(as_of),)).fetchone()
+        if row is None:
+            first = self.db.execute("SELECT MIN(taken) FROM snapshots").fetchone()[0]
+            if first is None:
+                raise ValueError("No saved currency rates")
+            raise before_first(as_of, first)
+        return row
+
+    def rates(self, as_of):
+        """Return the {"EUR": units per USD} table in effect at as_of"""
+        snapshot, _ = self.snapshot(as_of)
+        return dict(self.db.execute("SELECT code, rate FROM rates WHERE snapshot = ?", (snapshot,)))
+
+    def cross_rate(self, from_code, to_code, as_of):
+        """Multiplier from one currency to another at as_of"""
+        snapshot, taken = self.snapshot(as_of)
+        found = dict(self.db.execute("SELECT code, rate FROM rates WHERE snapshot = ? AND code IN (?, ?)",
+                                     (snapshot, from_code, to_code)))
+        for code in (from_code, to_code):
+            if code not in found:
+                raise ValueError(f"No rate for {code} on {datetime.fromtimestamp(taken):%Y-%m-%d}")
+        return found[to_code] / found[from_code]
+
+    def cross_rates(self, from_code, to_code, dates):
+        """Multipliers from one currency to another, one per date"""
+        snapshots = self.db.execute("SELECT id, taken FROM snapshots ORDER BY taken").fetchall()
+        if not snapshots:
+            raise ValueError("No saved currency rates")
+        times = [taken for _, taken in snapshots]
+
+        rates = {}  # (snapshot ID, code) -> rate
+        for snapshot, code, rate in self.db.execute(
+                "SELECT snapshot, code, rate FROM rates WHERE code IN (?, ?)", (from_code, to_code)):
+            rates[snapshot, code] = rate
+
+        result = []
+        cache = {}  # snapshot ID -> multiplier, ledgers repeat dates
+        for value in dates:
+            index = bisect_right(times, timestamp(value)) - 1
+            if index < 0:
+                raise before_first(value, times[0])
+            snapshot = snapshots[index][0]
+            factor = cache.get(snapshot)
+            if factor is None:
+                try:
+                    factor = rates[snapshot, to_code] / rates[snapshot, from_code]
+                except KeyError:
+                    day = datetime.fromtimestamp(times[index])
+                    raise ValueError(f"No rate for {from_code} -> {to_code} on {day:%Y-%m-%d}")
+                cache[snapshot] = factor
+            result.append(factor)
+        return result
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,425 @@
+"""Currency rate fetching that never blocks the Tk mainloop.
+
+RateClient keeps one pooled requests.Session, so repeated refreshes
+reuse the keep-alive connection. requests (with urllib3 and the ssl
+stack) is only imported when the first request is made, so starting
+the window does not pay for it. It revalidates with ETag and
+If-Modified-Since (a 304 carries no body and is not parsed), retries
+connection errors, 429 and 5xx with exponential backoff and full
+jitter, and gives up at a hard deadline. The base URL is a parameter,
+so the client works against a local stub server as well.
+
+RefreshScheduler decides when the next fetch is worth making: right
+after the provider publishes new rates (time_next_update_unix), but
+never faster than the monthly request quota allows. Its state is kept
+in a small JSON file, so it survives restarts.
+
+fetch_first() queries several rate providers (see converter_providers.py)
+concurrently and returns the first response that passes validation, so
+one slow or rate-limited provider does not set the refresh latency.
+Rates published more than MAX_AGE ago, or before the saved ones, are
+rejected, and a 304 only wins while the saved rates are that fresh, so
+a stale feed cannot keep answering for the API. Providers with a quota
+are a hedge: they are only asked when the free ones fail or are slow,
+and their requests are counted as they are sent, so the answer never
+waits for them. Every provider keeps a LatencyHistogram of its fetches.
+
+RateFetch runs one fetch on a daemon worker thread (a Background task
+from converter_tasks.py, also used to read the caches at startup). The
+window polls RateFetch.poll() from root.after() and applies the result
+on the Tk thread, so widgets are only ever touched from the mainloop.
+"""
+import json
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+from converter_tasks import Background
+
+DEFAULT_TIMEOUT = 10     # seconds per attempt
+DEFAULT_DEADLINE = 30    # seconds for all attempts and backoff together
+DEFAULT_RETRIES = 4
+BACKOFF_BASE = 0.5       # seconds, doubled on every retry
+BACKOFF_MAX = 8.0
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+MONTHLY_QUOTA = 1500     # requests, free tier of exchangerate-api.com
+MAX_AGE = 7 * 86400      # seconds, when the provider gives no next update time
+PUBLISH_GRACE = 300      # seconds after time_next_update_unix
+RETRY_INTERVAL = 3600    # seconds between attempts that brought nothing new
+HEDGE_DELAY = 2.0        # seconds the free providers get before a metered one is asked
+CANCEL_POLL = 0.2        # seconds between checks for a cancelled fetch
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds, upper bounds
+
+
+class RateFetchCancelled(Exception):
+    """Raised inside the worker when the fetch was cancelled"""
+
+
+class RateResponse:
+    """Result of a rate request"""
+
+    __slots__ = ("data", "validators", "not_modified", "provider")
+
+    def __init__(self, data, validators, not_modified=False):
+        self.data = data                  # decoded JSON, None on 304
+        self.validators = validators      # {"etag": ..., "last_modified": ...}
+        self.not_modified = not_modified  # True when the cached rates are current
+        self.provider = None              # name of the provider that answered
+
+
+class LatencyHistogram:
+    """Counts of fetch latencies per bucket"""
+
+    __slots__ = ("bounds", "counts", "total")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last bucket is slower than every bound
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.total += seconds
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, None when empty"""
+        count = len(self)
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for bound, bucket in zip(self.bounds + (float("inf"),), self.counts):
+            seen += bucket
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def __str__(self):
+        parts = [f"≤{bound:g}s: {count}" for bound, count in zip(self.bounds, self.counts) if count]
+        if self.counts[-1]:
+            parts.append(f">{self.bounds[-1]:g}s: {self.counts[-1]}")
+        return ", ".join(parts) or "no fetches"
+
+
+class RateClient:
+    """Pooled HTTP client for the rates API"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, deadline=DEFAULT_DEADLINE,
+                 retries=DEFAULT_RETRIES, session=None):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self._session = session  # created on first use
+        self.sent = 0  # requests sent, for quota accounting
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            # One host, one kept-alive connection is enough
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._session = session
+        return self._session
+
+    def backoff(self, attempt):
+        """Delay before retry number attempt (0-based): full jitter"""
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def fetch(self, url, validators=None, cancelled=None):
+        """GET url and return a RateResponse.
+
+        validators are those of the cached copy; when the server answers
+        304 the response has not_modified set and no data. cancelled is
+        an optional threading.Event that aborts the backoff waits.
+        """
+        import requests
+
+        validators = validators or {}
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+        stop = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            remaining = stop - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"No response within {self.deadline} s")
+            # Counted before it goes out: a request the server saw counts
+            # against the quota even when its answer never arrives
+            self.sent += 1
+            try:
+                response = self.session.get(url, headers=headers,
+                                            timeout=min(self.timeout, remaining))
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+                response = None
+
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                break
+            if attempt >= self.retries:
+                response.raise_for_status()
+
+            delay = self.backoff(attempt)
+            if response is not None and response.headers.get("Retry-After", "").isdigit():
+                delay = max(delay, float(response.headers["Retry-After"]))
+            if delay >= stop - time.monotonic():
+                raise TimeoutError(f"No response within {self.deadline} s")
+            if cancelled is not None:
+                if cancelled.wait(delay):
+                    raise RateFetchCancelled()
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+        if response.status_code == 304:
+            return RateResponse(None, validators, not_modified=True)
+        response.raise_for_status()
+        return RateResponse(response.json(), {
+            "etag": response.headers.get("ETag", validators.get("etag")),
+            "last_modified": response.headers.get("Last-Modified",
+                                                  validators.get("last_modified")),
+        })
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+
+def month_end(now):
+    """Unix time of the start of the next UTC month"""
+    day = datetime.fromtimestamp(now, timezone.utc)
+    if day.month == 12:
+        return datetime(day.year + 1, 1, 1, tzinfo=timezone.utc).timestamp()
+    return datetime(day.year, day.month + 1, 1, tzinfo=timezone.utc).timestamp()
+
+
+class RefreshScheduler:
+    """When to fetch rates next, within the monthly request quota"""
+
+    def __init__(self, path, quota=MONTHLY_QUOTA):
+        self.path = path
+        self.quota = quota
+        self.month = None          # "YYYY-MM" (UTC) the counter belongs to
+        self.used = 0              # requests sent this month
+        self.last_attempt = None   # unix times
+        self.last_success = None
+        self.next_update = None    # provider's time_next_update_unix
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.month = state.get("month")
+        self.used = state.get("used", 0)
+        self.last_attempt = state.get("last_attempt")
+        self.last_success = state.get("last_success")
+        self.next_update = state.get("next_update")
+
+    def save(self):
+        # Write a new file and swap it in, a crash never leaves half a file
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"month": self.month, "used": self.used,
+                       "last_attempt": self.last_attempt, "last_success": self.last_success,
+                       "next_update": self.next_update}, f)
+        os.replace(tmp_path, self.path)
+
+    def remaining(self, now=None):
+        """Requests left this month"""
+        now = time.time() if now is None else now
+        if self.month != time.strftime("%Y-%m", time.gmtime(now)):
+            return self.quota
+        return max(self.quota - self.used, 0)
+
+    def record(self, requests, success, next_update=None, now=None):
+        """Account for a finished fetch and persist the state.
+
+        requests is the number of HTTP requests it sent, next_update the
+        provider's time_next_update_unix when the response had one.
+        """
+        now = time.time() if now is None else now
+        month = time.strftime("%Y-%m", time.gmtime(now))
+        if month != self.month:
+            self.month, self.used = month, 0
+        self.used += requests
+        self.last_attempt = now
+        if success:
+            self.last_success = now
+            if next_update:
+                self.next_update = next_update
+        self.save()
+
+    def next_fetch(self, now=None):
+        """Unix time of the next fetch worth making"""
+        now = time.time() if now is None else now
+        if not self.remaining(now):
+            return month_end(now)
+        if self.last_success is None:
+            due = now if self.last_attempt is None else self.last_attempt + RETRY_INTERVAL
+        elif self.next_update and self.next_update > self.last_success:
+            # New rates are published at next_update, fetching earlier brings nothing
+            due = self.next_update + PUBLISH_GRACE
+        elif self.next_update:
+            # Past the announced time but nothing new yet
+            due = self.last_success + RETRY_INTERVAL
+        else:
+            due = self.last_success + MAX_AGE
+        if self.last_attempt is not None:
+            if self.last_success is None or self.last_attempt > self.last_success:
+                due = max(due, self.last_attempt + RETRY_INTERVAL)
+            # Spread what is left of the quota over the rest of the month
+            due = max(due, self.last_attempt + (month_end(now) - now) / self.remaining(now))
+        return max(due, now)
+
+    def is_due(self, now=None):
+        now = time.time() if now is None else now
+        return self.next_fetch(now) <= now
+
+
+def invalid_reason(data, newer_than=None, now=None):
+    """Why data is not a usable USD-based rates response, None when it is.
+
+    Rates published (time_last_update_unix) more than MAX_AGE ago, or
+    before newer_than, the publication time of the saved rates, are
+    rejected as well.
+    """
+    if not isinstance(data, dict):
+        return "not a JSON object"
+    if data.get("result", "success") != "success":
+        return data.get("error-type", "error response")
+    rates = data.get("conversion_rates")
+    if not isinstance(rates, dict) or not rates:
+        return "no conversion_rates"
+    for code, rate in rates.items():
+        if isinstance(rate, bool) or not isinstance(rate, (int, float)) or not rate > 0:
+            return f"bad rate for {code}: {rate!r}"
+    if abs(rates.get("USD", 1.0) - 1.0) > 1e-9:
+        return "rates are not based on USD"
+    published = data.get("time_last_update_unix")
+    if isinstance(published, (int, float)) and not isinstance(published, bool):
+        now = time.time() if now is None else now
+        if published < now - MAX_AGE:
+            return f"rates of {datetime.fromtimestamp(published):%Y-%m-%d} are out of date"
+        if newer_than and published < newer_than:
+            return "rates are older than the saved ones"
+    return None
+
+
+def fetch_first(providers, validators=None, cancelled=None, hedge=HEDGE_DELAY):
+    """Query providers concurrently, return the first valid RateResponse.
+
+    validators maps provider names to the validators of their last
+    response, including "published", the time_last_update_unix of the
+    rates they came with. A 304 counts as valid while the saved rates
+    are fresh, see invalid_reason(). Metered providers (with a request
+    quota) are only asked when no free provider has given usable rates
+    within hedge seconds, or every free one failed. Providers still
+    running when an answer is returned send no more retries. Raises
+    ValueError listing every provider's failure when none of them gives
+    usable rates, RateFetchCancelled when cancelled is set.
+    """
+    if not providers:
+        raise ValueError("No rate providers configured")
+    validators = validators or {}
+    # The saved rates are the newest any provider has given
+    published = max((entry.get("published") or 0 for entry in validators.values()), default=0)
+    errors = []
+    futures = {}
+    held = [provider for provider in providers if provider.metered]  # asked last
+    stop = threading.Event()  # set on return: the providers still running stop retrying
+    pool = ThreadPoolExecutor(max_workers=len(providers), thread_name_prefix="rate-provider")
+
+    def submit(provider):
+        future = pool.submit(provider.timed_fetch, validators.get(provider.name), stop)
+        futures[future] = provider
+        return future
+
+    try:
+        pending = {submit(provider) for provider in providers if not provider.metered}
+        hedge_at = time.monotonic() + hedge
+        while pending or held:
+            if cancelled is not None and cancelled.is_set():
+                raise RateFetchCancelled()
+            if held and (not pending or time.monotonic() >= hedge_at):
+                # The free providers failed or are slow: ask the metered ones
+                pending.update(submit(provider) for provider in held)
+                held = []
+                continue
+            timeout = max(hedge_at - time.monotonic(), 0) if held else None
+            if cancelled is not None:
+                timeout = CANCEL_POLL if timeout is None else min(timeout, CANCEL_POLL)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = futures[future]
+                try:
+                    response = future.result()
+                except Exception as e:
+                    errors.append(f"{provider.name}: {e}")
+                    continue
+                if not response.not_modified:
+                    reason = invalid_reason(response.data, published)
+                elif published and published < time.time() - MAX_AGE:
+                    reason = "unchanged, and the saved rates are out of date"
+                else:
+                    reason = None
+                if reason is None:
+                    response.provider = provider.name
+                    if not response.not_modified:
+                        response.validators = dict(response.validators,
+                                                   published=response.data.get("time_last_update_unix"))
+                    return response
+                errors.append(f"{provider.name}: {reason}")
+    finally:
+        # The slower providers finish their request in the background and only
+        # record its latency; RateFetch.count_sent() counts it when it was metered
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    raise ValueError("; ".join(errors))
+
+
+class RateFetch(Background):
+    """One background fetch from the rate providers"""
+
+    def __init__(self, providers, validators=None, hedge=HEDGE_DELAY):
+        self.providers = providers
+        self.validators = validators
+        self.hedge = hedge
+        super().__init__(self._fetch, name="rate-fetch")
+
+    def _fetch(self):
+        return fetch_first(self.providers, self.validators, self.cancelled, self.hedge)
+
+    def count_sent(self):
+        """Requests sent to providers with a quota and not counted yet.
+
+        A request that was still under way when an earlier fetch was
+        counted is counted by the next one, so none is missed.
+        """
+        sent = 0
+        for provider in self.providers:
+            if provider.metered:
+                total = provider.sent
+                sent += total - provider.counted
+                provider.counted = total
+        return sent
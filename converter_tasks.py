@@ -0,0 +1,67 @@
+"""Small helpers shared by the rate and history modules.
+
+Background runs one function on a daemon thread for the Tk window,
+which polls it from root.after() instead of blocking the mainloop.
+atomic_write replaces a file in one rename, so a crash never leaves
+it half-written.
+"""
+import os
+import queue
+import threading
+
+
+class Background:
+    """Runs function(*args) on a daemon thread.
+
+    The Tk thread polls with poll() from root.after(), so it never
+    blocks; result() waits and returns the value or raises the error.
+    """
+
+    def __init__(self, function, *args, name="background"):
+        self.cancelled = threading.Event()
+        self._outcome = None
+        self._result = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._run, args=(function, args),
+                                        name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self, function, args):
+        """Worker thread: never touch Tk"""
+        try:
+            result = (function(*args), None)
+        except Exception as e:
+            result = (None, e)
+        if not self.cancelled.is_set():
+            self._result.put(result)
+
+    def cancel(self):
+        """Drop the result; work in progress runs to its end"""
+        self.cancelled.set()
+
+    def poll(self):
+        """Return (result, error) once the function is done, else None"""
+        if self._outcome is None:
+            try:
+                self._outcome = self._result.get_nowait()
+            except queue.Empty:
+                return None
+        return self._outcome
+
+    def result(self, timeout=None):
+        """Wait for the function, return its result or raise its error"""
+        if self._outcome is None:
+            self._outcome = self._result.get(timeout=timeout)
+        result, error = self._outcome
+        if error is not None:
+            raise error
+        return result
+
+
+def atomic_write(path, data):
+    """Write bytes to a temporary file, then rename it over path"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
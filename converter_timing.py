@@ -0,0 +1,33 @@
+"""Wall-clock timing of the startup phases, printed with --timing.
+
+    python universal_converter_EN.py --timing
+
+Each mark() closes the phase that started at the previous mark (or at
+the time the timer was created with), so the phases add up to the
+whole startup.
+"""
+import sys
+import time
+
+
+class PhaseTimer:
+    """Durations of named, consecutive startup phases"""
+
+    def __init__(self, start=None):
+        self.last = time.perf_counter() if start is None else start
+        self.phases = []  # (name, seconds)
+
+    def mark(self, name):
+        """End the current phase and record it under name"""
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def report(self, file=None):
+        """Print one line per phase and the total"""
+        file = file or sys.stderr
+        width = max((len(name) for name, _ in self.phases), default=5)
+        for name, seconds in self.phases:
+            print(f"{name:<{width}}  {seconds * 1000:8.1f} ms", file=file)
+        total = sum(seconds for _, seconds in self.phases)
+        print(f"{'total':<{width}}  {total * 1000:8.1f} ms", file=file)
@@ -0,0 +1,321 @@
+"""Language-neutral unit registry.
+
+Every unit has a canonical ID such as "mass.kg" and is found through a
+hashed alias index: symbols ("kg", "°C"), English names ("kilogram")
+and the display labels of whichever language file is in use
+("Kilogram (kg)", "Килограмм (кг)"). All lookups are dict hits.
+
+Units are small __slots__ records holding an affine map to the base unit
+of their category (base = value * scale + offset). Each Category also
+keeps the scales and offsets of its units in contiguous float arrays,
+indexed by Unit.index, for vectorized code.
+"""
+from array import array
+from fractions import Fraction
+
+# (category id, English name, [(symbol, scale, aliases[, offset])])
+UNIT_DEFINITIONS = [
+    ("mass", "Mass", [
+        ("kg", 1.0, ("kilogram", "kilograms")),
+        ("g", 0.001, ("gram", "grams")),
+        ("mg", 1e-6, ("milligram", "milligrams")),
+        ("t", 1000.0, ("tonne", "tonnes", "ton")),
+        ("lb", 0.453592, ("pound", "pounds", "lbs")),
+        ("oz", 0.0283495, ("ounce", "ounces")),
+        ("ct", 0.0002, ("carat", "carats")),
+    ]),
+    ("length", "Length", [
+        ("m", 1.0, ("meter", "metre", "meters")),
+        ("km", 1000.0, ("kilometer", "kilometre", "kilometers")),
+        ("cm", 0.01, ("centimeter", "centimetre", "centimeters")),
+        ("mm", 0.001, ("millimeter", "millimetre", "millimeters")),
+        ("um", 1e-6, ("µm", "micrometer", "micrometre", "micron")),
+        ("in", 0.0254, ("inch", "inches", "\"")),
+        ("ft", 0.3048, ("foot", "feet", "'")),
+        ("yd", 0.9144, ("yard", "yards")),
+        ("mi", 1609.34, ("mile", "miles")),
+        ("nmi", 1852.0, ("nautical mile", "nautical miles")),
+    ]),
+    ("volume", "Volume", [
+        ("L", 1.0, ("liter", "litre", "liters", "l")),
+        ("mL", 0.001, ("milliliter", "millilitre", "milliliters", "ml")),
+        ("gal", 3.78541, ("gallon", "gallons")),
+        ("pt", 0.473176, ("pint", "pints")),
+        ("m3", 1000.0, ("m³", "cubic meter", "cubic metre")),
+        ("in3", 0.0163871, ("in³", "cubic inch")),
+        ("tsp", 0.00492892, ("teaspoon", "teaspoons")),
+        ("tbsp", 0.0147868, ("tablespoon", "tablespoons")),
+        ("cup", 0.236588, ("cups",)),
+    ]),
+    ("temperature", "Temperature", [
+        # Exact fractions, so Celsius -> Fahrenheit composes to exactly 1.8 and 32
+        ("C", Fraction(1), ("°C", "celsius", "degC"), Fraction("273.15")),
+        ("F", Fraction(5, 9), ("°F", "fahrenheit", "degF"), Fraction("273.15") - Fraction(160, 9)),
+        ("K", Fraction(1), ("kelvin",), Fraction(0)),
+    ]),
+    ("area", "Area", [
+        ("m2", 1.0, ("m²", "square meter", "square metre")),
+        ("km2", 1e6, ("km²", "square kilometer", "square kilometre")),
+        ("cm2", 0.0001, ("cm²", "square centimeter", "square centimetre")),
+        ("ha", 10000.0, ("hectare", "hectares")),
+        ("ac", 4046.86, ("acre", "acres")),
+        ("mi2", 2.59e6, ("mi²", "square mile")),
+        ("ft2", 0.092903, ("ft²", "square foot", "square feet")),
+    ]),
+    ("speed", "Speed", [
+        ("m/s", 1.0, ("mps",)),
+        ("km/h", 0.277778, ("kph", "kmh")),
+        ("mph", 0.44704, ("mi/h",)),
+        ("knots", 0.514444, ("knot", "kn", "kt")),
+        ("Mach", 343.0, ("mach",)),
+    ]),
+    ("data", "Data", [
+        ("bit", 1.0, ("bits",)),
+        ("B", 8.0, ("byte", "bytes")),
+        ("KB", 8192.0, ("kilobyte", "kilobytes")),
+        ("MB", 8388608.0, ("megabyte", "megabytes")),
+        ("GB", 8589934592.0, ("gigabyte", "gigabytes")),
+        ("TB", 8796093022208.0, ("terabyte", "terabytes")),
+    ]),
+    ("energy", "Energy", [
+        ("J", 1.0, ("joule", "joules")),
+        ("kJ", 1000.0, ("kilojoule", "kilojoules")),
+        ("cal", 4.184, ("calorie", "calories")),
+        ("kcal", 4184.0, ("kilocalorie", "kilocalories")),
+        ("kWh", 3600000.0, ("kilowatt hour", "kilowatt-hour")),
+        ("eV", 1.60218e-19, ("electronvolt", "electronvolts")),
+    ]),
+    ("pressure", "Pressure", [
+        ("Pa", 1.0, ("pascal", "pascals")),
+        ("bar", 100000.0, ("bars",)),
+        ("atm", 101325.0, ("atmosphere", "atmospheres")),
+        ("mmHg", 133.322, ("torr",)),
+        ("psi", 6894.76, ("PSI",)),
+    ]),
+    ("time", "Time", [
+        ("s", 1.0, ("second", "seconds", "sec")),
+        ("min", 60.0, ("minute", "minutes")),
+        ("h", 3600.0, ("hour", "hours", "hr")),
+        ("day", 86400.0, ("days", "d")),
+        ("week", 604800.0, ("weeks", "wk")),
+        ("year", 31536000.0, ("years", "yr")),
+    ]),
+    ("radiation", "Radiation", [
+        ("Sv", 1.0, ("sievert", "sieverts")),
+        ("rem", 0.01, ("rems",)),
+        ("rad", 0.01, ("rads",)),
+        ("Gy", 1.0, ("gray", "grays")),
+        ("R", 0.00933, ("roentgen", "roentgens")),
+    ]),
+    ("astronomy", "Astronomy", [
+        ("ly", 1.0, ("light year", "light years")),
+        ("AU", 63241.1, ("au", "astronomical unit")),
+        ("pc", 3.26156, ("parsec", "parsecs")),
+        ("km", 9.461e12, ("kilometer", "kilometre")),
+        ("LD", 384400.0, ("lunar distance",)),
+    ]),
+    ("cooking", "Cooking", [
+        ("g", 1.0, ("gram", "grams")),
+        ("kg", 1000.0, ("kilogram", "kilograms")),
+        ("oz", 28.3495, ("ounce", "ounces")),
+        ("lb", 453.592, ("pound", "pounds")),
+        ("tsp", 5.0, ("teaspoon", "teaspoons")),
+        ("tbsp", 15.0, ("tablespoon", "tablespoons")),
+        ("cup", 240.0, ("cups",)),
+        ("mL", 1.0, ("milliliter", "millilitre", "ml")),
+        ("L", 1000.0, ("liter", "litre", "l")),
+    ]),
+    ("angles", "Angles", [
+        ("deg", 1.0, ("°", "degree", "degrees")),
+        ("rad", 57.2958, ("radian", "radians")),
+        ("grad", 0.9, ("gradian", "gradians", "gon")),
+        ("rev", 360.0, ("revolution", "revolutions", "turn")),
+    ]),
+]
+
+
+class Unit:
+    """A unit: base = value * scale + offset"""
+
+    __slots__ = ("id", "category", "index", "scale", "offset")
+
+    def __init__(self, id, category, index, scale, offset=0.0):
+        self.id = id              # canonical ID and display-name key, e.g. "mass.kg"
+        self.category = category  # Category object
+        self.index = index        # position in the category arrays
+        self.scale = scale
+        self.offset = offset
+
+    @property
+    def label(self):
+        """Display label of the active language"""
+        return self.category.labels[self.index]
+
+    def __repr__(self):
+        return f"Unit({self.id!r})"
+
+
+class Category:
+    """A category of mutually convertible units"""
+
+    __slots__ = ("id", "label", "units", "scales", "offsets", "labels",
+                 "aliases", "folded", "fixed")
+
+    def __init__(self, id, label, fixed=True):
+        self.id = id
+        self.label = label
+        self.units = []
+        self.scales = array("d")
+        self.offsets = array("d")
+        self.labels = []
+        self.aliases = {}   # exact alias -> Unit
+        self.folded = {}    # casefolded alias -> Unit, None when ambiguous
+        self.fixed = fixed  # False when factors change at runtime (currencies)
+
+    def add(self, symbol, scale, offset=0.0):
+        """Append a unit, return it"""
+        unit = Unit(f"{self.id}.{symbol}", self, len(self.units), scale, offset)
+        self.units.append(unit)
+        self.scales.append(float(scale))
+        self.offsets.append(float(offset))
+        self.labels.append(symbol)
+        self.alias(unit, symbol)
+        self.alias(unit, unit.id)
+        return unit
+
+    def alias(self, unit, name):
+        """Make name resolve to unit within this category"""
+        self.aliases.setdefault(name, unit)
+        key = name.casefold()
+        if self.folded.get(key, unit) is not unit:
+            self.folded[key] = None  # ambiguous ignoring case, exact match only
+        else:
+            self.folded[key] = unit
+
+    def get(self, name):
+        """Find a unit by any alias, or None"""
+        unit = self.aliases.get(name)
+        if unit is None:
+            unit = self.folded.get(name.strip().casefold())
+        return unit
+
+    def __repr__(self):
+        return f"Category({self.id!r})"
+
+
+class UnitRegistry:
+    """Categories and units indexed by canonical ID and by alias"""
+
+    def __init__(self, definitions=UNIT_DEFINITIONS):
+        self.categories = {}  # canonical ID -> Category
+        self.units = {}       # canonical ID -> Unit
+        self._category_aliases = {}
+
+        for category_id, name, units in definitions:
+            category = self.add_category(category_id, name)
+            for symbol, scale, aliases, *offset in units:
+                unit = category.add(symbol, scale, *offset)
+                self.units[unit.id] = unit
+                for alias in aliases:
+                    category.alias(unit, alias)
+
+    def add_category(self, id, name, fixed=True):
+        """Create an empty category, return it"""
+        category = Category(id, name, fixed)
+        self.categories[id] = category
+        self.alias_category(category, id)
+        self.alias_category(category, name)
+        return category
+
+    def alias_category(self, category, name):
+        """Make name resolve to category"""
+        self._category_aliases.setdefault(name, category)
+        self._category_aliases.setdefault(name.casefold(), category)
+
+    def category(self, name):
+        """Find a category by ID, English name or display label"""
+        if isinstance(name, Category):
+            return name
+        category = self._category_aliases.get(name)
+        if category is None:
+            category = self._category_aliases.get(name.strip().casefold())
+        if category is None:
+            raise ValueError(f"Unknown category: {name}")
+        return category
+
+    def category_labels(self):
+        """Display labels of the categories with fixed factors"""
+        return [category.label for category in self.categories.values() if category.fixed]
+
+    def get(self, name, category):
+        """Find a unit of a category by any alias, or None"""
+        return self.category(category).get(name)
+
+    def resolve(self, name, category):
+        """Find a unit of a category by any alias"""
+        unit = self.get(name, category)
+        if unit is None:
+            raise ValueError(f"Unknown unit: {name}")
+        return unit
+
+    def add_labels(self, labels):
+        """Register display labels keyed by category or unit ID,
+        as returned by UniversalConverter.load_units()"""
+        for key, label in labels.items():
+            if key in self.categories or key == "currency":
+                category = self.currency() if key == "currency" else self.categories[key]
+                category.label = label
+                self.alias_category(category, label)
+            elif key in self.units:
+                unit = self.units[key]
+                unit.category.labels[unit.index] = label
+                unit.category.alias(unit, label)
+            else:
+                raise ValueError(f"Unknown unit ID: {key}")
+
+    def add_currencies(self, currency_units):
+        """Register currencies from a {"USD (US Dollar)": units per USD} table,
+        as returned by UniversalConverter.load_currency_units()"""
+        category = self.currency()
+        for label, rate in currency_units.items():
+            code = label.split(" ", 1)[0]
+            unit = self._currency_unit(category, code)
+            category.labels[unit.index] = label
+            category.alias(unit, label)
+            self._set_rate(category, unit, rate)
+        return category
+
+    def set_rates(self, rates):
+        """Store a {"EUR": units per USD} table, as returned by the rates API.
+
+        Codes without a display label are added with the code as label.
+        Rates live in the scales array of the currency category (the
+        value of one unit in USD), so a lookup stays a dict hit and an
+        array read however many currencies there are.
+        """
+        category = self.currency()
+        for code, rate in rates.items():
+            self._set_rate(category, self._currency_unit(category, code), rate)
+        return category
+
+    def currency(self):
+        """The currency category, created on first use"""
+        category = self.categories.get("currency")
+        if category is None:
+            category = self.add_category("currency", "Currency", fixed=False)
+        return category
+
+    def _currency_unit(self, category, code):
+        """Find or add the unit of a currency code"""
+        unit = category.aliases.get(code)
+        if unit is None:
+            unit = category.add(code, float("nan"))
+            self.units[unit.id] = unit
+        return unit
+
+    @staticmethod
+    def _set_rate(category, unit, rate):
+        """Store units per USD as the scale of a currency"""
+        if rate and rate > 0:
+            unit.scale = 1.0 / rate
+            category.scales[unit.index] = unit.scale
@@ -0,0 +1,94 @@
+"""Tk widgets shared by the language scripts.
+
+VirtualList shows a window of a large row source in a ttk.Treeview that
+only ever holds the rows that fit on screen. Scrolling rewrites the
+values of those few items instead of inserting or deleting rows, so the
+widget costs the same for 20 rows as for 100000.
+"""
+import tkinter as tk
+from tkinter import ttk
+
+ROW_HEIGHT = 20  # pixels, when the Treeview style does not set rowheight
+WHEEL_ROWS = 3
+
+
+class VirtualList(ttk.Frame):
+    """Treeview over count() rows; row(index) returns the values of a row"""
+
+    def __init__(self, master, columns, count, row, **kwargs):
+        super().__init__(master, **kwargs)
+        self.count = count
+        self.row = row
+        self.offset = 0  # source index of the top row
+        self.rows = 1    # rows that fit, set when the widget is laid out
+
+        ids = [f"c{i}" for i in range(len(columns))]
+        self.tree = ttk.Treeview(self, columns=ids, show="headings", selectmode="browse")
+        for column, (heading, width) in zip(ids, columns):
+            self.tree.heading(column, text=heading, anchor=tk.W)
+            self.tree.column(column, width=width, anchor=tk.W, stretch=column == ids[-1])
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.tree.bind("<Configure>", self._resize)
+        self.tree.bind("<MouseWheel>", self._wheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-WHEEL_ROWS))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(WHEEL_ROWS))
+        self.tree.bind("<Prior>", lambda event: self.scroll(-self.rows))
+        self.tree.bind("<Next>", lambda event: self.scroll(self.rows))
+
+    def _resize(self, event):
+        height = int(ttk.Style(self).lookup("Treeview", "rowheight") or ROW_HEIGHT)
+        rows = max(1, event.height // height - 1)  # one row's height goes to the headings
+        if rows != self.rows:
+            self.rows = rows
+            self.refresh()
+
+    def _wheel(self, event):
+        self.scroll(-WHEEL_ROWS if event.delta > 0 else WHEEL_ROWS)
+        return "break"
+
+    def scroll(self, rows):
+        """Move the window by rows (negative: up)"""
+        self.show(self.offset + rows)
+        return "break"
+
+    def yview(self, *args):
+        """Scrollbar command"""
+        if args[0] == tk.MOVETO:
+            self.show(int(float(args[1]) * self.count()))
+        elif args[0] == tk.SCROLL:
+            amount = int(args[1])
+            self.show(self.offset + (amount * self.rows if args[2] == tk.PAGES else amount))
+
+    def show(self, offset):
+        """Scroll so that row offset is at the top"""
+        self.offset = offset
+        self.tree.selection_set(())  # the selection belongs to an item, not a row
+        self.refresh()
+
+    def inserted(self, rows=1):
+        """Rows were added at the top; keep a scrolled view where it was"""
+        if self.offset:
+            self.offset += rows
+        self.refresh()
+
+    def refresh(self):
+        """Redraw the visible rows after the source changed"""
+        total = self.count()
+        self.offset = max(0, min(self.offset, total - self.rows))
+        visible = min(self.rows, total - self.offset)
+        items = self.tree.get_children()
+        for item in items[visible:]:
+            self.tree.delete(item)
+        for i in range(visible):
+            values = self.row(self.offset + i)
+            if i < len(items):
+                self.tree.item(items[i], values=values)
+            else:
+                self.tree.insert("", tk.END, values=values)
+        if total:
+            self.scrollbar.set(self.offset / total, (self.offset + visible) / total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
@@ -0,0 +1,83 @@
+"""Sharded batch conversion and the checks of the command line."""
+import io
+import json
+
+import numpy as np
+import pytest
+
+import converter_batch
+from converter_batch import convert_csv, convert_parallel, main
+
+
+@pytest.fixture
+def small_shards(monkeypatch):
+    # Shards of a few hundred bytes, so a small file is split many times
+    monkeypatch.setattr(converter_batch, "MIN_SHARD_BYTES", 256)
+
+
+def serial_csv(path, target=None):
+    out = io.StringIO()
+    with open(path, encoding="utf-8", newline="") as source:
+        convert_csv(source, out, "mass", 1000.0, 0.0, target)
+    return out.getvalue()
+
+
+def test_parallel_csv_matches_serial(tmp_path, small_shards):
+    path = tmp_path / "in.csv"
+    path.write_text("id,mass\n" + "".join(f"{i},{i / 7}\n" for i in range(2000)),
+                    encoding="utf-8")
+    out = tmp_path / "out.csv"
+    count = convert_parallel(str(path), str(out), None, "mass", "kg", "g",
+                             "csv", "mass", "grams", workers=3)
+    assert count == 2000
+    assert out.read_text(encoding="utf-8") == serial_csv(path, "grams")
+    # The temporary shard directory is gone
+    assert sorted(entry.name for entry in tmp_path.iterdir()) == ["in.csv", "out.csv"]
+
+
+def test_parallel_csv_keeps_multiline_fields(tmp_path, small_shards):
+    path = tmp_path / "in.csv"
+    path.write_text('id,note,mass\n' + "".join(
+        f'{i},"note, ""{i}""\nline {i}\n",{i}\n' for i in range(500)), encoding="utf-8")
+    out = tmp_path / "out.csv"
+    assert convert_parallel(str(path), str(out), None, "mass", "kg", "g",
+                            "csv", "mass", workers=3) == 500
+    assert out.read_text(encoding="utf-8") == serial_csv(path)
+
+
+def test_parallel_jsonl_keeps_row_order(tmp_path, small_shards):
+    path = tmp_path / "in.jsonl"
+    path.write_text("".join(json.dumps({"id": i, "mass": i}) + "\n" for i in range(2000)),
+                    encoding="utf-8")
+    out = tmp_path / "out.jsonl"
+    assert convert_parallel(str(path), str(out), None, "mass", "kg", "g",
+                            "jsonl", "mass", workers=3) == 2000
+    rows = [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+    assert [row["id"] for row in rows] == list(range(2000))
+    assert [row["mass"] for row in rows] == [i * 1000.0 for i in range(2000)]
+
+
+def test_parallel_binary_in_place(tmp_path, small_shards):
+    path = tmp_path / "values.f64"
+    values = np.arange(5000, dtype="<f8")
+    values.tofile(path)
+    assert convert_parallel(str(path), None, None, "temperature", "°C", "°F",
+                            dtype="float64", workers=3) == 5000
+    assert np.allclose(np.fromfile(path, dtype="<f8"), values * 1.8 + 32)
+
+
+def test_in_place_needs_binary(tmp_path):
+    path = tmp_path / "in.csv"
+    path.write_text("mass\n1\n", encoding="utf-8")
+    with pytest.raises(SystemExit):
+        main([str(path), "--in-place", "-j", "2", "-c", "mass",
+              "--category", "mass", "--from", "kg", "--to", "g"])
+
+
+def test_output_must_not_be_the_input(tmp_path):
+    path = tmp_path / "in.csv"
+    path.write_text("mass\n1\n", encoding="utf-8")
+    with pytest.raises(SystemExit):
+        main([str(path), "-o", str(path), "-c", "mass",
+              "--category", "mass", "--from", "kg", "--to", "g"])
+    assert path.read_text(encoding="utf-8") == "mass\n1\n"
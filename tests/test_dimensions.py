@@ -0,0 +1,70 @@
+"""Dimensional analysis of compound units."""
+import pytest
+
+from converter_dimensions import format_dimension
+from converter_engine import ConversionEngine
+
+
+@pytest.fixture(scope="module")
+def dimensions():
+    return ConversionEngine().dimensions
+
+
+@pytest.mark.parametrize("text, factor, dims", [
+    ("kWh/100km", 36.0, (1, 1, -2)),
+    ("100km", 100000.0, (0, 1, 0)),
+    ("s^-2", 1.0, (0, 0, -2)),
+    ("s**-2", 1.0, (0, 0, -2)),
+    ("m·s^-2", 1.0, (0, 1, -2)),
+    ("s⁻¹", 1.0, (0, 0, -1)),
+    ("cm³", 1e-6, (0, 3, 0)),
+    ("cm3", 1e-6, (0, 3, 0)),
+    ("g/cm³", 1000.0, (1, -3, 0)),
+    ("Pa·s", 1.0, (1, -1, -1)),
+])
+def test_parse(dimensions, text, factor, dims):
+    parsed = dimensions.parse(text)
+    assert parsed[0] == pytest.approx(factor)
+    assert parsed[1] == dims
+
+
+def test_everything_after_a_slash_divides(dimensions):
+    assert dimensions.parse("J/kg·s")[1] == dimensions.parse("J/(kg·s)")[1] == (0, 2, -3)
+    # A negative power in the denominator multiplies
+    assert dimensions.parse("m/s^-2")[1] == (0, 1, 2)
+
+
+@pytest.mark.parametrize("source, target, expected", [
+    ("km/h", "m/s", 1 / 3.6),
+    ("kWh/100km", "kWh/km", 0.01),
+    ("kg/m3", "g/cm³", 0.001),
+    ("m·s^-2", "km·h^-2", 12960.0),
+    ("L", "cm³", 1000.0),
+])
+def test_factor(dimensions, source, target, expected):
+    assert dimensions.factor(source, target) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("source, target, message", [
+    ("km/h", "kg", "km/h is L T^-1, kg is M"),
+    ("J", "Pa", "J is M L^2 T^-2, Pa is M L^-1 T^-2"),
+    ("m/s^-2", "m·s^-2", "m/s^-2 is L T^2"),
+])
+def test_mismatched_dimensions(dimensions, source, target, message):
+    with pytest.raises(ValueError, match="Incompatible units: " + message.replace("^", r"\^")):
+        dimensions.factor(source, target)
+
+
+@pytest.mark.parametrize("text, message", [
+    ("furlong/h", "Unknown unit: furlong"),
+    ("^2", "Power without a unit"),
+    ("", "Empty unit expression"),
+])
+def test_parse_errors(dimensions, text, message):
+    with pytest.raises(ValueError, match=message):
+        dimensions.parse(text)
+
+
+def test_format_dimension():
+    assert format_dimension((1, -1, -2)) == "M L^-1 T^-2"
+    assert format_dimension((0, 0, 0)) == "dimensionless"
@@ -0,0 +1,53 @@
+"""Vectorized conversion of arrays and buffers."""
+import array
+
+import numpy as np
+import pytest
+
+from converter_engine import ConversionEngine
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return ConversionEngine()
+
+
+def test_bytes_and_bytearray_hold_packed_values(engine):
+    data = np.array([1.0, 2.5]).tobytes()
+    for buffer in (data, bytearray(data)):
+        assert engine.convert_many(buffer, "mass", "kg", "g").tolist() == [1000.0, 2500.0]
+
+
+def test_dtype_of_a_buffer(engine):
+    values = array.array("f", [1.0, 2.0])
+    result = engine.convert_many(values, "mass", "kg", "g", dtype="float32")
+    assert result.dtype == np.float32
+    assert result.tolist() == [1000.0, 2000.0]
+
+
+def test_buffer_converted_in_place(engine):
+    values = array.array("d", [0.0, 100.0])
+    engine.convert_many(values, "temperature", "°C", "°F", out=values)
+    assert values.tolist() == pytest.approx([32.0, 212.0])
+
+
+def test_integer_array_is_converted_as_floats(engine):
+    assert engine.convert_many(np.arange(3), "mass", "kg", "g").tolist() == [0.0, 1000.0, 2000.0]
+
+
+@pytest.mark.parametrize("typecode", ["f", "d", "i", "h", "q"])
+def test_typed_buffer_keeps_its_item_type(engine, typecode):
+    # dtype only applies to untyped bytes
+    values = array.array(typecode, [1, 2])
+    assert engine.convert_many(values, "mass", "kg", "g").tolist() == [1000.0, 2000.0]
+
+
+def test_typed_buffer_as_out(engine):
+    values = array.array("f", [0.0, 100.0])
+    engine.convert_many(values, "temperature", "°C", "°F", out=values)
+    assert values.tolist() == pytest.approx([32.0, 212.0])
+
+
+def test_memoryview_of_bytes_uses_dtype(engine):
+    data = memoryview(np.array([1.5], dtype="<f4").tobytes())
+    assert engine.convert_many(data, "mass", "kg", "g", dtype="<f4").tolist() == [1500.0]
@@ -0,0 +1,72 @@
+"""Parsing and evaluation of conversion expressions."""
+import pytest
+
+from converter_engine import ConversionEngine
+from converter_expressions import normalize
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return ConversionEngine()
+
+
+@pytest.mark.parametrize("separator", ["to", "in", "as", "TO", "->", "→", "=>", "="])
+def test_separators(engine, separator):
+    value, category, unit = engine.evaluate(f"3 ft 2 in {separator} cm")
+    assert value == pytest.approx(96.52)
+    assert (category, unit) == ("Length", "cm")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("3 ft + 2 in to cm", 96.52),
+    ("3 ft - 2 in to cm", 86.36),
+    ("-3 ft to cm", -91.44),
+    ("+3 ft to cm", 91.44),
+    ("1 km + 200 m - 50 cm to m", 1199.5),
+    ("1 km 200 m 50 cm to m", 1200.5),
+    (".5 km to m", 500.0),
+    ("1.5e-3 km to m", 1.5),
+])
+def test_signs_and_sums(engine, text, expected):
+    assert engine.evaluate(text)[0] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("text, template, numbers", [
+    ("3 ft 2 in to cm", "# ft # in to cm", [3.0, 2.0]),
+    ("15 kWh/100km to kWh/km", "# kWh/100km to kWh/km", [15.0]),
+    ("9.81 m·s^-2 -> km·h^-2", "# m·s^-2 -> km·h^-2", [9.81]),
+    ("2 s^+2 to min^2", "# s^+2 to min^2", [2.0]),
+    ("2 m3 to L", "# m3 to L", [2.0]),
+])
+def test_numbers_inside_units_stay_in_the_template(text, template, numbers):
+    assert normalize(text) == (template, numbers)
+
+
+def test_compound_units(engine):
+    assert engine.evaluate("15 kWh/100km to kWh/km") == (pytest.approx(0.15), "Compound", "kWh/km")
+    assert engine.evaluate("1 m·s^-2 -> km·h^-2")[0] == pytest.approx(12960.0)
+
+
+def test_templates_are_compiled_once(engine):
+    engine.expressions.compile.cache_clear()
+    assert engine.evaluate("5 ft 11 in to cm")[0] == pytest.approx(180.34)
+    assert engine.evaluate("6 ft 1 in to cm")[0] == pytest.approx(185.42)
+    info = engine.expressions.compile.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
+
+
+def test_temperatures_cannot_be_added(engine):
+    assert engine.evaluate("10 °C to °F")[0] == pytest.approx(50.0)
+    with pytest.raises(ValueError, match="cannot be added"):
+        engine.evaluate("10 °C + 5 °C to °F")
+
+
+@pytest.mark.parametrize("text, message", [
+    ("3 ft", "target unit"),
+    ("ft 3 to cm", "start with a number"),
+    ("3 to cm", "needs a unit"),
+    ("3 ft to kg", "Incompatible units"),
+])
+def test_errors(engine, text, message):
+    with pytest.raises(ValueError, match=message):
+        engine.evaluate(text)
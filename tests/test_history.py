@@ -0,0 +1,63 @@
+"""Indexed search of the conversion history."""
+from collections import deque
+
+import pytest
+
+from converter_engine import ConversionEngine
+from converter_history import UNITS, History, Query, make_record, note
+
+PAIRS = [("mass", "kg", "lb"), ("mass", "g", "kg"), ("length", "m", "ft"),
+         ("length", "km", "mi"), ("temperature", "°C", "°F")]
+
+
+@pytest.fixture(scope="module")
+def registry():
+    return ConversionEngine().registry
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["scan", "text index"])
+def history(request, registry):
+    # Smaller than the records added, so the oldest are dropped
+    history = History(900, registry if request.param else None)
+    for number in range(1000):
+        category, source, target = PAIRS[number * 7 % len(PAIRS)]
+        if number % 25:
+            history.append(make_record(registry, UNITS, category, source, target,
+                                       float(number), number * 2.0))
+        else:
+            history.append(note(f"note {number}"))
+    return history
+
+
+@pytest.mark.parametrize("text", ["mass", "kg", "kg lb", "lb kg", "kg -> lb", "mass length",
+                                  "mass kg", "length kg", "km mi 12", "note", "note 5",
+                                  "°C °F mass", "nothing", "00 →", "9.0 (mass)", "OTE",
+                                  "kilogram 4"])
+def test_select_matches_a_full_scan(registry, history, text):
+    query = Query(text, registry)
+    expected = [number for number, record in enumerate(history, history.first)
+                if query.matches(record)]
+    assert query.select(history) == expected
+
+
+def test_search_counts_only_the_matches(registry, history):
+    history.search(Query("kg lb", registry))
+    try:
+        assert history.visible() == len(history.matches) > 0
+        assert all(history[history.visible_number(i)].to_unit == "mass.lb"
+                   for i in range(history.visible()))
+    finally:
+        history.search(None)
+
+
+def test_text_index_follows_the_records(registry):
+    history = History(3, registry)
+    history.append(note("entry 0"))
+    assert Query("ent 0", registry).select(history) == [1]
+    for number in range(1, 5):
+        history.append(note(f"entry {number}"))
+    assert history.by_word["entry"] == deque([3, 4, 5])
+    assert sorted(key for key in history.by_word if key != "entry") == ["2", "3", "4"]
+    assert Query("ent 3", registry).select(history) == [4]
+    history.clear()
+    assert history.by_word is None
@@ -0,0 +1,57 @@
+"""Append-only history journal: tail reads and compaction."""
+import json
+
+from converter_history_journal import HistoryJournal
+
+
+def record(number, size=150):
+    return {"time": number, "mode": "note", "input": "x" * size}
+
+
+def test_tail_skips_a_torn_line(tmp_path):
+    journal = HistoryJournal(str(tmp_path / "history.jsonl"))
+    for number in range(3):
+        journal.append(record(number))
+    journal.flush()
+    with open(journal.path, "ab") as f:
+        f.write(b'{"time": 3, "mo')  # crash in the middle of a write
+    journal.append(record(4))
+    journal.flush()
+    assert [entry["time"] for entry in journal.tail(10)] == [0, 1, 2, 4]
+
+
+def test_compaction_stays_under_the_limit(tmp_path):
+    journal = HistoryJournal(str(tmp_path / "history.jsonl"), max_bytes=64 * 1024, keep=10000)
+    number = 0
+    for _ in range(20):
+        for _ in range(100):
+            journal.append(record(number, size=300))
+            number += 1
+        journal.flush()
+    journal.flush(wait=True)
+    with open(journal.path, "rb") as f:
+        data = f.read()
+    assert len(data) <= 64 * 1024
+    # Whole lines, the newest ones, in order
+    times = [json.loads(line)["time"] for line in data.splitlines()]
+    assert times == list(range(times[0], number))
+
+
+def test_compaction_keeps_at_most_keep_records(tmp_path):
+    journal = HistoryJournal(str(tmp_path / "history.jsonl"), max_bytes=16 * 1024, keep=50)
+    for number in range(1000):
+        journal.append(record(number, size=10))
+    journal.flush(wait=True)
+    assert [entry["time"] for entry in journal.tail(1000)] == list(range(950, 1000))
+
+
+def test_entries_queued_during_compaction_are_kept(tmp_path):
+    journal = HistoryJournal(str(tmp_path / "history.jsonl"), max_bytes=16 * 1024, keep=10000)
+    for number in range(200):
+        journal.append(record(number))
+    journal.flush()  # starts a compaction
+    journal.append(record(200))
+    journal.flush()
+    journal.flush(wait=True)
+    assert journal.pending == 0
+    assert journal.tail(1)[0]["time"] == 200
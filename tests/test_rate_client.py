@@ -0,0 +1,76 @@
+"""RateClient against a local StubServer."""
+import time
+
+import pytest
+import requests
+
+from converter_providers import StubServer
+from converter_rates import RateClient
+
+RATES = {"USD": 1.0, "EUR": 0.9}
+
+
+def client(**kwargs):
+    client = RateClient(**kwargs)
+    client.backoff = lambda attempt: 0.0  # retry at once
+    return client
+
+
+def test_revalidation_with_etag():
+    rates = client()
+    with StubServer(RATES) as stub:
+        first = rates.fetch(stub.url)
+        assert first.data["conversion_rates"] == RATES
+        assert first.validators["etag"] == stub.etag
+
+        again = rates.fetch(stub.url, first.validators)
+        assert again.not_modified and again.data is None
+        assert again.validators == first.validators
+
+        stub.set_rates({"USD": 1.0, "EUR": 0.95})
+        changed = rates.fetch(stub.url, first.validators)
+        assert not changed.not_modified
+        assert changed.data["conversion_rates"]["EUR"] == 0.95
+    assert rates.sent == stub.requests == 3
+
+
+@pytest.mark.parametrize("status", [503, 429])
+def test_gives_up_after_the_retries(status):
+    rates = client(retries=2)
+    with StubServer(RATES, status=status) as stub:
+        with pytest.raises(requests.HTTPError):
+            rates.fetch(stub.url)
+    assert stub.requests == 3
+    assert rates.sent == 3
+
+
+def test_recovers_when_the_server_does():
+    rates = client(retries=3)
+    with StubServer(RATES, status=503) as stub:
+        original = rates.backoff
+
+        def backoff(attempt):
+            stub.status = 200  # the server is back for the retry
+            return original(attempt)
+
+        rates.backoff = backoff
+        assert rates.fetch(stub.url).data["conversion_rates"] == RATES
+    assert stub.requests == 2
+
+
+def test_deadline_covers_slow_answers():
+    rates = RateClient(timeout=10, deadline=0.5)
+    with StubServer(RATES, delay=2.0) as stub:
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            rates.fetch(stub.url)
+        assert time.monotonic() - started < 1.5
+
+
+def test_deadline_cuts_the_backoff():
+    rates = RateClient(deadline=0.5, retries=10)
+    rates.backoff = lambda attempt: 1.0
+    with StubServer(RATES, status=503) as stub:
+        with pytest.raises(TimeoutError):
+            rates.fetch(stub.url)
+    assert stub.requests == 1
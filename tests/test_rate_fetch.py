@@ -0,0 +1,104 @@
+"""Quota accounting of fetches from several rate providers."""
+import json
+import os
+import time
+
+import pytest
+
+from converter_providers import FileProvider, HttpProvider, StubServer
+from converter_rates import MAX_AGE, RateClient, RateFetch, RefreshScheduler, fetch_first
+
+RATES = {"USD": 1.0, "EUR": 0.9, "GBP": 0.8}
+
+
+@pytest.fixture
+def rates_file(tmp_path):
+    path = tmp_path / "rates.json"
+    path.write_text(json.dumps({"conversion_rates": RATES}), encoding="utf-8")
+    return str(path)
+
+
+def metered(stub):
+    return HttpProvider("api", stub.url, RateClient(deadline=5), metered=True)
+
+
+def run(providers, schedule, **kwargs):
+    fetch = RateFetch(providers, **kwargs)
+    response = fetch.result(timeout=10)
+    schedule.record(fetch.count_sent(), True)
+    return response
+
+
+def test_fast_free_provider_leaves_the_metered_api_alone(tmp_path, rates_file):
+    schedule = RefreshScheduler(str(tmp_path / "schedule.json"))
+    with StubServer(RATES, delay=0.5) as stub:
+        providers = [metered(stub), FileProvider("file", rates_file)]
+        for _ in range(3):
+            assert run(providers, schedule).provider == "file"
+    assert stub.requests == 0
+    assert schedule.used == 0
+
+
+def test_every_metered_request_is_counted(tmp_path):
+    schedule = RefreshScheduler(str(tmp_path / "schedule.json"))
+    with StubServer(RATES, delay=0.3) as free, StubServer(RATES, delay=0.5) as api:
+        # The free stub is slower than the hedge, so the API is asked as well
+        providers = [metered(api), HttpProvider("free", free.url, RateClient())]
+        for _ in range(3):
+            assert run(providers, schedule, hedge=0.05).provider == "free"
+    assert api.requests == 3
+    assert schedule.used == 3
+
+
+def test_answer_does_not_wait_for_the_metered_api(tmp_path):
+    with StubServer(RATES, delay=0.5) as free, StubServer(RATES, delay=3.0) as api:
+        providers = [metered(api), HttpProvider("free", free.url, RateClient())]
+        started = time.monotonic()
+        fetch = RateFetch(providers, hedge=0.1)
+        assert fetch.result(timeout=10).provider == "free"
+        assert time.monotonic() - started < 1.5
+        assert fetch.count_sent() == api.requests == 1
+
+
+def test_metered_api_answers_when_the_free_providers_fail(tmp_path):
+    schedule = RefreshScheduler(str(tmp_path / "schedule.json"))
+    with StubServer(RATES) as stub:
+        providers = [FileProvider("file", str(tmp_path / "missing.json")), metered(stub)]
+        assert run(providers, schedule).provider == "api"
+    assert stub.requests == 1
+    assert schedule.used == 1
+
+
+def test_no_valid_answer_lists_every_failure(tmp_path):
+    with StubServer({"USD": 1.0, "EUR": -1.0}) as stub:
+        providers = [FileProvider("file", str(tmp_path / "missing.json")), metered(stub)]
+        with pytest.raises(ValueError, match="file: .*api: bad rate for EUR"):
+            fetch_first(providers)
+
+
+def test_stale_feed_does_not_answer_for_the_api(tmp_path, rates_file):
+    os.utime(rates_file, (0, 0))  # a feed last written in 1970
+    with StubServer(RATES) as stub:
+        providers = [FileProvider("file", rates_file), metered(stub)]
+        response = fetch_first(providers)
+    assert response.provider == "api"
+    assert stub.requests == 1
+
+
+def test_rates_older_than_the_saved_ones(tmp_path, rates_file):
+    hour_ago = time.time() - 3600
+    os.utime(rates_file, (hour_ago, hour_ago))
+    saved = {"api": {"etag": '"x"', "published": int(time.time())}}
+    with pytest.raises(ValueError, match="older than the saved ones"):
+        fetch_first([FileProvider("file", rates_file)], saved)
+
+
+def test_unchanged_feed_wins_only_while_the_saved_rates_are_fresh(rates_file):
+    provider = FileProvider("file", rates_file)
+    first = fetch_first([provider])
+    assert first.validators["published"] == int(os.stat(rates_file).st_mtime)
+    assert fetch_first([provider], {"file": first.validators}).not_modified
+
+    stale = dict(first.validators, published=int(time.time() - MAX_AGE - 60))
+    with pytest.raises(ValueError, match="saved rates are out of date"):
+        fetch_first([provider], {"file": stale})
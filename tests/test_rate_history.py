@@ -0,0 +1,33 @@
+"""As-of lookups in the currency rate history."""
+from datetime import datetime
+
+import pytest
+
+from converter_rate_history import RateHistory
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = RateHistory(str(tmp_path / "history.sqlite"))
+    history.add({"USD": 1.0, "EUR": 0.90}, datetime(2024, 3, 1, 12).timestamp())
+    history.add({"USD": 1.0, "EUR": 0.95}, datetime(2024, 4, 1, 12).timestamp())
+    yield history
+    history.close()
+
+
+def test_last_snapshot_at_or_before(history):
+    assert history.cross_rate("USD", "EUR", "2024-03-15") == 0.90
+    assert history.cross_rate("USD", "EUR", "2024-04-01") == 0.95
+    assert history.cross_rates("USD", "EUR", ["2024-03-01", "2024-05-01"]) == [0.90, 0.95]
+
+
+def test_date_before_the_first_snapshot(history):
+    with pytest.raises(ValueError, match="first are from 2024-03-01"):
+        history.cross_rate("USD", "EUR", "2024-02-29")
+    with pytest.raises(ValueError, match="2024-02-29"):
+        history.cross_rates("USD", "EUR", ["2024-03-15", "2024-02-29"])
+
+
+def test_empty_history(tmp_path):
+    with pytest.raises(ValueError, match="No saved currency rates"):
+        RateHistory(str(tmp_path / "empty.sqlite")).cross_rate("USD", "EUR", "2024-03-01")
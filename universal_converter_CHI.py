@@ -1,40 +1,85 @@
+import time
+STARTED = time.perf_counter()  # 导入开始时间, 用于 --timing
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext, filedialog
+from tkinter import ttk, messagebox, filedialog
 import os
+import sys
 import json
 import math
-from datetime import datetime, timedelta
-import requests
+from datetime import datetime
+from converter_engine import ConversionEngine
+from converter_history import (CURRENCY, EXPRESSION, UNITS, History, Query, describe,
+                               make_record, note, read_records)
+from converter_history_export import HistoryExport, parquet_available
+from converter_history_journal import HistoryJournal
+from converter_providers import build_providers
+from converter_rate_cache import read_rates, write_rate_cache
+from converter_rate_history import RateHistory
+from converter_rates import RateClient, RateFetch, RefreshScheduler
+from converter_tasks import Background
+from converter_timing import PhaseTimer
+from converter_widgets import VirtualList
 
 class UniversalConverter:
-    def __init__(self, root):
+    def __init__(self, root, timer=None):
         self.root = root
+        self.timer = timer or PhaseTimer()
         self.root.title("万能转换器 V1")  # 改为V1
         self.root.geometry("1000x750")
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         
         # API设置
         self.api_file = "converter_api.json"
-        self.rates_file = "currency_rates.json"
+        self.rates_file = "currency_rates.bin"
+        self.legacy_rates_file = "currency_rates.json"  # 旧的JSON缓存, 仅在没有二进制缓存时读取一次
+        self.rate_history_file = "currency_history.sqlite"
+        self.HISTORY_LIMIT = 100000  # 历史面板保留的条数
+        # 每次转换都追加到此日志, 批量写入
+        self.history_journal = HistoryJournal("converter_history.jsonl", keep=self.HISTORY_LIMIT)
+        self.history_flush_job = None
+        self.history_export = None  # 正在运行的 HistoryExport, 空闲时为 None
+        # 构建窗口的同时在后台线程中读取已保存的汇率和历史记录
+        self.startup_rates = Background(read_rates, self.rates_file, self.legacy_rates_file,
+                                        name="load-rates")
+        self.startup_history = Background(read_records, self.history_journal, self.HISTORY_LIMIT,
+                                          name="load-history")
+        # 在每月请求限额内安排汇率更新
+        self.rate_schedule = RefreshScheduler("rate_schedule.json")
+        self.BASE_URL = "https://v6.exchangerate-api.com/v6/"  # 可在 converter_api.json 中用 "base_url" 修改
+        self.REQUEST_TIMEOUT = 10  # 秒, 可在 converter_api.json 中用 "timeout" 修改
+        self.provider_config = []  # 其他汇率数据源, converter_api.json 中的 "providers"
         self.API_KEY = self.load_api_key()
-        self.BASE_URL = "https://v6.exchangerate-api.com/v6/"
+        self.rate_client = RateClient(self.REQUEST_TIMEOUT)
+        self.build_rate_providers()
         self.rates = {}
         self.last_update = None
         self.currency_mode = False
+        self.rate_fetch = None
+        self.rate_notify = True
+        self.refresh_job = None
+        self.rate_validators = {}  # 每个数据源已保存汇率的 ETag / Last-Modified
 
         # 样式设置
         self.setup_styles()
+        self.timer.mark("styles")
         
         # 所有可转换单位
         self.units = self.load_units()
+        self.currency_units = self.load_currency_units()
+        self.engine = ConversionEngine(self.units, self.currency_units,
+                                       RateHistory(self.rate_history_file))
+        self.timer.mark("unit tables")
         
         # 变量初始化
         self.setup_variables()
         
         # 创建界面
         self.create_interface()
+        self.timer.mark("widgets")
         
         # 初始化数据
         self.initialize_data()
+        self.timer.mark("data init")
 
     def setup_styles(self):
         """设置界面样式"""
@@ -49,155 +94,147 @@ class UniversalConverter:
         self.style.configure('Currency.TButton', background='#90EE90', font=('Microsoft YaHei', 10, 'bold'))
         self.style.configure('Normal.TButton', background='#ADD8E6', font=('Microsoft YaHei', 10, 'bold'))
     
-    def load_units(self):
-        """加载所有单位"""
-        units = {
+    @staticmethod
+    def load_units():
+        """按单位ID加载所有类别和单位的显示名称"""
+        return {
             # 质量
-            "质量": {
-                "千克 (kg)": 1.0,
-                "克 (g)": 0.001,
-                "毫克 (mg)": 1e-6,
-                "吨 (t)": 1000.0,
-                "磅 (lb)": 0.453592,
-                "盎司 (oz)": 0.0283495,
-                "克拉 (ct)": 0.0002
-            },
+            "mass": "质量",
+            "mass.kg": "千克 (kg)",
+            "mass.g": "克 (g)",
+            "mass.mg": "毫克 (mg)",
+            "mass.t": "吨 (t)",
+            "mass.lb": "磅 (lb)",
+            "mass.oz": "盎司 (oz)",
+            "mass.ct": "克拉 (ct)",
             
             # 长度
-            "长度": {
-                "米 (m)": 1.0,
-                "千米 (km)": 1000.0,
-                "厘米 (cm)": 0.01,
-                "毫米 (mm)": 0.001,
-                "微米 (µm)": 1e-6,
-                "英寸 (in)": 0.0254,
-                "英尺 (ft)": 0.3048,
-                "码 (yd)": 0.9144,
-                "英里 (mi)": 1609.34,
-                "海里 (nmi)": 1852.0
-            },
+            "length": "长度",
+            "length.m": "米 (m)",
+            "length.km": "千米 (km)",
+            "length.cm": "厘米 (cm)",
+            "length.mm": "毫米 (mm)",
+            "length.um": "微米 (µm)",
+            "length.in": "英寸 (in)",
+            "length.ft": "英尺 (ft)",
+            "length.yd": "码 (yd)",
+            "length.mi": "英里 (mi)",
+            "length.nmi": "海里 (nmi)",
             
             # 体积
-            "体积": {
-                "升 (L)": 1.0,
-                "毫升 (mL)": 0.001,
-                "加仑 (gal)": 3.78541,
-                "品脱 (pt)": 0.473176,
-                "立方米 (m³)": 1000.0,
-                "立方英寸 (in³)": 0.0163871,
-                "茶匙 (tsp)": 0.00492892,
-                "汤匙 (tbsp)": 0.0147868,
-                "杯 (cup)": 0.236588
-            },
+            "volume": "体积",
+            "volume.L": "升 (L)",
+            "volume.mL": "毫升 (mL)",
+            "volume.gal": "加仑 (gal)",
+            "volume.pt": "品脱 (pt)",
+            "volume.m3": "立方米 (m³)",
+            "volume.in3": "立方英寸 (in³)",
+            "volume.tsp": "茶匙 (tsp)",
+            "volume.tbsp": "汤匙 (tbsp)",
+            "volume.cup": "杯 (cup)",
             
             # 温度
-            "温度": {
-                "摄氏度 (°C)": "celsius",
-                "华氏度 (°F)": "fahrenheit",
-                "开尔文 (K)": "kelvin"
-            },
+            "temperature": "温度",
+            "temperature.C": "摄氏度 (°C)",
+            "temperature.F": "华氏度 (°F)",
+            "temperature.K": "开尔文 (K)",
             
             # 面积
-            "面积": {
-                "平方米 (m²)": 1.0,
-                "平方千米 (km²)": 1e6,
-                "平方厘米 (cm²)": 0.0001,
-                "公顷 (ha)": 10000.0,
-                "英亩 (ac)": 4046.86,
-                "平方英里 (mi²)": 2.59e6,
-                "平方英尺 (ft²)": 0.092903
-            },
+            "area": "面积",
+            "area.m2": "平方米 (m²)",
+            "area.km2": "平方千米 (km²)",
+            "area.cm2": "平方厘米 (cm²)",
+            "area.ha": "公顷 (ha)",
+            "area.ac": "英亩 (ac)",
+            "area.mi2": "平方英里 (mi²)",
+            "area.ft2": "平方英尺 (ft²)",
             
             # 速度
-            "速度": {
-                "米/秒 (m/s)": 1.0,
-                "千米/小时 (km/h)": 0.277778,
-                "英里/小时 (mph)": 0.44704,
-                "节 (knots)": 0.514444,
-                "马赫 (Mach)": 343.0
-            },
+            "speed": "速度",
+            "speed.m/s": "米/秒 (m/s)",
+            "speed.km/h": "千米/小时 (km/h)",
+            "speed.mph": "英里/小时 (mph)",
+            "speed.knots": "节 (knots)",
+            "speed.Mach": "马赫 (Mach)",
             
             # 数据存储
-            "数据存储": {
-                "比特 (bit)": 1.0,
-                "字节 (B)": 8.0,
-                "千字节 (KB)": 8192.0,
-                "兆字节 (MB)": 8388608.0,
-                "千兆字节 (GB)": 8589934592.0,
-                "太字节 (TB)": 8796093022208.0
-            },
+            "data": "数据存储",
+            "data.bit": "比特 (bit)",
+            "data.B": "字节 (B)",
+            "data.KB": "千字节 (KB)",
+            "data.MB": "兆字节 (MB)",
+            "data.GB": "千兆字节 (GB)",
+            "data.TB": "太字节 (TB)",
             
             # 能量
-            "能量": {
-                "焦耳 (J)": 1.0,
-                "千焦 (kJ)": 1000.0,
-                "卡路里 (cal)": 4.184,
-                "千卡 (kcal)": 4184.0,
-                "千瓦时 (kWh)": 3600000.0,
-                "电子伏特 (eV)": 1.60218e-19
-            },
+            "energy": "能量",
+            "energy.J": "焦耳 (J)",
+            "energy.kJ": "千焦 (kJ)",
+            "energy.cal": "卡路里 (cal)",
+            "energy.kcal": "千卡 (kcal)",
+            "energy.kWh": "千瓦时 (kWh)",
+            "energy.eV": "电子伏特 (eV)",
             
             # 压力
-            "压力": {
-                "帕斯卡 (Pa)": 1.0,
-                "巴 (bar)": 100000.0,
-                "标准大气压 (atm)": 101325.0,
-                "毫米汞柱 (mmHg)": 133.322,
-                "磅力/平方英寸 (PSI)": 6894.76
-            },
+            "pressure": "压力",
+            "pressure.Pa": "帕斯卡 (Pa)",
+            "pressure.bar": "巴 (bar)",
+            "pressure.atm": "标准大气压 (atm)",
+            "pressure.mmHg": "毫米汞柱 (mmHg)",
+            "pressure.psi": "磅力/平方英寸 (PSI)",
             
             # 时间
-            "时间": {
-                "秒 (s)": 1.0,
-                "分钟 (min)": 60.0,
-                "小时 (h)": 3600.0,
-                "天": 86400.0,
-                "周": 604800.0,
-                "年": 31536000.0
-            },
+            "time": "时间",
+            "time.s": "秒 (s)",
+            "time.min": "分钟 (min)",
+            "time.h": "小时 (h)",
+            "time.day": "天",
+            "time.week": "周",
+            "time.year": "年",
             
             # 辐射
-            "辐射": {
-                "西弗 (Sv)": 1.0,
-                "雷姆 (rem)": 0.01,
-                "拉德 (rad)": 0.01,
-                "戈瑞 (Gy)": 1.0,
-                "伦琴 (R)": 0.00933
-            },
+            "radiation": "辐射",
+            "radiation.Sv": "西弗 (Sv)",
+            "radiation.rem": "雷姆 (rem)",
+            "radiation.rad": "拉德 (rad)",
+            "radiation.Gy": "戈瑞 (Gy)",
+            "radiation.R": "伦琴 (R)",
             
             # 天文
-            "天文": {
-                "光年 (ly)": 1.0,
-                "天文单位 (AU)": 63241.1,
-                "秒差距 (pc)": 3.26156,
-                "千米 (km)": 9.461e12,
-                "月球距离 (LD)": 384400.0
-            },
+            "astronomy": "天文",
+            "astronomy.ly": "光年 (ly)",
+            "astronomy.AU": "天文单位 (AU)",
+            "astronomy.pc": "秒差距 (pc)",
+            "astronomy.km": "千米 (km)",
+            "astronomy.LD": "月球距离 (LD)",
             
             # 烹饪
-            "烹饪": {
-                "克 (g)": 1.0,
-                "千克 (kg)": 1000.0,
-                "盎司 (oz)": 28.3495,
-                "磅 (lb)": 453.592,
-                "茶匙 (tsp)": 5.0,
-                "汤匙 (tbsp)": 15.0,
-                "杯 (cup)": 240.0,
-                "毫升 (mL)": 1.0,
-                "升 (L)": 1000.0
-            },
+            "cooking": "烹饪",
+            "cooking.g": "克 (g)",
+            "cooking.kg": "千克 (kg)",
+            "cooking.oz": "盎司 (oz)",
+            "cooking.lb": "磅 (lb)",
+            "cooking.tsp": "茶匙 (tsp)",
+            "cooking.tbsp": "汤匙 (tbsp)",
+            "cooking.cup": "杯 (cup)",
+            "cooking.mL": "毫升 (mL)",
+            "cooking.L": "升 (L)",
             
             # 角度
-            "角度": {
-                "度 (°)": 1.0,
-                "弧度 (rad)": 57.2958,
-                "百分度 (grad)": 0.9,
-                "转 (rev)": 360.0
-            }
+            "angles": "角度",
+            "angles.deg": "度 (°)",
+            "angles.rad": "弧度 (rad)",
+            "angles.grad": "百分度 (grad)",
+            "angles.rev": "转 (rev)",
+            
+            # 货币
+            "currency": "货币"
         }
-        
-        # 货币单位单独处理
-        self.currency_units = {
+    
+    @staticmethod
+    def load_currency_units():
+        """加载货币单位"""
+        return {
             "USD (美元)": 1.0,
             "EUR (欧元)": 0.85,
             "RUB (俄罗斯卢布)": 75.0,
@@ -210,8 +247,6 @@ class UniversalConverter:
             "INR (印度卢比)": 75.0,
             "BRL (巴西雷亚尔)": 5.25
         }
-        
-        return units
     
     def setup_variables(self):
         """初始化变量"""
@@ -221,8 +256,11 @@ class UniversalConverter:
         self.input_value = tk.StringVar(value="1.0")
         self.result_value = tk.StringVar(value="")
         self.status_var = tk.StringVar(value="准备就绪")
+        self.schedule_var = tk.StringVar(value="")
         self.api_key_var = tk.StringVar(value=self.API_KEY or "")
-        self.history = []
+        self.history = History(self.HISTORY_LIMIT, self.engine.registry)
+        self.history_search = tk.StringVar(value="")
+        self.history_search_job = None
     
     def create_interface(self):
         """创建界面"""
@@ -254,12 +292,20 @@ class UniversalConverter:
         ttk.Button(self.api_frame, text="保存API", 
                   command=self.save_api_key).grid(row=0, column=2, padx=5, pady=5)
         
-        ttk.Button(self.api_frame, text="更新汇率", 
-                  command=self.update_currency_rates).grid(row=0, column=3, padx=5, pady=5)
+        self.update_btn = ttk.Button(self.api_frame, text="更新汇率", 
+                                     command=self.update_currency_rates)
+        self.update_btn.grid(row=0, column=3, padx=5, pady=5)
         
         ttk.Button(self.api_frame, text="使用说明", 
                   command=self.show_api_instructions).grid(row=0, column=4, padx=5, pady=5)
         
+        # 获取汇率时显示
+        self.rate_progress = ttk.Progressbar(self.api_frame, mode='indeterminate', length=80)
+        
+        # 下次计划更新时间和本月请求次数
+        ttk.Label(self.api_frame, textvariable=self.schedule_var).grid(
+            row=1, column=0, columnspan=6, padx=5, sticky=tk.W)
+        
         # 转换框架
         self.conv_frame = ttk.LabelFrame(main_frame, text="单位转换")
         self.conv_frame.pack(fill=tk.X, pady=5)
@@ -269,7 +315,7 @@ class UniversalConverter:
         self.category_combo = ttk.Combobox(
             self.conv_frame, 
             textvariable=self.current_category, 
-            values=list(self.units.keys()), 
+            values=self.engine.registry.category_labels(), 
             state="readonly", 
             width=25
         )
@@ -309,13 +355,19 @@ class UniversalConverter:
         ttk.Label(main_frame, textvariable=self.status_var, font=('Microsoft YaHei', 9)).pack(anchor=tk.W)
         
         # 历史记录
-        history_frame = ttk.LabelFrame(main_frame, text="转换历史(最近20条)")
+        history_frame = ttk.LabelFrame(main_frame, text="转换历史")
         history_frame.pack(fill=tk.BOTH, expand=True, pady=10)
         
-        self.history_text = scrolledtext.ScrolledText(history_frame, wrap=tk.WORD, 
-                                                    font=('Consolas', 9))
-        self.history_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        self.history_text.config(state=tk.DISABLED)
+        # 历史搜索
+        search_frame = ttk.Frame(history_frame)
+        search_frame.pack(fill=tk.X, padx=5, pady=(5, 0))
+        ttk.Label(search_frame, text="搜索:").pack(side=tk.LEFT)
+        ttk.Entry(search_frame, textvariable=self.history_search).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.history_search.trace_add("write", self.search_history)
+        
+        self.history_view = VirtualList(history_frame, [("#", 70), ("时间", 130), ("转换", 600)],
+                                        count=self.history.visible, row=self.history_row)
+        self.history_view.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
         # 历史记录按钮
         history_btn_frame = ttk.Frame(history_frame)
@@ -323,20 +375,30 @@ class UniversalConverter:
 
         ttk.Button(history_btn_frame, text="清除历史", 
                   command=self.clear_history).pack(side=tk.LEFT, padx=5)
-        ttk.Button(history_btn_frame, text="保存历史", 
-                  command=self.save_history).pack(side=tk.LEFT, padx=5)
+        self.save_btn = ttk.Button(history_btn_frame, text="保存历史", 
+                                   command=self.save_history)
+        self.save_btn.pack(side=tk.LEFT, padx=5)
+        self.export_progress = ttk.Progressbar(history_btn_frame, mode='determinate',
+                                               length=150, maximum=1.0)
         
         # 退出按钮
         btn_frame = ttk.Frame(main_frame)
         btn_frame.pack(fill=tk.X, pady=5)
         
         ttk.Button(btn_frame, text="退出", 
-                  command=self.root.quit).pack(side=tk.RIGHT)
+                  command=self.close).pack(side=tk.RIGHT)
     
     def toggle_currency_mode(self):
         """切换普通/货币转换模式"""
         self.currency_mode = not self.currency_mode
+        self.apply_mode()
         
+        # 切换模式时清空输入
+        self.input_value.set("1.0")
+        self.result_value.set("")
+    
+    def apply_mode(self):
+        """布置当前模式的控件"""
         if self.currency_mode:
             self.mode_btn.config(text="普通转换器", style='Normal.TButton')
             self.api_frame.pack(fill=tk.X, pady=5, before=self.conv_frame)
@@ -346,12 +408,11 @@ class UniversalConverter:
             self.category_combo.grid_forget()
             
             # 更新货币单位
-            self.from_combo['values'] = list(self.currency_units.keys())
-            self.to_combo['values'] = list(self.currency_units.keys())
+            self.update_currency_list()
             
-            if not self.from_unit.get() or self.from_unit.get() not in self.currency_units:
+            if self.engine.registry.get(self.from_unit.get(), "currency") is None:
                 self.from_unit.set("USD (美元)")
-            if not self.to_unit.get() or self.to_unit.get() not in self.currency_units:
+            if self.engine.registry.get(self.to_unit.get(), "currency") is None:
                 self.to_unit.set("EUR (欧元)")
         else:
             self.mode_btn.config(text="货币转换器", style='Currency.TButton')
@@ -367,18 +428,23 @@ class UniversalConverter:
         # 更新布局
         self.units_frame.grid(row=1, column=0, columnspan=3, sticky=tk.EW, pady=5)
         self.value_frame.grid(row=2, column=0, columnspan=3, sticky=tk.EW, pady=5)
-        
-        # 切换模式时清空输入
-        self.input_value.set("1.0")
-        self.result_value.set("")
     
     def initialize_data(self):
         """初始化数据"""
-        self.load_currency_rates()
-        self.update_units()
-        self.load_history()
-        self.toggle_currency_mode()  # 从普通模式开始
-        self.toggle_currency_mode()  # 切换回货币模式完成初始化
+        # 普通模式只布置一次; 汇率和历史记录由启动线程提供
+        self.apply_mode()
+        self.poll_startup()
+    
+    def poll_startup(self):
+        """启动时读取的汇率和历史记录就绪后即应用"""
+        if self.startup_rates is not None and self.startup_rates.poll() is not None:
+            self.load_currency_rates(self.startup_rates)
+            self.startup_rates = None
+        if self.startup_history is not None and self.startup_history.poll() is not None:
+            self.load_history(self.startup_history)
+            self.startup_history = None
+        if self.startup_rates is not None or self.startup_history is not None:
+            self.root.after(20, self.poll_startup)
     
     def update_units(self, event=None):
         """更新单位列表"""
@@ -386,7 +452,7 @@ class UniversalConverter:
             return
             
         category = self.current_category.get()
-        units = list(self.units[category].keys())
+        units = list(self.engine.registry.category(category).labels)
         
         self.from_combo['values'] = units
         self.to_combo['values'] = units
@@ -403,6 +469,9 @@ class UniversalConverter:
             if os.path.exists(self.api_file):
                 with open(self.api_file, 'r') as f:
                     data = json.load(f)
+                    self.REQUEST_TIMEOUT = data.get('timeout', self.REQUEST_TIMEOUT)
+                    self.BASE_URL = data.get('base_url', self.BASE_URL)
+                    self.provider_config = data.get('providers', self.provider_config)
                     return data.get('api_key', "")
         except Exception as e:
             print(f"加载API密钥错误: {e}")
@@ -411,14 +480,25 @@ class UniversalConverter:
     def save_api_key(self):
         """保存API密钥到文件"""
         self.API_KEY = self.api_key_var.get().strip()
+        self.build_rate_providers()
         try:
             with open(self.api_file, 'w') as f:
-                json.dump({'api_key': self.API_KEY}, f)
+                json.dump({'api_key': self.API_KEY, 'timeout': self.REQUEST_TIMEOUT,
+                           'base_url': self.BASE_URL, 'providers': self.provider_config}, f)
             messagebox.showinfo("成功", "API密钥已保存!")
             self.load_currency_rates()  # 尝试用新密钥加载汇率
         except Exception as e:
             messagebox.showerror("错误", f"保存密钥失败: {str(e)}")
     
+    def build_rate_providers(self):
+        """汇率数据源: 有密钥时使用API, 以及 converter_api.json 中配置的数据源"""
+        api_url = f"{self.BASE_URL}{self.API_KEY}/latest/USD" if self.API_KEY else None
+        try:
+            self.rate_providers = build_providers(self.provider_config, api_url, self.rate_client)
+        except (KeyError, ValueError) as e:
+            print(f"汇率数据源配置错误: {e}")
+            self.rate_providers = build_providers((), api_url, self.rate_client)
+    
     def show_api_instructions(self):
         """显示API密钥获取说明"""
         instructions = """
@@ -436,110 +516,177 @@ class UniversalConverter:
         """
         messagebox.showinfo("API密钥获取说明", instructions)
     
-    def load_currency_rates(self):
+    def load_currency_rates(self, prefetch=None):
         """从文件或API加载汇率"""
         try:
             # 尝试从文件加载
-            if os.path.exists(self.rates_file):
-                with open(self.rates_file, 'r') as f:
-                    data = json.load(f)
-                    last_update = datetime.strptime(data['last_update'], '%Y-%m-%d')
-                    
-                    # 如果上次更新在7天内
-                    if datetime.now() - last_update < timedelta(days=7):
-                        self.rates = data['rates']
-                        self.last_update = last_update
-                        self.status_var.set(f"汇率已从文件加载({last_update.strftime('%Y年%m月%d日')})")
-                        
-                        # 更新currency_units中的系数
-                        for curr, rate in self.rates.items():
-                            # 通过货币代码(字符串开头)在currency_units中查找
-                            for key in list(self.currency_units.keys()):
-                                if key.startswith(curr + " "):
-                                    self.currency_units[key] = rate
-                                    break
-                        return
-            
-            # 如果没有文件或数据过期，但有API密钥 - 更新
-            if self.API_KEY:
-                self.update_currency_rates()
+            if prefetch is not None:
+                cache = prefetch.result()
             else:
+                cache = read_rates(self.rates_file, self.legacy_rates_file)
+            if cache is not None:
+                self.rates, self.rate_validators, last_update = cache
+                self.last_update = last_update
+                self.status_var.set(f"汇率已从文件加载({last_update.strftime('%Y年%m月%d日')})")
+                self.apply_currency_rates()
+            elif not self.rates:
                 self.status_var.set("使用保存的汇率(未更新)")
-                
         except Exception as e:
             self.status_var.set(f"加载汇率错误: {str(e)}")
             # 使用默认保存值
+        
+        # 调度器认为需要更新时获取汇率
+        if self.rate_providers and self.rate_schedule.is_due():
+            self.update_currency_rates(notify=False)
+        self.schedule_rate_refresh()
     
-    def update_currency_rates(self):
+    def update_currency_rates(self, notify=True):
         """通过API更新汇率"""
-        if not self.API_KEY:
+        if not self.rate_providers:
             messagebox.showwarning("错误", "请输入API密钥以更新汇率")
             return
             
+        if self.rate_fetch is not None:
+            return
+        if not self.rate_schedule.remaining():
+            when = datetime.fromtimestamp(self.rate_schedule.next_fetch()).strftime('%Y年%m月%d日 %H:%M')
+            messagebox.showwarning("错误", f"本月请求次数已用完, 下次更新 {when}")
+            return
+        
+        # 请求在后台线程中执行, 窗口不会冻结
+        self.status_var.set("正在更新汇率...")
+        self.update_btn.config(text="取消", command=self.cancel_rate_update)
+        self.rate_progress.grid(row=0, column=5, padx=5, pady=5)
+        self.rate_progress.start(10)
+        self.rate_notify = notify
+        self.rate_fetch = RateFetch(self.rate_providers, self.rate_validators)
+        self.root.after(100, self.poll_rate_update, self.rate_fetch)
+    
+    def poll_rate_update(self, fetch):
+        """获取后台汇率更新的结果"""
+        if fetch is not self.rate_fetch:
+            return
+        result = fetch.poll()
+        if result is None:
+            self.root.after(100, self.poll_rate_update, fetch)
+            return
+        self.finish_rate_update()
+        self.record_rate_fetch(fetch, result)
+        
         try:
-            self.status_var.set("正在更新汇率...")
-            self.root.update()
+            response, error = result
+            if error is not None:
+                raise error
+            self.rate_validators[response.provider] = response.validators
             
-            response = requests.get(f"{self.BASE_URL}{self.API_KEY}/latest/USD")
-            data = response.json()
+            if response.not_modified:
+                # 304: 已保存的汇率仍然有效, 只更新日期
+                self.last_update = datetime.now()
+                self.apply_currency_rates()
+                self.save_currency_rates()
+                self.status_var.set(f"汇率已是最新({self.last_update.strftime('%Y年%m月%d日')})")
+                return
+            data = response.data
             
             if data['result'] == 'success':
-                self.rates = {
-                    'USD': 1.0,
-                    'EUR': data['conversion_rates']['EUR'],
-                    'RUB': data['conversion_rates']['RUB'],
-                    'GBP': data['conversion_rates']['GBP'],
-                    'JPY': data['conversion_rates']['JPY'],
-                    'CNY': data['conversion_rates']['CNY'],
-                    'AUD': data['conversion_rates']['AUD'],
-                    'CAD': data['conversion_rates']['CAD'],
-                    'CHF': data['conversion_rates']['CHF'],
-                    'INR': data['conversion_rates']['INR'],
-                    'BRL': data['conversion_rates']['BRL']
-                }
+                self.rates = data['conversion_rates']
                 
-                # 更新currency_units中的系数
-                for curr, rate in self.rates.items():
-                    for key in list(self.currency_units.keys()):
-                        if key.startswith(curr + " "):
-                            self.currency_units[key] = rate
-                            break
+                self.apply_currency_rates()
+                # 保存每次获取的汇率快照, 用于按日期换算
+                self.engine.history.add(self.rates, data.get('time_last_update_unix'))
                 
                 # 保存到文件
                 self.last_update = datetime.now()
-                with open(self.rates_file, 'w') as f:
-                    json.dump({
-                        'rates': self.rates,
-                        'last_update': self.last_update.strftime('%Y-%m-%d')
-                    }, f)
+                self.save_currency_rates()
                 
                 self.status_var.set(f"汇率已更新({self.last_update.strftime('%Y年%m月%d日')})")
-                messagebox.showinfo("成功", "汇率更新成功!")
+                if self.rate_notify:
+                    messagebox.showinfo("成功", "汇率更新成功!")
             else:
                 error_msg = data.get('error-type', '未知错误')
                 self.status_var.set(f"API错误: {error_msg}")
-                messagebox.showerror("API错误", f"更新汇率失败: {error_msg}")
+                if self.rate_notify:
+                    messagebox.showerror("API错误", f"更新汇率失败: {error_msg}")
                 
         except Exception as e:
             self.status_var.set(f"更新错误: {str(e)}")
-            messagebox.showerror("错误", f"更新汇率失败: {str(e)}")
+            if self.rate_notify:
+                messagebox.showerror("错误", f"更新汇率失败: {str(e)}")
+    
+    def record_rate_fetch(self, fetch, result):
+        """将请求计入限额并安排下一次更新"""
+        response, error = result
+        success = error is None and (response.not_modified or (
+            isinstance(response.data, dict) and response.data.get('result') == 'success'))
+        next_update = None
+        if success and not response.not_modified:
+            next_update = response.data.get('time_next_update_unix')
+        self.rate_schedule.record(fetch.count_sent(), success, next_update)
+        self.schedule_rate_refresh()
+    
+    def schedule_rate_refresh(self):
+        """安排下一次自动汇率更新"""
+        if self.refresh_job is not None:
+            self.root.after_cancel(self.refresh_job)
+            self.refresh_job = None
+        if not self.rate_providers:
+            self.schedule_var.set("")
+            return
+        next_fetch = self.rate_schedule.next_fetch()
+        when = datetime.fromtimestamp(next_fetch).strftime('%Y年%m月%d日 %H:%M')
+        used = self.rate_schedule.quota - self.rate_schedule.remaining()
+        self.schedule_var.set(f"下次更新: {when} · 本月请求 {used}/{self.rate_schedule.quota}")
+        # 至少每小时检查一次, 休眠不会推迟更新
+        delay = min(max(next_fetch - datetime.now().timestamp(), 1), 3600)
+        self.refresh_job = self.root.after(int(delay * 1000), self.scheduled_refresh)
+    
+    def scheduled_refresh(self):
+        """自动更新汇率"""
+        self.refresh_job = None
+        if self.rate_providers and self.rate_fetch is None and self.rate_schedule.is_due():
+            self.update_currency_rates(notify=False)
+        else:
+            self.schedule_rate_refresh()
+    
+    def apply_currency_rates(self):
+        """将汇率写入货币表"""
+        self.engine.set_rates(self.rates)
+        if self.currency_mode:
+            self.update_currency_list()
+    
+    def save_currency_rates(self):
+        """保存汇率到文件"""
+        write_rate_cache(self.rates_file, self.rates, self.last_update.timestamp(),
+                         self.rate_validators)
+    
+    def cancel_rate_update(self):
+        """取消汇率更新"""
+        if self.rate_fetch is not None:
+            self.rate_fetch.cancel()
+            self.rate_schedule.record(self.rate_fetch.count_sent(), False)
+        self.finish_rate_update()
+        self.schedule_rate_refresh()
+        self.status_var.set("已取消汇率更新")
+    
+    def finish_rate_update(self):
+        """退出汇率更新状态"""
+        self.rate_fetch = None
+        self.rate_progress.stop()
+        self.rate_progress.grid_remove()
+        self.update_btn.config(text="更新汇率", command=self.update_currency_rates)
     
     def get_currency_name(self, code):
         """根据代码获取货币名称"""
-        names = {
-            'USD': '美元',
-            'EUR': '欧元',
-            'RUB': '俄罗斯卢布',
-            'GBP': '英镑',
-            'JPY': '日元',
-            'CNY': '人民币',
-            'AUD': '澳元',
-            'CAD': '加元',
-            'CHF': '瑞士法郎',
-            'INR': '印度卢比',
-            'BRL': '巴西雷亚尔'
-        }
-        return names.get(code, code)
+        unit = self.engine.registry.get(code, "currency")
+        if unit is None:
+            return code
+        return unit.label.partition(" (")[2].rstrip(")") or code
+    
+    def update_currency_list(self):
+        """更新货币列表"""
+        currencies = list(self.engine.registry.category("currency").labels)
+        self.from_combo['values'] = currencies
+        self.to_combo['values'] = currencies
     
     def convert(self):
         """执行转换"""
@@ -548,9 +695,17 @@ class UniversalConverter:
             if not input_value:
                 raise ValueError("请输入要转换的值")
             
-            value = float(input_value)
+            try:
+                value = float(input_value)
+            except ValueError:
+                value = None
             
-            if self.currency_mode:
+            if value is None:
+                # 表达式, 例如 "3 ft 2 in to cm" 或 "12.5 psi -> bar"
+                result, category, to_unit = self.engine.evaluate(input_value)
+                self.add_to_history(make_record(self.engine.registry, EXPRESSION, category,
+                                                None, to_unit, input_value, result))
+            elif self.currency_mode:
                 from_unit = self.from_unit.get()
                 to_unit = self.to_unit.get()
                 
@@ -562,12 +717,14 @@ class UniversalConverter:
                     return
                 
                 # 检查货币是否在字典中
-                if from_unit not in self.currency_units or to_unit not in self.currency_units:
+                currencies = self.engine.registry.category("currency")
+                if currencies.get(from_unit) is None or currencies.get(to_unit) is None:
                     raise ValueError("选择的货币不存在")
                 
                 # 使用保存的值进行转换
-                result = value * (self.currency_units[to_unit] / self.currency_units[from_unit])
-                self.add_to_history(f"{value} {from_unit} → {result:.6f} {to_unit} (货币)")
+                result = self.engine.convert(value, currencies, from_unit, to_unit)
+                self.add_to_history(make_record(self.engine.registry, CURRENCY, currencies,
+                                                from_unit, to_unit, value, result))
             else:
                 category = self.current_category.get()
                 from_unit = self.from_unit.get()
@@ -580,24 +737,10 @@ class UniversalConverter:
                     self.result_value.set(value)
                     return
                     
-                if category == "温度":
-                    result = self.convert_temperature(value, from_unit, to_unit)
-                else:
-                    # 其他类别使用标准逻辑
-                    from_val = self.units[category][from_unit]
-                    to_val = self.units[category][to_unit]
-                    
-                    if callable(from_val):
-                        base = from_val(value, False)
-                    else:
-                        base = value * from_val
-                        
-                    if callable(to_val):
-                        result = to_val(base, True)
-                    else:
-                        result = base / to_val
+                result = self.engine.convert(value, category, from_unit, to_unit)
                 
-                self.add_to_history(f"{value} {from_unit} → {result:.6f} {to_unit} ({category})")
+                self.add_to_history(make_record(self.engine.registry, UNITS, category,
+                                                from_unit, to_unit, value, result))
             
             # 格式化结果(去除多余的零)
             formatted_result = "{0:.8f}".format(result).rstrip('0').rstrip('.') if '.' in "{0:.8f}".format(result) else str(result)
@@ -608,27 +751,6 @@ class UniversalConverter:
         except Exception as e:
             messagebox.showerror("错误", f"转换错误: {str(e)}")
     
-    def convert_temperature(self, value, from_unit, to_unit):
-        """温度转换"""
-        if from_unit == to_unit:
-            return value
-            
-        # 转换为摄氏度
-        if "华氏度" in from_unit:
-            celsius = (value - 32) * 5/9
-        elif "开尔文" in from_unit:
-            celsius = value - 273.15
-        else:
-            celsius = value
-            
-        # 从摄氏度转换
-        if "华氏度" in to_unit:
-            return celsius * 9/5 + 32
-        elif "开尔文" in to_unit:
-            return celsius + 273.15
-        else:
-            return celsius
-    
     def swap_units(self):
         """交换单位"""
         from_unit = self.from_unit.get()
@@ -638,55 +760,144 @@ class UniversalConverter:
         if self.result_value.get():
             self.convert()
     
-    def add_to_history(self, entry):
+    def add_to_history(self, record, save=True):
         """添加到历史记录"""
-        self.history.append(entry)
-        if len(self.history) > 20:
-            self.history.pop(0)
-        
-        self.history_text.config(state=tk.NORMAL)
-        self.history_text.delete(1.0, tk.END)
-        for i, item in enumerate(reversed(self.history), 1):
-            self.history_text.insert(tk.END, f"{i}. {item}\n")
-        self.history_text.config(state=tk.DISABLED)
-        self.history_text.see(tk.END)
+        visible = self.history.append(record)
+        if save:
+            # 一秒内由 flush_history() 写入日志
+            self.history_journal.append(record.as_dict())
+            if self.history_flush_job is None:
+                self.history_flush_job = self.root.after(1000, self.flush_history)
+        self.history_view.inserted(1 if visible else 0)
+    
+    def history_row(self, index):
+        """历史视图第 index 行的值, 最新的在前"""
+        number = self.history.visible_number(index)
+        record = self.history[number]
+        when = datetime.fromtimestamp(record.time).strftime('%Y年%m月%d日 %H:%M') if record.time else ""
+        return (number, when, describe(record, self.engine.registry))
+    
+    def search_history(self, *args):
+        """输入暂停后按搜索框中的词筛选历史记录"""
+        if self.history_search_job is not None:
+            self.root.after_cancel(self.history_search_job)
+        self.history_search_job = self.root.after(150, self.apply_history_search)
+    
+    def apply_history_search(self):
+        """将搜索应用到历史视图"""
+        self.history_search_job = None
+        self.history.search(Query(self.history_search.get(), self.engine.registry))
+        self.history_view.show(0)
     
     def clear_history(self):
         """清除历史记录"""
-        self.history = []
-        self.history_text.config(state=tk.NORMAL)
-        self.history_text.delete(1.0, tk.END)
-        self.history_text.config(state=tk.DISABLED)
+        self.history.clear()
+        try:
+            self.history_journal.clear()
+        except OSError as e:
+            self.status_var.set(f"保存历史记录失败: {str(e)}")
+        self.history_view.refresh()
     
     def save_history(self):
-        """保存历史记录到文件"""
+        """在后台线程中将历史记录导出到文件"""
+        if self.history_export is not None:
+            return
+        filetypes = [("文本文件", "*.txt"), ("CSV 文件", "*.csv"), ("JSON Lines 文件", "*.jsonl")]
+        if parquet_available():
+            filetypes.append(("Parquet 文件", "*.parquet"))
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".txt",
+            filetypes=filetypes + [("所有文件", "*.*")],
+            title="保存转换历史"
+        )
+        if not file_path:
+            return
+        
+        # 导出读取日志文件, 因此先写入待写入的记录
+        if self.history_flush_job is not None:
+            self.root.after_cancel(self.history_flush_job)
+        self.flush_history(wait=True)
+        self.history_export = HistoryExport(self.history_journal.path, file_path,
+                                            self.engine.registry, "转换历史记录")
+        self.save_btn.config(text="取消", command=self.cancel_history_export)
+        self.export_progress["value"] = 0.0
+        self.export_progress.pack(side=tk.LEFT, padx=5)
+        self.root.after(100, self.poll_history_export, self.history_export)
+    
+    def poll_history_export(self, export):
+        """显示历史记录导出的进度, 完成后显示结果"""
+        if export is not self.history_export:
+            return
+        self.export_progress["value"] = export.done
+        result = export.poll()
+        if result is None:
+            self.root.after(100, self.poll_history_export, export)
+            return
+        self.finish_history_export()
+        
         try:
-            file_path = filedialog.asksaveasfilename(
-                defaultextension=".txt",
-                filetypes=[("文本文件", "*.txt"), ("所有文件", "*.*")],
-                title="保存转换历史"
-            )
-            if file_path:
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write("转换历史记录:\n")
-                    f.write("="*50 + "\n")
-                    for i, item in enumerate(self.history, 1):
-                        f.write(f"{i}. {item}\n")
-                messagebox.showinfo("成功", "历史记录保存成功")
+            _, error = result
+            if error is not None:
+                raise error
+            messagebox.showinfo("成功", "历史记录保存成功")
         except Exception as e:
             messagebox.showerror("错误", f"保存失败: {str(e)}")
     
-    def load_history(self):
+    def cancel_history_export(self):
+        """取消历史记录导出"""
+        if self.history_export is not None:
+            self.history_export.cancel()
+        self.finish_history_export()
+        self.status_var.set("已取消历史记录导出")
+    
+    def finish_history_export(self):
+        """结束历史记录导出状态"""
+        self.history_export = None
+        self.export_progress.pack_forget()
+        self.save_btn.config(text="保存历史", command=self.save_history)
+    
+    def flush_history(self, wait=False):
+        """将待写入的历史记录写入日志文件"""
+        self.history_flush_job = None
+        try:
+            self.history_journal.flush(wait)
+        except OSError as e:
+            self.status_var.set(f"保存历史记录失败: {str(e)}")
+        # 日志压缩期间记录仍在队列中
+        if not wait and self.history_journal.pending:
+            self.history_flush_job = self.root.after(1000, self.flush_history)
+    
+    def load_history(self, prefetch=None):
         """从文件加载历史记录"""
         try:
-            if os.path.exists("converter_history.json"):
-                with open("converter_history.json", "r", encoding="utf-8") as f:
-                    self.history = json.load(f)
-                self.add_to_history("历史记录已加载")
-        except:
-            pass
+            if prefetch is not None:
+                records = prefetch.result()
+            else:
+                records = read_records(self.history_journal, self.HISTORY_LIMIT)
+        except (OSError, ValueError) as e:
+            self.status_var.set(f"加载历史记录错误: {str(e)}")
+            return
+        if records:
+            # 读取文件期间新增的记录仍是最新的
+            self.history.reset(records + list(self.history))
+            self.add_to_history(note("历史记录已加载"), save=False)
+    
+    def close(self):
+        """保存待写入的历史记录并关闭窗口"""
+        if self.history_export is not None:
+            self.history_export.cancel()
+        if self.history_flush_job is not None:
+            self.root.after_cancel(self.history_flush_job)
+        self.flush_history(wait=True)
+        self.root.destroy()
 
 if __name__ == "__main__":
+    # --timing 输出启动各阶段的耗时
+    timer = PhaseTimer(STARTED)
+    timer.mark("imports")
     root = tk.Tk()
-    app = UniversalConverter(root)
+    timer.mark("tk")
+    app = UniversalConverter(root, timer)
+    if "--timing" in sys.argv:
+        root.after_idle(timer.report)
     root.mainloop()
\ No newline at end of file
@@ -1,40 +1,85 @@
+import time
+STARTED = time.perf_counter()  # start of the imports, for --timing
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext, filedialog
+from tkinter import ttk, messagebox, filedialog
 import os
+import sys
 import json
 import math
-from datetime import datetime, timedelta
-import requests
+from datetime import datetime
+from converter_engine import ConversionEngine
+from converter_history import (CURRENCY, EXPRESSION, UNITS, History, Query, describe,
+                               make_record, note, read_records)
+from converter_history_export import HistoryExport, parquet_available
+from converter_history_journal import HistoryJournal
+from converter_providers import build_providers
+from converter_rate_cache import read_rates, write_rate_cache
+from converter_rate_history import RateHistory
+from converter_rates import RateClient, RateFetch, RefreshScheduler
+from converter_tasks import Background
+from converter_timing import PhaseTimer
+from converter_widgets import VirtualList
 
 class UniversalConverter:
-    def __init__(self, root):
+    def __init__(self, root, timer=None):
         self.root = root
+        self.timer = timer or PhaseTimer()
         self.root.title("UNIVERSAL CONVERTER V1")
         self.root.geometry("1000x750")
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         
         # API settings
         self.api_file = "converter_api.json"
-        self.rates_file = "currency_rates.json"
+        self.rates_file = "currency_rates.bin"
+        self.legacy_rates_file = "currency_rates.json"  # old JSON cache, read once when the binary cache is missing
+        self.rate_history_file = "currency_history.sqlite"
+        self.HISTORY_LIMIT = 100000  # entries kept in the history panel
+        # Every conversion is appended to this journal, written in batches
+        self.history_journal = HistoryJournal("converter_history.jsonl", keep=self.HISTORY_LIMIT)
+        self.history_flush_job = None
+        self.history_export = None  # running HistoryExport, None when idle
+        # Read the saved rates and history on worker threads while the window is built
+        self.startup_rates = Background(read_rates, self.rates_file, self.legacy_rates_file,
+                                        name="load-rates")
+        self.startup_history = Background(read_records, self.history_journal, self.HISTORY_LIMIT,
+                                          name="load-history")
+        # When to fetch rates next, within the monthly request quota
+        self.rate_schedule = RefreshScheduler("rate_schedule.json")
+        self.BASE_URL = "https://v6.exchangerate-api.com/v6/"  # "base_url" in converter_api.json overrides it
+        self.REQUEST_TIMEOUT = 10  # seconds, "timeout" in converter_api.json overrides it
+        self.provider_config = []  # extra rate sources, "providers" in converter_api.json
         self.API_KEY = self.load_api_key()
-        self.BASE_URL = "https://v6.exchangerate-api.com/v6/"
+        self.rate_client = RateClient(self.REQUEST_TIMEOUT)
+        self.build_rate_providers()
         self.rates = {}
         self.last_update = None
         self.currency_mode = False
+        self.rate_fetch = None
+        self.rate_notify = True
+        self.refresh_job = None
+        self.rate_validators = {}  # ETag / Last-Modified of the saved rates, per provider
 
         # Styles
         self.setup_styles()
+        self.timer.mark("styles")
         
         # All possible conversions
         self.units = self.load_units()
+        self.currency_units = self.load_currency_units()
+        self.engine = ConversionEngine(self.units, self.currency_units,
+                                       RateHistory(self.rate_history_file))
+        self.timer.mark("unit tables")
         
         # Variables
         self.setup_variables()
         
         # Create interface
         self.create_interface()
+        self.timer.mark("widgets")
         
         # Initialize data
         self.initialize_data()
+        self.timer.mark("data init")
 
     def setup_styles(self):
         """Set up interface styles"""
@@ -49,155 +94,147 @@ class UniversalConverter:
         self.style.configure('Currency.TButton', background='#90EE90', font=('Segoe UI', 10, 'bold'))
         self.style.configure('Normal.TButton', background='#ADD8E6', font=('Segoe UI', 10, 'bold'))
     
-    def load_units(self):
-        """Load all measurement units"""
-        units = {
+    @staticmethod
+    def load_units():
+        """Load display labels of all categories and units, keyed by unit ID"""
+        return {
             # Mass
-            "Mass": {
-                "Kilogram (kg)": 1.0,
-                "Gram (g)": 0.001,
-                "Milligram (mg)": 1e-6,
-                "Tonne (t)": 1000.0,
-                "Pound (lb)": 0.453592,
-                "Ounce (oz)": 0.0283495,
-                "Carat (ct)": 0.0002
-            },
+            "mass": "Mass",
+            "mass.kg": "Kilogram (kg)",
+            "mass.g": "Gram (g)",
+            "mass.mg": "Milligram (mg)",
+            "mass.t": "Tonne (t)",
+            "mass.lb": "Pound (lb)",
+            "mass.oz": "Ounce (oz)",
+            "mass.ct": "Carat (ct)",
             
             # Length
-            "Length": {
-                "Meter (m)": 1.0,
-                "Kilometer (km)": 1000.0,
-                "Centimeter (cm)": 0.01,
-                "Millimeter (mm)": 0.001,
-                "Micrometer (µm)": 1e-6,
-                "Inch (in)": 0.0254,
-                "Foot (ft)": 0.3048,
-                "Yard (yd)": 0.9144,
-                "Mile (mi)": 1609.34,
-                "Nautical mile (nmi)": 1852.0
-            },
+            "length": "Length",
+            "length.m": "Meter (m)",
+            "length.km": "Kilometer (km)",
+            "length.cm": "Centimeter (cm)",
+            "length.mm": "Millimeter (mm)",
+            "length.um": "Micrometer (µm)",
+            "length.in": "Inch (in)",
+            "length.ft": "Foot (ft)",
+            "length.yd": "Yard (yd)",
+            "length.mi": "Mile (mi)",
+            "length.nmi": "Nautical mile (nmi)",
             
             # Volume
-            "Volume": {
-                "Liter (L)": 1.0,
-                "Milliliter (mL)": 0.001,
-                "Gallon (gal)": 3.78541,
-                "Pint (pt)": 0.473176,
-                "Cubic meter (m³)": 1000.0,
-                "Cubic inch (in³)": 0.0163871,
-                "Teaspoon (tsp)": 0.00492892,
-                "Tablespoon (tbsp)": 0.0147868,
-                "Cup (cup)": 0.236588
-            },
+            "volume": "Volume",
+            "volume.L": "Liter (L)",
+            "volume.mL": "Milliliter (mL)",
+            "volume.gal": "Gallon (gal)",
+            "volume.pt": "Pint (pt)",
+            "volume.m3": "Cubic meter (m³)",
+            "volume.in3": "Cubic inch (in³)",
+            "volume.tsp": "Teaspoon (tsp)",
+            "volume.tbsp": "Tablespoon (tbsp)",
+            "volume.cup": "Cup (cup)",
             
             # Temperature
-            "Temperature": {
-                "Celsius (°C)": "celsius",
-                "Fahrenheit (°F)": "fahrenheit",
-                "Kelvin (K)": "kelvin"
-            },
+            "temperature": "Temperature",
+            "temperature.C": "Celsius (°C)",
+            "temperature.F": "Fahrenheit (°F)",
+            "temperature.K": "Kelvin (K)",
             
             # Area
-            "Area": {
-                "Square meter (m²)": 1.0,
-                "Square kilometer (km²)": 1e6,
-                "Square centimeter (cm²)": 0.0001,
-                "Hectare (ha)": 10000.0,
-                "Acre (ac)": 4046.86,
-                "Square mile (mi²)": 2.59e6,
-                "Square foot (ft²)": 0.092903
-            },
+            "area": "Area",
+            "area.m2": "Square meter (m²)",
+            "area.km2": "Square kilometer (km²)",
+            "area.cm2": "Square centimeter (cm²)",
+            "area.ha": "Hectare (ha)",
+            "area.ac": "Acre (ac)",
+            "area.mi2": "Square mile (mi²)",
+            "area.ft2": "Square foot (ft²)",
             
             # Speed
-            "Speed": {
-                "m/s": 1.0,
-                "km/h": 0.277778,
-                "mph": 0.44704,
-                "knots": 0.514444,
-                "Mach": 343.0
-            },
+            "speed": "Speed",
+            "speed.m/s": "m/s",
+            "speed.km/h": "km/h",
+            "speed.mph": "mph",
+            "speed.knots": "knots",
+            "speed.Mach": "Mach",
             
             # Data
-            "Data": {
-                "Bit (bit)": 1.0,
-                "Byte (B)": 8.0,
-                "Kilobyte (KB)": 8192.0,
-                "Megabyte (MB)": 8388608.0,
-                "Gigabyte (GB)": 8589934592.0,
-                "Terabyte (TB)": 8796093022208.0
-            },
+            "data": "Data",
+            "data.bit": "Bit (bit)",
+            "data.B": "Byte (B)",
+            "data.KB": "Kilobyte (KB)",
+            "data.MB": "Megabyte (MB)",
+            "data.GB": "Gigabyte (GB)",
+            "data.TB": "Terabyte (TB)",
             
             # Energy
-            "Energy": {
-                "Joule (J)": 1.0,
-                "Kilojoule (kJ)": 1000.0,
-                "Calorie (cal)": 4.184,
-                "Kilocalorie (kcal)": 4184.0,
-                "kWh": 3600000.0,
-                "Electronvolt (eV)": 1.60218e-19
-            },
+            "energy": "Energy",
+            "energy.J": "Joule (J)",
+            "energy.kJ": "Kilojoule (kJ)",
+            "energy.cal": "Calorie (cal)",
+            "energy.kcal": "Kilocalorie (kcal)",
+            "energy.kWh": "kWh",
+            "energy.eV": "Electronvolt (eV)",
             
             # Pressure
-            "Pressure": {
-                "Pascal (Pa)": 1.0,
-                "Bar (bar)": 100000.0,
-                "Atmosphere (atm)": 101325.0,
-                "mmHg": 133.322,
-                "PSI": 6894.76
-            },
+            "pressure": "Pressure",
+            "pressure.Pa": "Pascal (Pa)",
+            "pressure.bar": "Bar (bar)",
+            "pressure.atm": "Atmosphere (atm)",
+            "pressure.mmHg": "mmHg",
+            "pressure.psi": "PSI",
             
             # Time
-            "Time": {
-                "Second (s)": 1.0,
-                "Minute (min)": 60.0,
-                "Hour (h)": 3600.0,
-                "Day": 86400.0,
-                "Week": 604800.0,
-                "Year": 31536000.0
-            },
+            "time": "Time",
+            "time.s": "Second (s)",
+            "time.min": "Minute (min)",
+            "time.h": "Hour (h)",
+            "time.day": "Day",
+            "time.week": "Week",
+            "time.year": "Year",
             
             # Radiation
-            "Radiation": {
-                "Sievert (Sv)": 1.0,
-                "Rem (rem)": 0.01,
-                "Rad (rad)": 0.01,
-                "Gray (Gy)": 1.0,
-                "Roentgen (R)": 0.00933
-            },
+            "radiation": "Radiation",
+            "radiation.Sv": "Sievert (Sv)",
+            "radiation.rem": "Rem (rem)",
+            "radiation.rad": "Rad (rad)",
+            "radiation.Gy": "Gray (Gy)",
+            "radiation.R": "Roentgen (R)",
             
             # Astronomy
-            "Astronomy": {
-                "Light year (ly)": 1.0,
-                "Astronomical unit (AU)": 63241.1,
-                "Parsec (pc)": 3.26156,
-                "Kilometer (km)": 9.461e12,
-                "Lunar distance (LD)": 384400.0
-            },
+            "astronomy": "Astronomy",
+            "astronomy.ly": "Light year (ly)",
+            "astronomy.AU": "Astronomical unit (AU)",
+            "astronomy.pc": "Parsec (pc)",
+            "astronomy.km": "Kilometer (km)",
+            "astronomy.LD": "Lunar distance (LD)",
             
             # Cooking
-            "Cooking": {
-                "Gram (g)": 1.0,
-                "Kilogram (kg)": 1000.0,
-                "Ounce (oz)": 28.3495,
-                "Pound (lb)": 453.592,
-                "Teaspoon (tsp)": 5.0,
-                "Tablespoon (tbsp)": 15.0,
-                "Cup (cup)": 240.0,
-                "Milliliter (mL)": 1.0,
-                "Liter (L)": 1000.0
-            },
+            "cooking": "Cooking",
+            "cooking.g": "Gram (g)",
+            "cooking.kg": "Kilogram (kg)",
+            "cooking.oz": "Ounce (oz)",
+            "cooking.lb": "Pound (lb)",
+            "cooking.tsp": "Teaspoon (tsp)",
+            "cooking.tbsp": "Tablespoon (tbsp)",
+            "cooking.cup": "Cup (cup)",
+            "cooking.mL": "Milliliter (mL)",
+            "cooking.L": "Liter (L)",
             
             # Angles
-            "Angles": {
-                "Degree (°)": 1.0,
-                "Radian (rad)": 57.2958,
-                "Gradian (grad)": 0.9,
-                "Revolution (rev)": 360.0
-            }
+            "angles": "Angles",
+            "angles.deg": "Degree (°)",
+            "angles.rad": "Radian (rad)",
+            "angles.grad": "Gradian (grad)",
+            "angles.rev": "Revolution (rev)",
+            
+            # Currency
+            "currency": "Currency"
         }
-        
-        # Currency units separately
-        self.currency_units = {
+    
+    @staticmethod
+    def load_currency_units():
+        """Load currency units"""
+        return {
             "USD (US Dollar)": 1.0,
             "EUR (Euro)": 0.85,
             "RUB (Russian Ruble)": 75.0,
@@ -210,8 +247,6 @@ class UniversalConverter:
             "INR (Indian Rupee)": 75.0,
             "BRL (Brazilian Real)": 5.25
         }
-        
-        return units
     
     def setup_variables(self):
         """Initialize variables"""
@@ -221,8 +256,11 @@ class UniversalConverter:
         self.input_value = tk.StringVar(value="1.0")
         self.result_value = tk.StringVar(value="")
         self.status_var = tk.StringVar(value="Ready")
+        self.schedule_var = tk.StringVar(value="")
         self.api_key_var = tk.StringVar(value=self.API_KEY or "")
-        self.history = []
+        self.history = History(self.HISTORY_LIMIT, self.engine.registry)
+        self.history_search = tk.StringVar(value="")
+        self.history_search_job = None
     
     def create_interface(self):
         """Create interface"""
@@ -254,12 +292,20 @@ class UniversalConverter:
         ttk.Button(self.api_frame, text="Save API", 
                   command=self.save_api_key).grid(row=0, column=2, padx=5, pady=5)
         
-        ttk.Button(self.api_frame, text="Update Rates", 
-                  command=self.update_currency_rates).grid(row=0, column=3, padx=5, pady=5)
+        self.update_btn = ttk.Button(self.api_frame, text="Update Rates", 
+                                     command=self.update_currency_rates)
+        self.update_btn.grid(row=0, column=3, padx=5, pady=5)
         
         ttk.Button(self.api_frame, text="Instructions", 
                   command=self.show_api_instructions).grid(row=0, column=4, padx=5, pady=5)
         
+        # Shown while rates are being fetched
+        self.rate_progress = ttk.Progressbar(self.api_frame, mode='indeterminate', length=80)
+        
+        # Next scheduled rate update and the monthly request count
+        ttk.Label(self.api_frame, textvariable=self.schedule_var).grid(
+            row=1, column=0, columnspan=6, padx=5, sticky=tk.W)
+        
         # Conversion frame
         self.conv_frame = ttk.LabelFrame(main_frame, text="Conversion")
         self.conv_frame.pack(fill=tk.X, pady=5)
@@ -269,7 +315,7 @@ class UniversalConverter:
         self.category_combo = ttk.Combobox(
             self.conv_frame, 
             textvariable=self.current_category, 
-            values=list(self.units.keys()), 
+            values=self.engine.registry.category_labels(), 
             state="readonly", 
             width=25
         )
@@ -309,13 +355,19 @@ class UniversalConverter:
         ttk.Label(main_frame, textvariable=self.status_var, font=('Segoe UI', 9)).pack(anchor=tk.W)
         
         # History
-        history_frame = ttk.LabelFrame(main_frame, text="Conversion History (last 20)")
+        history_frame = ttk.LabelFrame(main_frame, text="Conversion History")
         history_frame.pack(fill=tk.BOTH, expand=True, pady=10)
         
-        self.history_text = scrolledtext.ScrolledText(history_frame, wrap=tk.WORD, 
-                                                    font=('Consolas', 9))
-        self.history_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        self.history_text.config(state=tk.DISABLED)
+        # History search
+        search_frame = ttk.Frame(history_frame)
+        search_frame.pack(fill=tk.X, padx=5, pady=(5, 0))
+        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT)
+        ttk.Entry(search_frame, textvariable=self.history_search).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.history_search.trace_add("write", self.search_history)
+        
+        self.history_view = VirtualList(history_frame, [("#", 70), ("Time", 130), ("Conversion", 600)],
+                                        count=self.history.visible, row=self.history_row)
+        self.history_view.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
         # History buttons
         history_btn_frame = ttk.Frame(history_frame)
@@ -323,20 +375,30 @@ class UniversalConverter:
 
         ttk.Button(history_btn_frame, text="Clear History", 
                   command=self.clear_history).pack(side=tk.LEFT, padx=5)
-        ttk.Button(history_btn_frame, text="Save History", 
-                  command=self.save_history).pack(side=tk.LEFT, padx=5)
+        self.save_btn = ttk.Button(history_btn_frame, text="Save History", 
+                                   command=self.save_history)
+        self.save_btn.pack(side=tk.LEFT, padx=5)
+        self.export_progress = ttk.Progressbar(history_btn_frame, mode='determinate',
+                                               length=150, maximum=1.0)
         
         # Exit button
         btn_frame = ttk.Frame(main_frame)
         btn_frame.pack(fill=tk.X, pady=5)
         
         ttk.Button(btn_frame, text="Exit", 
-                  command=self.root.quit).pack(side=tk.RIGHT)
+                  command=self.close).pack(side=tk.RIGHT)
     
     def toggle_currency_mode(self):
         """Toggle between regular and currency converter"""
         self.currency_mode = not self.currency_mode
+        self.apply_mode()
         
+        # Clear input field when switching modes
+        self.input_value.set("1.0")
+        self.result_value.set("")
+    
+    def apply_mode(self):
+        """Lay out the widgets of the current mode"""
         if self.currency_mode:
             self.mode_btn.config(text="Regular Converter", style='Normal.TButton')
             self.api_frame.pack(fill=tk.X, pady=5, before=self.conv_frame)
@@ -346,12 +408,11 @@ class UniversalConverter:
             self.category_combo.grid_forget()
             
             # Update units for currencies
-            self.from_combo['values'] = list(self.currency_units.keys())
-            self.to_combo['values'] = list(self.currency_units.keys())
+            self.update_currency_list()
             
-            if not self.from_unit.get() or self.from_unit.get() not in self.currency_units:
+            if self.engine.registry.get(self.from_unit.get(), "currency") is None:
                 self.from_unit.set("USD (US Dollar)")
-            if not self.to_unit.get() or self.to_unit.get() not in self.currency_units:
+            if self.engine.registry.get(self.to_unit.get(), "currency") is None:
                 self.to_unit.set("EUR (Euro)")
         else:
             self.mode_btn.config(text="Currency Converter", style='Currency.TButton')
@@ -367,18 +428,23 @@ class UniversalConverter:
         # Update layout
         self.units_frame.grid(row=1, column=0, columnspan=3, sticky=tk.EW, pady=5)
         self.value_frame.grid(row=2, column=0, columnspan=3, sticky=tk.EW, pady=5)
-        
-        # Clear input field when switching modes
-        self.input_value.set("1.0")
-        self.result_value.set("")
     
     def initialize_data(self):
         """Initialize data on startup"""
-        self.load_currency_rates()
-        self.update_units()
-        self.load_history()
-        self.toggle_currency_mode()  # Start with regular mode
-        self.toggle_currency_mode()  # Toggle back for proper initialization
+        # Regular mode is laid out once; rates and history arrive from the startup threads
+        self.apply_mode()
+        self.poll_startup()
+    
+    def poll_startup(self):
+        """Apply the rates and history read at startup as they arrive"""
+        if self.startup_rates is not None and self.startup_rates.poll() is not None:
+            self.load_currency_rates(self.startup_rates)
+            self.startup_rates = None
+        if self.startup_history is not None and self.startup_history.poll() is not None:
+            self.load_history(self.startup_history)
+            self.startup_history = None
+        if self.startup_rates is not None or self.startup_history is not None:
+            self.root.after(20, self.poll_startup)
     
     def update_units(self, event=None):
         """Update list of units"""
@@ -386,7 +452,7 @@ class UniversalConverter:
             return
             
         category = self.current_category.get()
-        units = list(self.units[category].keys())
+        units = list(self.engine.registry.category(category).labels)
         
         self.from_combo['values'] = units
         self.to_combo['values'] = units
@@ -403,6 +469,9 @@ class UniversalConverter:
             if os.path.exists(self.api_file):
                 with open(self.api_file, 'r') as f:
                     data = json.load(f)
+                    self.REQUEST_TIMEOUT = data.get('timeout', self.REQUEST_TIMEOUT)
+                    self.BASE_URL = data.get('base_url', self.BASE_URL)
+                    self.provider_config = data.get('providers', self.provider_config)
                     return data.get('api_key', "")
         except Exception as e:
             print(f"Error loading API key: {e}")
@@ -411,14 +480,25 @@ class UniversalConverter:
     def save_api_key(self):
         """Save API key to file"""
         self.API_KEY = self.api_key_var.get().strip()
+        self.build_rate_providers()
         try:
             with open(self.api_file, 'w') as f:
-                json.dump({'api_key': self.API_KEY}, f)
+                json.dump({'api_key': self.API_KEY, 'timeout': self.REQUEST_TIMEOUT,
+                           'base_url': self.BASE_URL, 'providers': self.provider_config}, f)
             messagebox.showinfo("Success", "API key saved!")
             self.load_currency_rates()  # Try to load rates with new key
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save key: {str(e)}")
     
+    def build_rate_providers(self):
+        """Rate sources: the API when a key is set, then those of converter_api.json"""
+        api_url = f"{self.BASE_URL}{self.API_KEY}/latest/USD" if self.API_KEY else None
+        try:
+            self.rate_providers = build_providers(self.provider_config, api_url, self.rate_client)
+        except (KeyError, ValueError) as e:
+            print(f"Error in rate providers: {e}")
+            self.rate_providers = build_providers((), api_url, self.rate_client)
+    
     def show_api_instructions(self):
         """Show API key instructions"""
         instructions = """
@@ -436,110 +516,177 @@ class UniversalConverter:
         """
         messagebox.showinfo("API Key Instructions", instructions)
     
-    def load_currency_rates(self):
+    def load_currency_rates(self, prefetch=None):
         """Load currency rates from file or API"""
         try:
             # Try to load from file
-            if os.path.exists(self.rates_file):
-                with open(self.rates_file, 'r') as f:
-                    data = json.load(f)
-                    last_update = datetime.strptime(data['last_update'], '%Y-%m-%d')
-                    
-                    # If last update was less than 7 days ago
-                    if datetime.now() - last_update < timedelta(days=7):
-                        self.rates = data['rates']
-                        self.last_update = last_update
-                        self.status_var.set(f"Rates loaded from file ({last_update.strftime('%m/%d/%Y')})")
-                        
-                        # Update coefficients in currency_units
-                        for curr, rate in self.rates.items():
-                            # Find currency in currency_units by code (start of string)
-                            for key in list(self.currency_units.keys()):
-                                if key.startswith(curr + " "):
-                                    self.currency_units[key] = rate
-                                    break
-                        return
-            
-            # If no file or data is stale, but we have API key - update
-            if self.API_KEY:
-                self.update_currency_rates()
+            if prefetch is not None:
+                cache = prefetch.result()
             else:
+                cache = read_rates(self.rates_file, self.legacy_rates_file)
+            if cache is not None:
+                self.rates, self.rate_validators, last_update = cache
+                self.last_update = last_update
+                self.status_var.set(f"Rates loaded from file ({last_update.strftime('%m/%d/%Y')})")
+                self.apply_currency_rates()
+            elif not self.rates:
                 self.status_var.set("Using saved rates (not updated)")
-                
         except Exception as e:
             self.status_var.set(f"Error loading rates: {str(e)}")
             # Use default saved values
+        
+        # Fetch when the scheduler says new rates are due
+        if self.rate_providers and self.rate_schedule.is_due():
+            self.update_currency_rates(notify=False)
+        self.schedule_rate_refresh()
     
-    def update_currency_rates(self):
+    def update_currency_rates(self, notify=True):
         """Update currency rates via API"""
-        if not self.API_KEY:
+        if not self.rate_providers:
             messagebox.showwarning("Error", "Enter API key to update rates")
             return
             
+        if self.rate_fetch is not None:
+            return
+        if not self.rate_schedule.remaining():
+            when = datetime.fromtimestamp(self.rate_schedule.next_fetch()).strftime('%m/%d/%Y %H:%M')
+            messagebox.showwarning("Error", f"Monthly request limit used up, next update {when}")
+            return
+        
+        # The request runs on a worker thread, the window stays responsive
+        self.status_var.set("Updating rates...")
+        self.update_btn.config(text="Cancel", command=self.cancel_rate_update)
+        self.rate_progress.grid(row=0, column=5, padx=5, pady=5)
+        self.rate_progress.start(10)
+        self.rate_notify = notify
+        self.rate_fetch = RateFetch(self.rate_providers, self.rate_validators)
+        self.root.after(100, self.poll_rate_update, self.rate_fetch)
+    
+    def poll_rate_update(self, fetch):
+        """Pick up the result of the background rate fetch"""
+        if fetch is not self.rate_fetch:
+            return
+        result = fetch.poll()
+        if result is None:
+            self.root.after(100, self.poll_rate_update, fetch)
+            return
+        self.finish_rate_update()
+        self.record_rate_fetch(fetch, result)
+        
         try:
-            self.status_var.set("Updating rates...")
-            self.root.update()
+            response, error = result
+            if error is not None:
+                raise error
+            self.rate_validators[response.provider] = response.validators
             
-            response = requests.get(f"{self.BASE_URL}{self.API_KEY}/latest/USD")
-            data = response.json()
+            if response.not_modified:
+                # 304: the saved rates are still current, only their age is reset
+                self.last_update = datetime.now()
+                self.apply_currency_rates()
+                self.save_currency_rates()
+                self.status_var.set(f"Rates are up to date ({self.last_update.strftime('%m/%d/%Y')})")
+                return
+            data = response.data
             
             if data['result'] == 'success':
-                self.rates = {
-                    'USD': 1.0,
-                    'EUR': data['conversion_rates']['EUR'],
-                    'RUB': data['conversion_rates']['RUB'],
-                    'GBP': data['conversion_rates']['GBP'],
-                    'JPY': data['conversion_rates']['JPY'],
-                    'CNY': data['conversion_rates']['CNY'],
-                    'AUD': data['conversion_rates']['AUD'],
-                    'CAD': data['conversion_rates']['CAD'],
-                    'CHF': data['conversion_rates']['CHF'],
-                    'INR': data['conversion_rates']['INR'],
-                    'BRL': data['conversion_rates']['BRL']
-                }
+                self.rates = data['conversion_rates']
                 
-                # Update coefficients in currency_units
-                for curr, rate in self.rates.items():
-                    for key in list(self.currency_units.keys()):
-                        if key.startswith(curr + " "):
-                            self.currency_units[key] = rate
-                            break
+                self.apply_currency_rates()
+                # Every fetched snapshot is kept for as-of conversions
+                self.engine.history.add(self.rates, data.get('time_last_update_unix'))
                 
                 # Save to file
                 self.last_update = datetime.now()
-                with open(self.rates_file, 'w') as f:
-                    json.dump({
-                        'rates': self.rates,
-                        'last_update': self.last_update.strftime('%Y-%m-%d')
-                    }, f)
+                self.save_currency_rates()
                 
                 self.status_var.set(f"Rates updated ({self.last_update.strftime('%m/%d/%Y')})")
-                messagebox.showinfo("Success", "Currency rates updated successfully!")
+                if self.rate_notify:
+                    messagebox.showinfo("Success", "Currency rates updated successfully!")
             else:
                 error_msg = data.get('error-type', 'Unknown error')
                 self.status_var.set(f"API Error: {error_msg}")
-                messagebox.showerror("API Error", f"Failed to update rates: {error_msg}")
+                if self.rate_notify:
+                    messagebox.showerror("API Error", f"Failed to update rates: {error_msg}")
                 
         except Exception as e:
             self.status_var.set(f"Update error: {str(e)}")
-            messagebox.showerror("Error", f"Failed to update rates: {str(e)}")
+            if self.rate_notify:
+                messagebox.showerror("Error", f"Failed to update rates: {str(e)}")
+    
+    def record_rate_fetch(self, fetch, result):
+        """Count the fetch against the quota and plan the next one"""
+        response, error = result
+        success = error is None and (response.not_modified or (
+            isinstance(response.data, dict) and response.data.get('result') == 'success'))
+        next_update = None
+        if success and not response.not_modified:
+            next_update = response.data.get('time_next_update_unix')
+        self.rate_schedule.record(fetch.count_sent(), success, next_update)
+        self.schedule_rate_refresh()
+    
+    def schedule_rate_refresh(self):
+        """Plan the next automatic rate update and show when it happens"""
+        if self.refresh_job is not None:
+            self.root.after_cancel(self.refresh_job)
+            self.refresh_job = None
+        if not self.rate_providers:
+            self.schedule_var.set("")
+            return
+        next_fetch = self.rate_schedule.next_fetch()
+        when = datetime.fromtimestamp(next_fetch).strftime('%m/%d/%Y %H:%M')
+        used = self.rate_schedule.quota - self.rate_schedule.remaining()
+        self.schedule_var.set(f"Next update: {when} · {used}/{self.rate_schedule.quota} requests this month")
+        # Re-checked at least hourly, so a sleeping computer does not delay it
+        delay = min(max(next_fetch - datetime.now().timestamp(), 1), 3600)
+        self.refresh_job = self.root.after(int(delay * 1000), self.scheduled_refresh)
+    
+    def scheduled_refresh(self):
+        """Automatic rate update"""
+        self.refresh_job = None
+        if self.rate_providers and self.rate_fetch is None and self.rate_schedule.is_due():
+            self.update_currency_rates(notify=False)
+        else:
+            self.schedule_rate_refresh()
+    
+    def apply_currency_rates(self):
+        """Put the loaded rates into the currency table"""
+        self.engine.set_rates(self.rates)
+        if self.currency_mode:
+            self.update_currency_list()
+    
+    def save_currency_rates(self):
+        """Save rates to file"""
+        write_rate_cache(self.rates_file, self.rates, self.last_update.timestamp(),
+                         self.rate_validators)
+    
+    def cancel_rate_update(self):
+        """Cancel the rate update"""
+        if self.rate_fetch is not None:
+            self.rate_fetch.cancel()
+            self.rate_schedule.record(self.rate_fetch.count_sent(), False)
+        self.finish_rate_update()
+        self.schedule_rate_refresh()
+        self.status_var.set("Rate update cancelled")
+    
+    def finish_rate_update(self):
+        """Leave the in-progress state of the rate update"""
+        self.rate_fetch = None
+        self.rate_progress.stop()
+        self.rate_progress.grid_remove()
+        self.update_btn.config(text="Update Rates", command=self.update_currency_rates)
     
     def get_currency_name(self, code):
         """Get currency name by code"""
-        names = {
-            'USD': 'US Dollar',
-            'EUR': 'Euro',
-            'RUB': 'Russian Ruble',
-            'GBP': 'British Pound',
-            'JPY': 'Japanese Yen',
-            'CNY': 'Chinese Yuan',
-            'AUD': 'Australian Dollar',
-            'CAD': 'Canadian Dollar',
-            'CHF': 'Swiss Franc',
-            'INR': 'Indian Rupee',
-            'BRL': 'Brazilian Real'
-        }
-        return names.get(code, code)
+        unit = self.engine.registry.get(code, "currency")
+        if unit is None:
+            return code
+        return unit.label.partition(" (")[2].rstrip(")") or code
+    
+    def update_currency_list(self):
+        """Update the currency lists of the unit comboboxes"""
+        currencies = list(self.engine.registry.category("currency").labels)
+        self.from_combo['values'] = currencies
+        self.to_combo['values'] = currencies
     
     def convert(self):
         """Perform conversion"""
@@ -548,9 +695,17 @@ class UniversalConverter:
             if not input_value:
                 raise ValueError("Enter a value to convert")
             
-            value = float(input_value)
+            try:
+                value = float(input_value)
+            except ValueError:
+                value = None
             
-            if self.currency_mode:
+            if value is None:
+                # Expression such as "3 ft 2 in to cm" or "12.5 psi -> bar"
+                result, category, to_unit = self.engine.evaluate(input_value)
+                self.add_to_history(make_record(self.engine.registry, EXPRESSION, category,
+                                                None, to_unit, input_value, result))
+            elif self.currency_mode:
                 from_unit = self.from_unit.get()
                 to_unit = self.to_unit.get()
                 
@@ -562,12 +717,14 @@ class UniversalConverter:
                     return
                 
                 # Check if currencies exist in dictionary
-                if from_unit not in self.currency_units or to_unit not in self.currency_units:
+                currencies = self.engine.registry.category("currency")
+                if currencies.get(from_unit) is None or currencies.get(to_unit) is None:
                     raise ValueError("Selected currencies not found")
                 
                 # Conversion using saved values
-                result = value * (self.currency_units[to_unit] / self.currency_units[from_unit])
-                self.add_to_history(f"{value} {from_unit} → {result:.6f} {to_unit} (Currency)")
+                result = self.engine.convert(value, currencies, from_unit, to_unit)
+                self.add_to_history(make_record(self.engine.registry, CURRENCY, currencies,
+                                                from_unit, to_unit, value, result))
             else:
                 category = self.current_category.get()
                 from_unit = self.from_unit.get()
@@ -580,24 +737,10 @@ class UniversalConverter:
                     self.result_value.set(value)
                     return
                     
-                if category == "Temperature":
-                    result = self.convert_temperature(value, from_unit, to_unit)
-                else:
-                    # For other categories use standard logic
-                    from_val = self.units[category][from_unit]
-                    to_val = self.units[category][to_unit]
-                    
-                    if callable(from_val):
-                        base = from_val(value, False)
-                    else:
-                        base = value * from_val
-                        
-                    if callable(to_val):
-                        result = to_val(base, True)
-                    else:
-                        result = base / to_val
+                result = self.engine.convert(value, category, from_unit, to_unit)
                 
-                self.add_to_history(f"{value} {from_unit} → {result:.6f} {to_unit} ({category})")
+                self.add_to_history(make_record(self.engine.registry, UNITS, category,
+                                                from_unit, to_unit, value, result))
             
             # Format result (remove trailing zeros)
             formatted_result = "{0:.8f}".format(result).rstrip('0').rstrip('.') if '.' in "{0:.8f}".format(result) else str(result)
@@ -608,27 +751,6 @@ class UniversalConverter:
         except Exception as e:
             messagebox.showerror("Error", f"Conversion error: {str(e)}")
     
-    def convert_temperature(self, value, from_unit, to_unit):
-        """Convert temperature"""
-        if from_unit == to_unit:
-            return value
-            
-        # Convert to Celsius
-        if "Fahrenheit" in from_unit:
-            celsius = (value - 32) * 5/9
-        elif "Kelvin" in from_unit:
-            celsius = value - 273.15
-        else:
-            celsius = value
-            
-        # Convert from Celsius
-        if "Fahrenheit" in to_unit:
-            return celsius * 9/5 + 32
-        elif "Kelvin" in to_unit:
-            return celsius + 273.15
-        else:
-            return celsius
-    
     def swap_units(self):
         """Swap units"""
         from_unit = self.from_unit.get()
@@ -638,55 +760,152 @@ class UniversalConverter:
         if self.result_value.get():
             self.convert()
     
-    def add_to_history(self, entry):
+    def add_to_history(self, record, save=True):
         """Add entry to history"""
-        self.history.append(entry)
-        if len(self.history) > 20:
-            self.history.pop(0)
-        
-        self.history_text.config(state=tk.NORMAL)
-        self.history_text.delete(1.0, tk.END)
-        for i, item in enumerate(reversed(self.history), 1):
-            self.history_text.insert(tk.END, f"{i}. {item}\n")
-        self.history_text.config(state=tk.DISABLED)
-        self.history_text.see(tk.END)
+        visible = self.history.append(record)
+        if save:
+            # Written to the journal by flush_history() within a second
+            self.history_journal.append(record.as_dict())
+            if self.history_flush_job is None:
+                self.history_flush_job = self.root.after(1000, self.flush_history)
+        self.history_view.inserted(1 if visible else 0)
+    
+    def history_row(self, index):
+        """Values of row index of the history view, newest entry first"""
+        number = self.history.visible_number(index)
+        record = self.history[number]
+        when = datetime.fromtimestamp(record.time).strftime('%m/%d/%Y %H:%M') if record.time else ""
+        return (number, when, describe(record, self.engine.registry))
+    
+    def search_history(self, *args):
+        """Filter the history by the words of the search box, once typing pauses"""
+        if self.history_search_job is not None:
+            self.root.after_cancel(self.history_search_job)
+        self.history_search_job = self.root.after(150, self.apply_history_search)
+    
+    def apply_history_search(self):
+        """Apply the search box to the history view"""
+        self.history_search_job = None
+        self.history.search(Query(self.history_search.get(), self.engine.registry))
+        self.history_view.show(0)
     
     def clear_history(self):
         """Clear history"""
-        self.history = []
-        self.history_text.config(state=tk.NORMAL)
-        self.history_text.delete(1.0, tk.END)
-        self.history_text.config(state=tk.DISABLED)
+        self.history.clear()
+        try:
+            self.history_journal.clear()
+        except OSError as e:
+            self.status_var.set(f"Failed to save history: {str(e)}")
+        self.history_view.refresh()
     
     def save_history(self):
-        """Save history to file"""
+        """Export history to a file on a worker thread"""
+        if self.history_export is not None:
+            return
+        filetypes = [("Text files", "*.txt"), ("CSV files", "*.csv"), ("JSON Lines files", "*.jsonl")]
+        if parquet_available():
+            filetypes.append(("Parquet files", "*.parquet"))
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".txt",
+            filetypes=filetypes + [("All files", "*.*")],
+            title="Save Conversion History"
+        )
+        if not file_path:
+            return
+        
+        # The export reads the journal, so queued entries are written first
+        if self.history_flush_job is not None:
+            self.root.after_cancel(self.history_flush_job)
+        self.flush_history(wait=True)
+        self.history_export = HistoryExport(self.history_journal.path, file_path,
+                                            self.engine.registry, "Conversion History")
+        self.save_btn.config(text="Cancel", command=self.cancel_history_export)
+        self.export_progress["value"] = 0.0
+        self.export_progress.pack(side=tk.LEFT, padx=5)
+        self.root.after(100, self.poll_history_export, self.history_export)
+    
+    def poll_history_export(self, export):
+        """Show the progress of the history export, then its result"""
+        if export is not self.history_export:
+            return
+        self.export_progress["value"] = export.done
+        result = export.poll()
+        if result is None:
+            self.root.after(100, self.poll_history_export, export)
+            return
+        self.finish_history_export()
+        
         try:
-            file_path = filedialog.asksaveasfilename(
-                defaultextension=".txt",
-                filetypes=[("Text files", "*.txt"), ("All files", "*.*")],
-                title="Save Conversion History"
-            )
-            if file_path:
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write("Conversion History:\n")
-                    f.write("="*50 + "\n")
-                    for i, item in enumerate(self.history, 1):
-                        f.write(f"{i}. {item}\n")
-                messagebox.showinfo("Success", "History saved successfully")
+            _, error = result
+            if error is not None:
+                raise error
+            messagebox.showinfo("Success", "History saved successfully")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save: {str(e)}")
     
-    def load_history(self):
+    def cancel_history_export(self):
+        """Cancel the history export"""
+        if self.history_export is not None:
+            self.history_export.cancel()
+        self.finish_history_export()
+        self.status_var.set("History export cancelled")
+    
+    def finish_history_export(self):
+        """Leave the in-progress state of the history export"""
+        self.history_export = None
+        self.export_progress.pack_forget()
+        self.save_btn.config(text="Save History", command=self.save_history)
+    
+    def flush_history(self, wait=False):
+        """Write queued history entries to the journal"""
+        self.history_flush_job = None
+        try:
+            self.history_journal.flush(wait)
+        except OSError as e:
+            self.status_var.set(f"Failed to save history: {str(e)}")
+        # Still queued while the journal is being compacted
+        if not wait and self.history_journal.pending:
+            self.history_flush_job = self.root.after(1000, self.flush_history)
+    
+    def load_history(self, prefetch=None):
         """Load history from file"""
         try:
-            if os.path.exists("converter_history.json"):
-                with open("converter_history.json", "r", encoding="utf-8") as f:
-                    self.history = json.load(f)
-                self.add_to_history("History loaded")
-        except:
-            pass
+            if prefetch is not None:
+                records = prefetch.result()
+            else:
+                records = read_records(self.history_journal, self.HISTORY_LIMIT)
+        except (OSError, ValueError) as e:
+            self.status_var.set(f"Error loading history: {str(e)}")
+            return
+        if records:
+            # Entries added while the file was being read stay the newest
+            self.history.reset(records + list(self.history))
+            self.add_to_history(note("History loaded"), save=False)
+    
+    def close(self):
+        """Save pending history and close the window"""
+        if self.history_export is not None:
+            self.history_export.cancel()
+        if self.history_flush_job is not None:
+            self.root.after_cancel(self.history_flush_job)
+        self.flush_history(wait=True)
+        self.root.destroy()
 
 if __name__ == "__main__":
+    timing = "--timing" in sys.argv  # print how long each startup phase took
+    if timing:
+        sys.argv.remove("--timing")
+
+    # Batch mode: python universal_converter_EN.py data.csv --column ... --category ...
+    if len(sys.argv) > 1:
+        import converter_batch
+        sys.exit(converter_batch.main(sys.argv[1:], UniversalConverter.load_units()))
+
+    timer = PhaseTimer(STARTED)
+    timer.mark("imports")
     root = tk.Tk()
-    app = UniversalConverter(root)
+    timer.mark("tk")
+    app = UniversalConverter(root, timer)
+    if timing:
+        root.after_idle(timer.report)
     root.mainloop()
\ No newline at end of file
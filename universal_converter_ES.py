@@ -1,40 +1,85 @@
+import time
+STARTED = time.perf_counter()  # inicio de las importaciones, para --timing
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext, filedialog
+from tkinter import ttk, messagebox, filedialog
 import os
+import sys
 import json
 import math
-from datetime import datetime, timedelta
-import requests
+from datetime import datetime
+from converter_engine import ConversionEngine
+from converter_history import (CURRENCY, EXPRESSION, UNITS, History, Query, describe,
+                               make_record, note, read_records)
+from converter_history_export import HistoryExport, parquet_available
+from converter_history_journal import HistoryJournal
+from converter_providers import build_providers
+from converter_rate_cache import read_rates, write_rate_cache
+from converter_rate_history import RateHistory
+from converter_rates import RateClient, RateFetch, RefreshScheduler
+from converter_tasks import Background
+from converter_timing import PhaseTimer
+from converter_widgets import VirtualList
 
 class UniversalConverter:
-    def __init__(self, root):
+    def __init__(self, root, timer=None):
         self.root = root
+        self.timer = timer or PhaseTimer()
         self.root.title("CONVERSOR UNIVERSAL V1")  
         self.root.geometry("1000x750")
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         
         # Configuración API
         self.api_file = "converter_api.json"
-        self.rates_file = "currency_rates.json"
+        self.rates_file = "currency_rates.bin"
+        self.legacy_rates_file = "currency_rates.json"  # caché JSON antigua, se lee una vez si falta la binaria
+        self.rate_history_file = "currency_history.sqlite"
+        self.HISTORY_LIMIT = 100000  # entradas que guarda el panel de historial
+        # Cada conversión se añade a este diario, escrito por lotes
+        self.history_journal = HistoryJournal("converter_history.jsonl", keep=self.HISTORY_LIMIT)
+        self.history_flush_job = None
+        self.history_export = None  # HistoryExport en curso, None si no hay ninguna
+        # Leer las tasas y el historial guardados en hilos de fondo mientras se construye la ventana
+        self.startup_rates = Background(read_rates, self.rates_file, self.legacy_rates_file,
+                                        name="load-rates")
+        self.startup_history = Background(read_records, self.history_journal, self.HISTORY_LIMIT,
+                                          name="load-history")
+        # Cuándo actualizar las tasas sin superar el límite mensual
+        self.rate_schedule = RefreshScheduler("rate_schedule.json")
+        self.BASE_URL = "https://v6.exchangerate-api.com/v6/"  # "base_url" en converter_api.json lo sobrescribe
+        self.REQUEST_TIMEOUT = 10  # segundos, "timeout" en converter_api.json lo sobrescribe
+        self.provider_config = []  # fuentes de tasas adicionales, "providers" en converter_api.json
         self.API_KEY = self.load_api_key()
-        self.BASE_URL = "https://v6.exchangerate-api.com/v6/"
+        self.rate_client = RateClient(self.REQUEST_TIMEOUT)
+        self.build_rate_providers()
         self.rates = {}
         self.last_update = None
         self.currency_mode = False
+        self.rate_fetch = None
+        self.rate_notify = True
+        self.refresh_job = None
+        self.rate_validators = {}  # ETag / Last-Modified de las tasas guardadas, por proveedor
 
         # Estilos
         self.setup_styles()
+        self.timer.mark("styles")
         
         # Todas las conversiones posibles
         self.units = self.load_units()
+        self.currency_units = self.load_currency_units()
+        self.engine = ConversionEngine(self.units, self.currency_units,
+                                       RateHistory(self.rate_history_file))
+        self.timer.mark("unit tables")
         
         # Variables
         self.setup_variables()
         
         # Interfaz
         self.create_interface()
+        self.timer.mark("widgets")
         
         # Inicialización
         self.initialize_data()
+        self.timer.mark("data init")
 
     def setup_styles(self):
         """Configurar estilos"""
@@ -49,155 +94,147 @@ class UniversalConverter:
         self.style.configure('Currency.TButton', background='#90EE90', font=('Segoe UI', 10, 'bold'))
         self.style.configure('Normal.TButton', background='#ADD8E6', font=('Segoe UI', 10, 'bold'))
     
-    def load_units(self):
-        """Cargar unidades"""
-        units = {
+    @staticmethod
+    def load_units():
+        """Cargar nombres de categorías y unidades por ID de unidad"""
+        return {
             # Masa
-            "Masa": {
-                "Kilogramo (kg)": 1.0,
-                "Gramo (g)": 0.001,
-                "Miligramo (mg)": 1e-6,
-                "Tonelada (t)": 1000.0,
-                "Libra (lb)": 0.453592,
-                "Onza (oz)": 0.0283495,
-                "Quilate (ct)": 0.0002
-            },
+            "mass": "Masa",
+            "mass.kg": "Kilogramo (kg)",
+            "mass.g": "Gramo (g)",
+            "mass.mg": "Miligramo (mg)",
+            "mass.t": "Tonelada (t)",
+            "mass.lb": "Libra (lb)",
+            "mass.oz": "Onza (oz)",
+            "mass.ct": "Quilate (ct)",
             
             # Longitud
-            "Longitud": {
-                "Metro (m)": 1.0,
-                "Kilómetro (km)": 1000.0,
-                "Centímetro (cm)": 0.01,
-                "Milímetro (mm)": 0.001,
-                "Micrómetro (µm)": 1e-6,
-                "Pulgada (in)": 0.0254,
-                "Pie (ft)": 0.3048,
-                "Yarda (yd)": 0.9144,
-                "Milla (mi)": 1609.34,
-                "Milla náutica (nmi)": 1852.0
-            },
+            "length": "Longitud",
+            "length.m": "Metro (m)",
+            "length.km": "Kilómetro (km)",
+            "length.cm": "Centímetro (cm)",
+            "length.mm": "Milímetro (mm)",
+            "length.um": "Micrómetro (µm)",
+            "length.in": "Pulgada (in)",
+            "length.ft": "Pie (ft)",
+            "length.yd": "Yarda (yd)",
+            "length.mi": "Milla (mi)",
+            "length.nmi": "Milla náutica (nmi)",
             
             # Volumen
-            "Volumen": {
-                "Litro (L)": 1.0,
-                "Mililitro (mL)": 0.001,
-                "Galón (gal)": 3.78541,
-                "Pinta (pt)": 0.473176,
-                "Metro cúbico (m³)": 1000.0,
-                "Pulgada cúbica (in³)": 0.0163871,
-                "Cucharadita (tsp)": 0.00492892,
-                "Cucharada (tbsp)": 0.0147868,
-                "Taza (cup)": 0.236588
-            },
+            "volume": "Volumen",
+            "volume.L": "Litro (L)",
+            "volume.mL": "Mililitro (mL)",
+            "volume.gal": "Galón (gal)",
+            "volume.pt": "Pinta (pt)",
+            "volume.m3": "Metro cúbico (m³)",
+            "volume.in3": "Pulgada cúbica (in³)",
+            "volume.tsp": "Cucharadita (tsp)",
+            "volume.tbsp": "Cucharada (tbsp)",
+            "volume.cup": "Taza (cup)",
             
             # Temperatura
-            "Temperatura": {
-                "Celsius (°C)": "celsius",
-                "Fahrenheit (°F)": "fahrenheit",
-                "Kelvin (K)": "kelvin"
-            },
+            "temperature": "Temperatura",
+            "temperature.C": "Celsius (°C)",
+            "temperature.F": "Fahrenheit (°F)",
+            "temperature.K": "Kelvin (K)",
             
             # Área
-            "Área": {
-                "Metro cuadrado (m²)": 1.0,
-                "Kilómetro cuadrado (km²)": 1e6,
-                "Centímetro cuadrado (cm²)": 0.0001,
-                "Hectárea (ha)": 10000.0,
-                "Acre (ac)": 4046.86,
-                "Milla cuadrada (mi²)": 2.59e6,
-                "Pie cuadrado (ft²)": 0.092903
-            },
+            "area": "Área",
+            "area.m2": "Metro cuadrado (m²)",
+            "area.km2": "Kilómetro cuadrado (km²)",
+            "area.cm2": "Centímetro cuadrado (cm²)",
+            "area.ha": "Hectárea (ha)",
+            "area.ac": "Acre (ac)",
+            "area.mi2": "Milla cuadrada (mi²)",
+            "area.ft2": "Pie cuadrado (ft²)",
             
             # Velocidad
-            "Velocidad": {
-                "m/s": 1.0,
-                "km/h": 0.277778,
-                "mph": 0.44704,
-                "Nudos": 0.514444,
-                "Mach": 343.0
-            },
+            "speed": "Velocidad",
+            "speed.m/s": "m/s",
+            "speed.km/h": "km/h",
+            "speed.mph": "mph",
+            "speed.knots": "Nudos",
+            "speed.Mach": "Mach",
             
             # Datos
-            "Datos": {
-                "Bit (bit)": 1.0,
-                "Byte (B)": 8.0,
-                "Kilobyte (KB)": 8192.0,
-                "Megabyte (MB)": 8388608.0,
-                "Gigabyte (GB)": 8589934592.0,
-                "Terabyte (TB)": 8796093022208.0
-            },
+            "data": "Datos",
+            "data.bit": "Bit (bit)",
+            "data.B": "Byte (B)",
+            "data.KB": "Kilobyte (KB)",
+            "data.MB": "Megabyte (MB)",
+            "data.GB": "Gigabyte (GB)",
+            "data.TB": "Terabyte (TB)",
             
             # Energía
-            "Energía": {
-                "Julio (J)": 1.0,
-                "Kilojulio (kJ)": 1000.0,
-                "Caloría (cal)": 4.184,
-                "Kilocaloría (kcal)": 4184.0,
-                "kWh": 3600000.0,
-                "Electronvoltio (eV)": 1.60218e-19
-            },
+            "energy": "Energía",
+            "energy.J": "Julio (J)",
+            "energy.kJ": "Kilojulio (kJ)",
+            "energy.cal": "Caloría (cal)",
+            "energy.kcal": "Kilocaloría (kcal)",
+            "energy.kWh": "kWh",
+            "energy.eV": "Electronvoltio (eV)",
             
             # Presión
-            "Presión": {
-                "Pascal (Pa)": 1.0,
-                "Bar (bar)": 100000.0,
-                "Atmósfera (atm)": 101325.0,
-                "mmHg": 133.322,
-                "PSI": 6894.76
-            },
+            "pressure": "Presión",
+            "pressure.Pa": "Pascal (Pa)",
+            "pressure.bar": "Bar (bar)",
+            "pressure.atm": "Atmósfera (atm)",
+            "pressure.mmHg": "mmHg",
+            "pressure.psi": "PSI",
             
             # Tiempo
-            "Tiempo": {
-                "Segundo (s)": 1.0,
-                "Minuto (min)": 60.0,
-                "Hora (h)": 3600.0,
-                "Día": 86400.0,
-                "Semana": 604800.0,
-                "Año": 31536000.0
-            },
+            "time": "Tiempo",
+            "time.s": "Segundo (s)",
+            "time.min": "Minuto (min)",
+            "time.h": "Hora (h)",
+            "time.day": "Día",
+            "time.week": "Semana",
+            "time.year": "Año",
             
             # Radiación
-            "Radiación": {
-                "Sievert (Sv)": 1.0,
-                "Rem (rem)": 0.01,
-                "Rad (rad)": 0.01,
-                "Gray (Gy)": 1.0,
-                "Roentgen (R)": 0.00933
-            },
+            "radiation": "Radiación",
+            "radiation.Sv": "Sievert (Sv)",
+            "radiation.rem": "Rem (rem)",
+            "radiation.rad": "Rad (rad)",
+            "radiation.Gy": "Gray (Gy)",
+            "radiation.R": "Roentgen (R)",
             
             # Astronomía
-            "Astronomía": {
-                "Año luz (ly)": 1.0,
-                "Unidad astronómica (AU)": 63241.1,
-                "Pársec (pc)": 3.26156,
-                "Kilómetro (km)": 9.461e12,
-                "Distancia lunar (LD)": 384400.0
-            },
+            "astronomy": "Astronomía",
+            "astronomy.ly": "Año luz (ly)",
+            "astronomy.AU": "Unidad astronómica (AU)",
+            "astronomy.pc": "Pársec (pc)",
+            "astronomy.km": "Kilómetro (km)",
+            "astronomy.LD": "Distancia lunar (LD)",
             
             # Cocina
-            "Cocina": {
-                "Gramo (g)": 1.0,
-                "Kilogramo (kg)": 1000.0,
-                "Onza (oz)": 28.3495,
-                "Libra (lb)": 453.592,
-                "Cucharadita (tsp)": 5.0,
-                "Cucharada (tbsp)": 15.0,
-                "Taza (cup)": 240.0,
-                "Mililitro (mL)": 1.0,
-                "Litro (L)": 1000.0
-            },
+            "cooking": "Cocina",
+            "cooking.g": "Gramo (g)",
+            "cooking.kg": "Kilogramo (kg)",
+            "cooking.oz": "Onza (oz)",
+            "cooking.lb": "Libra (lb)",
+            "cooking.tsp": "Cucharadita (tsp)",
+            "cooking.tbsp": "Cucharada (tbsp)",
+            "cooking.cup": "Taza (cup)",
+            "cooking.mL": "Mililitro (mL)",
+            "cooking.L": "Litro (L)",
             
             # Ángulos
-            "Ángulos": {
-                "Grado (°)": 1.0,
-                "Radián (rad)": 57.2958,
-                "Gradian (grad)": 0.9,
-                "Revolución (rev)": 360.0
-            }
+            "angles": "Ángulos",
+            "angles.deg": "Grado (°)",
+            "angles.rad": "Radián (rad)",
+            "angles.grad": "Gradian (grad)",
+            "angles.rev": "Revolución (rev)",
+            
+            # Divisas
+            "currency": "Divisas"
         }
-        
-        # Divisas
-        self.currency_units = {
+    
+    @staticmethod
+    def load_currency_units():
+        """Cargar divisas"""
+        return {
             "USD (Dólar EE.UU.)": 1.0,
             "EUR (Euro)": 0.85,
             "RUB (Rublo ruso)": 75.0,
@@ -210,8 +247,6 @@ class UniversalConverter:
             "INR (Rupia india)": 75.0,
             "BRL (Real brasileño)": 5.25
         }
-        
-        return units
     
     def setup_variables(self):
         """Inicializar variables"""
@@ -221,8 +256,11 @@ class UniversalConverter:
         self.input_value = tk.StringVar(value="1.0")
         self.result_value = tk.StringVar(value="")
         self.status_var = tk.StringVar(value="Listo")
+        self.schedule_var = tk.StringVar(value="")
         self.api_key_var = tk.StringVar(value=self.API_KEY or "")
-        self.history = []
+        self.history = History(self.HISTORY_LIMIT, self.engine.registry)
+        self.history_search = tk.StringVar(value="")
+        self.history_search_job = None
     
     def create_interface(self):
         """Crear interfaz"""
@@ -254,12 +292,20 @@ class UniversalConverter:
         ttk.Button(self.api_frame, text="Guardar API", 
                   command=self.save_api_key).grid(row=0, column=2, padx=5, pady=5)
         
-        ttk.Button(self.api_frame, text="Actualizar tasas", 
-                  command=self.update_currency_rates).grid(row=0, column=3, padx=5, pady=5)
+        self.update_btn = ttk.Button(self.api_frame, text="Actualizar tasas", 
+                                     command=self.update_currency_rates)
+        self.update_btn.grid(row=0, column=3, padx=5, pady=5)
         
         ttk.Button(self.api_frame, text="Instrucciones", 
                   command=self.show_api_instructions).grid(row=0, column=4, padx=5, pady=5)
         
+        # Visible mientras se descargan las tasas
+        self.rate_progress = ttk.Progressbar(self.api_frame, mode='indeterminate', length=80)
+        
+        # Próxima actualización programada y solicitudes del mes
+        ttk.Label(self.api_frame, textvariable=self.schedule_var).grid(
+            row=1, column=0, columnspan=6, padx=5, sticky=tk.W)
+        
         # Marco conversión
         self.conv_frame = ttk.LabelFrame(main_frame, text="Conversión")
         self.conv_frame.pack(fill=tk.X, pady=5)
@@ -269,7 +315,7 @@ class UniversalConverter:
         self.category_combo = ttk.Combobox(
             self.conv_frame, 
             textvariable=self.current_category, 
-            values=list(self.units.keys()), 
+            values=self.engine.registry.category_labels(), 
             state="readonly", 
             width=25
         )
@@ -309,13 +355,19 @@ class UniversalConverter:
         ttk.Label(main_frame, textvariable=self.status_var, font=('Segoe UI', 9)).pack(anchor=tk.W)
         
         # Historial
-        history_frame = ttk.LabelFrame(main_frame, text="Historial (últimos 20)")
+        history_frame = ttk.LabelFrame(main_frame, text="Historial")
         history_frame.pack(fill=tk.BOTH, expand=True, pady=10)
         
-        self.history_text = scrolledtext.ScrolledText(history_frame, wrap=tk.WORD, 
-                                                    font=('Consolas', 9))
-        self.history_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        self.history_text.config(state=tk.DISABLED)
+        # Búsqueda en el historial
+        search_frame = ttk.Frame(history_frame)
+        search_frame.pack(fill=tk.X, padx=5, pady=(5, 0))
+        ttk.Label(search_frame, text="Buscar:").pack(side=tk.LEFT)
+        ttk.Entry(search_frame, textvariable=self.history_search).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.history_search.trace_add("write", self.search_history)
+        
+        self.history_view = VirtualList(history_frame, [("#", 70), ("Hora", 130), ("Conversión", 600)],
+                                        count=self.history.visible, row=self.history_row)
+        self.history_view.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
         # Botones historial
         history_btn_frame = ttk.Frame(history_frame)
@@ -323,20 +375,30 @@ class UniversalConverter:
 
         ttk.Button(history_btn_frame, text="Limpiar historial", 
                   command=self.clear_history).pack(side=tk.LEFT, padx=5)
-        ttk.Button(history_btn_frame, text="Guardar historial", 
-                  command=self.save_history).pack(side=tk.LEFT, padx=5)
+        self.save_btn = ttk.Button(history_btn_frame, text="Guardar historial", 
+                                   command=self.save_history)
+        self.save_btn.pack(side=tk.LEFT, padx=5)
+        self.export_progress = ttk.Progressbar(history_btn_frame, mode='determinate',
+                                               length=150, maximum=1.0)
         
         # Botón salir
         btn_frame = ttk.Frame(main_frame)
         btn_frame.pack(fill=tk.X, pady=5)
         
         ttk.Button(btn_frame, text="Salir", 
-                  command=self.root.quit).pack(side=tk.RIGHT)
+                  command=self.close).pack(side=tk.RIGHT)
     
     def toggle_currency_mode(self):
         """Cambiar entre modo normal y divisas"""
         self.currency_mode = not self.currency_mode
+        self.apply_mode()
         
+        # Limpiar campo al cambiar modo
+        self.input_value.set("1.0")
+        self.result_value.set("")
+    
+    def apply_mode(self):
+        """Colocar los widgets del modo actual"""
         if self.currency_mode:
             self.mode_btn.config(text="Conversor normal", style='Normal.TButton')
             self.api_frame.pack(fill=tk.X, pady=5, before=self.conv_frame)
@@ -346,12 +408,11 @@ class UniversalConverter:
             self.category_combo.grid_forget()
             
             # Actualizar unidades para divisas
-            self.from_combo['values'] = list(self.currency_units.keys())
-            self.to_combo['values'] = list(self.currency_units.keys())
+            self.update_currency_list()
             
-            if not self.from_unit.get() or self.from_unit.get() not in self.currency_units:
+            if self.engine.registry.get(self.from_unit.get(), "currency") is None:
                 self.from_unit.set("USD (Dólar EE.UU.)")
-            if not self.to_unit.get() or self.to_unit.get() not in self.currency_units:
+            if self.engine.registry.get(self.to_unit.get(), "currency") is None:
                 self.to_unit.set("EUR (Euro)")
         else:
             self.mode_btn.config(text="Conversor de divisas", style='Currency.TButton')
@@ -367,18 +428,23 @@ class UniversalConverter:
         # Actualizar layout
         self.units_frame.grid(row=1, column=0, columnspan=3, sticky=tk.EW, pady=5)
         self.value_frame.grid(row=2, column=0, columnspan=3, sticky=tk.EW, pady=5)
-        
-        # Limpiar campo al cambiar modo
-        self.input_value.set("1.0")
-        self.result_value.set("")
     
     def initialize_data(self):
         """Inicializar datos"""
-        self.load_currency_rates()
-        self.update_units()
-        self.load_history()
-        self.toggle_currency_mode()  # Empezar en modo normal
-        self.toggle_currency_mode()  # Cambiar para inicialización correcta
+        # El modo normal se coloca una vez; tasas e historial llegan de los hilos de inicio
+        self.apply_mode()
+        self.poll_startup()
+    
+    def poll_startup(self):
+        """Aplicar las tasas y el historial leídos al inicio en cuanto estén listos"""
+        if self.startup_rates is not None and self.startup_rates.poll() is not None:
+            self.load_currency_rates(self.startup_rates)
+            self.startup_rates = None
+        if self.startup_history is not None and self.startup_history.poll() is not None:
+            self.load_history(self.startup_history)
+            self.startup_history = None
+        if self.startup_rates is not None or self.startup_history is not None:
+            self.root.after(20, self.poll_startup)
     
     def update_units(self, event=None):
         """Actualizar lista de unidades"""
@@ -386,7 +452,7 @@ class UniversalConverter:
             return
             
         category = self.current_category.get()
-        units = list(self.units[category].keys())
+        units = list(self.engine.registry.category(category).labels)
         
         self.from_combo['values'] = units
         self.to_combo['values'] = units
@@ -403,6 +469,9 @@ class UniversalConverter:
             if os.path.exists(self.api_file):
                 with open(self.api_file, 'r') as f:
                     data = json.load(f)
+                    self.REQUEST_TIMEOUT = data.get('timeout', self.REQUEST_TIMEOUT)
+                    self.BASE_URL = data.get('base_url', self.BASE_URL)
+                    self.provider_config = data.get('providers', self.provider_config)
                     return data.get('api_key', "")
         except Exception as e:
             print(f"Error cargando API: {e}")
@@ -411,14 +480,25 @@ class UniversalConverter:
     def save_api_key(self):
         """Guardar clave API en archivo"""
         self.API_KEY = self.api_key_var.get().strip()
+        self.build_rate_providers()
         try:
             with open(self.api_file, 'w') as f:
-                json.dump({'api_key': self.API_KEY}, f)
+                json.dump({'api_key': self.API_KEY, 'timeout': self.REQUEST_TIMEOUT,
+                           'base_url': self.BASE_URL, 'providers': self.provider_config}, f)
             messagebox.showinfo("Éxito", "¡Clave API guardada!")
             self.load_currency_rates()  # Intentar cargar tasas con nueva clave
         except Exception as e:
             messagebox.showerror("Error", f"Error guardando clave: {str(e)}")
     
+    def build_rate_providers(self):
+        """Fuentes de tasas: la API si hay clave y las de converter_api.json"""
+        api_url = f"{self.BASE_URL}{self.API_KEY}/latest/USD" if self.API_KEY else None
+        try:
+            self.rate_providers = build_providers(self.provider_config, api_url, self.rate_client)
+        except (KeyError, ValueError) as e:
+            print(f"Error en proveedores de tasas: {e}")
+            self.rate_providers = build_providers((), api_url, self.rate_client)
+    
     def show_api_instructions(self):
         """Mostrar instrucciones API"""
         instructions = """
@@ -436,109 +516,177 @@ class UniversalConverter:
         """
         messagebox.showinfo("Instrucciones API", instructions)
     
-    def load_currency_rates(self):
+    def load_currency_rates(self, prefetch=None):
         """Cargar tasas de cambio desde archivo o API"""
         try:
             # Intentar cargar desde archivo
-            if os.path.exists(self.rates_file):
-                with open(self.rates_file, 'r') as f:
-                    data = json.load(f)
-                    last_update = datetime.strptime(data['last_update'], '%Y-%m-%d')
-                    
-                    # Si la última actualización fue hace menos de 7 días
-                    if datetime.now() - last_update < timedelta(days=7):
-                        self.rates = data['rates']
-                        self.last_update = last_update
-                        self.status_var.set(f"Tasas cargadas ({last_update.strftime('%d/%m/%Y')})")
-                        
-                        # Actualizar currency_units
-                        for curr, rate in self.rates.items():
-                            for key in list(self.currency_units.keys()):
-                                if key.startswith(curr + " "):
-                                    self.currency_units[key] = rate
-                                    break
-                        return
-            
-            # Si no hay archivo o datos viejos, pero hay API - actualizar
-            if self.API_KEY:
-                self.update_currency_rates()
+            if prefetch is not None:
+                cache = prefetch.result()
             else:
+                cache = read_rates(self.rates_file, self.legacy_rates_file)
+            if cache is not None:
+                self.rates, self.rate_validators, last_update = cache
+                self.last_update = last_update
+                self.status_var.set(f"Tasas cargadas ({last_update.strftime('%d/%m/%Y')})")
+                self.apply_currency_rates()
+            elif not self.rates:
                 self.status_var.set("Usando tasas guardadas (no actualizadas)")
-                
         except Exception as e:
             self.status_var.set(f"Error cargando tasas: {str(e)}")
             # Usar valores por defecto
+        
+        # Actualizar si el planificador indica que toca
+        if self.rate_providers and self.rate_schedule.is_due():
+            self.update_currency_rates(notify=False)
+        self.schedule_rate_refresh()
     
-    def update_currency_rates(self):
+    def update_currency_rates(self, notify=True):
         """Actualizar tasas de cambio via API"""
-        if not self.API_KEY:
+        if not self.rate_providers:
             messagebox.showwarning("Error", "Ingrese clave API para actualizar")
             return
             
+        if self.rate_fetch is not None:
+            return
+        if not self.rate_schedule.remaining():
+            when = datetime.fromtimestamp(self.rate_schedule.next_fetch()).strftime('%d/%m/%Y %H:%M')
+            messagebox.showwarning("Error", f"Límite mensual de solicitudes agotado, próxima actualización {when}")
+            return
+        
+        # La solicitud se ejecuta en un hilo aparte, la ventana no se bloquea
+        self.status_var.set("Actualizando tasas...")
+        self.update_btn.config(text="Cancelar", command=self.cancel_rate_update)
+        self.rate_progress.grid(row=0, column=5, padx=5, pady=5)
+        self.rate_progress.start(10)
+        self.rate_notify = notify
+        self.rate_fetch = RateFetch(self.rate_providers, self.rate_validators)
+        self.root.after(100, self.poll_rate_update, self.rate_fetch)
+    
+    def poll_rate_update(self, fetch):
+        """Recoger el resultado de la actualización en segundo plano"""
+        if fetch is not self.rate_fetch:
+            return
+        result = fetch.poll()
+        if result is None:
+            self.root.after(100, self.poll_rate_update, fetch)
+            return
+        self.finish_rate_update()
+        self.record_rate_fetch(fetch, result)
+        
         try:
-            self.status_var.set("Actualizando tasas...")
-            self.root.update()
+            response, error = result
+            if error is not None:
+                raise error
+            self.rate_validators[response.provider] = response.validators
             
-            response = requests.get(f"{self.BASE_URL}{self.API_KEY}/latest/USD")
-            data = response.json()
+            if response.not_modified:
+                # 304: las tasas guardadas siguen vigentes, solo se renueva la fecha
+                self.last_update = datetime.now()
+                self.apply_currency_rates()
+                self.save_currency_rates()
+                self.status_var.set(f"Las tasas están al día ({self.last_update.strftime('%d/%m/%Y')})")
+                return
+            data = response.data
             
             if data['result'] == 'success':
-                self.rates = {
-                    'USD': 1.0,
-                    'EUR': data['conversion_rates']['EUR'],
-                    'RUB': data['conversion_rates']['RUB'],
-                    'GBP': data['conversion_rates']['GBP'],
-                    'JPY': data['conversion_rates']['JPY'],
-                    'CNY': data['conversion_rates']['CNY'],
-                    'AUD': data['conversion_rates']['AUD'],
-                    'CAD': data['conversion_rates']['CAD'],
-                    'CHF': data['conversion_rates']['CHF'],
-                    'INR': data['conversion_rates']['INR'],
-                    'BRL': data['conversion_rates']['BRL']
-                }
+                self.rates = data['conversion_rates']
                 
-                # Actualizar currency_units
-                for curr, rate in self.rates.items():
-                    for key in list(self.currency_units.keys()):
-                        if key.startswith(curr + " "):
-                            self.currency_units[key] = rate
-                            break
+                self.apply_currency_rates()
+                # Cada instantánea se guarda para conversiones a una fecha
+                self.engine.history.add(self.rates, data.get('time_last_update_unix'))
                 
                 # Guardar en archivo
                 self.last_update = datetime.now()
-                with open(self.rates_file, 'w') as f:
-                    json.dump({
-                        'rates': self.rates,
-                        'last_update': self.last_update.strftime('%Y-%m-%d')
-                    }, f)
+                self.save_currency_rates()
                 
                 self.status_var.set(f"Tasas actualizadas ({self.last_update.strftime('%d/%m/%Y')})")
-                messagebox.showinfo("Éxito", "¡Tasas actualizadas!")
+                if self.rate_notify:
+                    messagebox.showinfo("Éxito", "¡Tasas actualizadas!")
             else:
                 error_msg = data.get('error-type', 'Error desconocido')
                 self.status_var.set(f"Error API: {error_msg}")
-                messagebox.showerror("Error API", f"Error actualizando: {error_msg}")
+                if self.rate_notify:
+                    messagebox.showerror("Error API", f"Error actualizando: {error_msg}")
                 
         except Exception as e:
             self.status_var.set(f"Error actualizando: {str(e)}")
-            messagebox.showerror("Error", f"Error actualizando: {str(e)}")
+            if self.rate_notify:
+                messagebox.showerror("Error", f"Error actualizando: {str(e)}")
+    
+    def record_rate_fetch(self, fetch, result):
+        """Contar la solicitud en el límite y programar la siguiente"""
+        response, error = result
+        success = error is None and (response.not_modified or (
+            isinstance(response.data, dict) and response.data.get('result') == 'success'))
+        next_update = None
+        if success and not response.not_modified:
+            next_update = response.data.get('time_next_update_unix')
+        self.rate_schedule.record(fetch.count_sent(), success, next_update)
+        self.schedule_rate_refresh()
+    
+    def schedule_rate_refresh(self):
+        """Programar la próxima actualización automática de tasas"""
+        if self.refresh_job is not None:
+            self.root.after_cancel(self.refresh_job)
+            self.refresh_job = None
+        if not self.rate_providers:
+            self.schedule_var.set("")
+            return
+        next_fetch = self.rate_schedule.next_fetch()
+        when = datetime.fromtimestamp(next_fetch).strftime('%d/%m/%Y %H:%M')
+        used = self.rate_schedule.quota - self.rate_schedule.remaining()
+        self.schedule_var.set(f"Próxima actualización: {when} · {used}/{self.rate_schedule.quota} solicitudes este mes")
+        # Se revisa al menos cada hora, así la suspensión no retrasa la actualización
+        delay = min(max(next_fetch - datetime.now().timestamp(), 1), 3600)
+        self.refresh_job = self.root.after(int(delay * 1000), self.scheduled_refresh)
+    
+    def scheduled_refresh(self):
+        """Actualización automática de tasas"""
+        self.refresh_job = None
+        if self.rate_providers and self.rate_fetch is None and self.rate_schedule.is_due():
+            self.update_currency_rates(notify=False)
+        else:
+            self.schedule_rate_refresh()
+    
+    def apply_currency_rates(self):
+        """Aplicar las tasas a la tabla de divisas"""
+        self.engine.set_rates(self.rates)
+        if self.currency_mode:
+            self.update_currency_list()
+    
+    def save_currency_rates(self):
+        """Guardar tasas en archivo"""
+        write_rate_cache(self.rates_file, self.rates, self.last_update.timestamp(),
+                         self.rate_validators)
+    
+    def cancel_rate_update(self):
+        """Cancelar actualización de tasas"""
+        if self.rate_fetch is not None:
+            self.rate_fetch.cancel()
+            self.rate_schedule.record(self.rate_fetch.count_sent(), False)
+        self.finish_rate_update()
+        self.schedule_rate_refresh()
+        self.status_var.set("Actualización cancelada")
+    
+    def finish_rate_update(self):
+        """Salir del estado de actualización"""
+        self.rate_fetch = None
+        self.rate_progress.stop()
+        self.rate_progress.grid_remove()
+        self.update_btn.config(text="Actualizar tasas", command=self.update_currency_rates)
     
     def get_currency_name(self, code):
         """Obtener nombre de moneda por código"""
-        names = {
-            'USD': 'Dólar EE.UU.',
-            'EUR': 'Euro',
-            'RUB': 'Rublo ruso',
-            'GBP': 'Libra esterlina',
-            'JPY': 'Yen japonés',
-            'CNY': 'Yuan chino',
-            'AUD': 'Dólar australiano',
-            'CAD': 'Dólar canadiense',
-            'CHF': 'Franco suizo',
-            'INR': 'Rupia india',
-            'BRL': 'Real brasileño'
-        }
-        return names.get(code, code)
+        unit = self.engine.registry.get(code, "currency")
+        if unit is None:
+            return code
+        return unit.label.partition(" (")[2].rstrip(")") or code
+    
+    def update_currency_list(self):
+        """Actualizar lista de divisas"""
+        currencies = list(self.engine.registry.category("currency").labels)
+        self.from_combo['values'] = currencies
+        self.to_combo['values'] = currencies
     
     def convert(self):
         """Realizar conversión"""
@@ -547,9 +695,17 @@ class UniversalConverter:
             if not input_value:
                 raise ValueError("Ingrese valor a convertir")
             
-            value = float(input_value)
+            try:
+                value = float(input_value)
+            except ValueError:
+                value = None
             
-            if self.currency_mode:
+            if value is None:
+                # Expresión como "3 ft 2 in to cm" o "12.5 psi -> bar"
+                result, category, to_unit = self.engine.evaluate(input_value)
+                self.add_to_history(make_record(self.engine.registry, EXPRESSION, category,
+                                                None, to_unit, input_value, result))
+            elif self.currency_mode:
                 from_unit = self.from_unit.get()
                 to_unit = self.to_unit.get()
                 
@@ -561,12 +717,14 @@ class UniversalConverter:
                     return
                 
                 # Verificar existencia en diccionario
-                if from_unit not in self.currency_units or to_unit not in self.currency_units:
+                currencies = self.engine.registry.category("currency")
+                if currencies.get(from_unit) is None or currencies.get(to_unit) is None:
                     raise ValueError("Divisas no encontradas")
                 
                 # Conversión usando valores guardados
-                result = value * (self.currency_units[to_unit] / self.currency_units[from_unit])
-                self.add_to_history(f"{value} {from_unit} → {result:.6f} {to_unit} (Divisas)")
+                result = self.engine.convert(value, currencies, from_unit, to_unit)
+                self.add_to_history(make_record(self.engine.registry, CURRENCY, currencies,
+                                                from_unit, to_unit, value, result))
             else:
                 category = self.current_category.get()
                 from_unit = self.from_unit.get()
@@ -579,24 +737,10 @@ class UniversalConverter:
                     self.result_value.set(value)
                     return
                     
-                if category == "Temperatura":
-                    result = self.convert_temperature(value, from_unit, to_unit)
-                else:
-                    # Otras categorías usan lógica estándar
-                    from_val = self.units[category][from_unit]
-                    to_val = self.units[category][to_unit]
-                    
-                    if callable(from_val):
-                        base = from_val(value, False)
-                    else:
-                        base = value * from_val
-                        
-                    if callable(to_val):
-                        result = to_val(base, True)
-                    else:
-                        result = base / to_val
+                result = self.engine.convert(value, category, from_unit, to_unit)
                 
-                self.add_to_history(f"{value} {from_unit} → {result:.6f} {to_unit} ({category})")
+                self.add_to_history(make_record(self.engine.registry, UNITS, category,
+                                                from_unit, to_unit, value, result))
             
             # Formatear resultado (quitar ceros)
             formatted_result = "{0:.8f}".format(result).rstrip('0').rstrip('.') if '.' in "{0:.8f}".format(result) else str(result)
@@ -607,27 +751,6 @@ class UniversalConverter:
         except Exception as e:
             messagebox.showerror("Error", f"Error conversión: {str(e)}")
     
-    def convert_temperature(self, value, from_unit, to_unit):
-        """Convertir temperatura"""
-        if from_unit == to_unit:
-            return value
-            
-        # A Celsius
-        if "Fahrenheit" in from_unit:
-            celsius = (value - 32) * 5/9
-        elif "Kelvin" in from_unit:
-            celsius = value - 273.15
-        else:
-            celsius = value
-            
-        # Desde Celsius
-        if "Fahrenheit" in to_unit:
-            return celsius * 9/5 + 32
-        elif "Kelvin" in to_unit:
-            return celsius + 273.15
-        else:
-            return celsius
-    
     def swap_units(self):
         """Intercambiar unidades"""
         from_unit = self.from_unit.get()
@@ -637,55 +760,144 @@ class UniversalConverter:
         if self.result_value.get():
             self.convert()
     
-    def add_to_history(self, entry):
+    def add_to_history(self, record, save=True):
         """Agregar al historial"""
-        self.history.append(entry)
-        if len(self.history) > 20:
-            self.history.pop(0)
-        
-        self.history_text.config(state=tk.NORMAL)
-        self.history_text.delete(1.0, tk.END)
-        for i, item in enumerate(reversed(self.history), 1):
-            self.history_text.insert(tk.END, f"{i}. {item}\n")
-        self.history_text.config(state=tk.DISABLED)
-        self.history_text.see(tk.END)
+        visible = self.history.append(record)
+        if save:
+            # flush_history() lo escribe en el diario en menos de un segundo
+            self.history_journal.append(record.as_dict())
+            if self.history_flush_job is None:
+                self.history_flush_job = self.root.after(1000, self.flush_history)
+        self.history_view.inserted(1 if visible else 0)
+    
+    def history_row(self, index):
+        """Valores de la fila index del historial, lo más reciente primero"""
+        number = self.history.visible_number(index)
+        record = self.history[number]
+        when = datetime.fromtimestamp(record.time).strftime('%d/%m/%Y %H:%M') if record.time else ""
+        return (number, when, describe(record, self.engine.registry))
+    
+    def search_history(self, *args):
+        """Filtrar el historial por las palabras del cuadro de búsqueda al pausar la escritura"""
+        if self.history_search_job is not None:
+            self.root.after_cancel(self.history_search_job)
+        self.history_search_job = self.root.after(150, self.apply_history_search)
+    
+    def apply_history_search(self):
+        """Aplicar la búsqueda a la vista del historial"""
+        self.history_search_job = None
+        self.history.search(Query(self.history_search.get(), self.engine.registry))
+        self.history_view.show(0)
     
     def clear_history(self):
         """Limpiar historial"""
-        self.history = []
-        self.history_text.config(state=tk.NORMAL)
-        self.history_text.delete(1.0, tk.END)
-        self.history_text.config(state=tk.DISABLED)
+        self.history.clear()
+        try:
+            self.history_journal.clear()
+        except OSError as e:
+            self.status_var.set(f"No se pudo guardar el historial: {str(e)}")
+        self.history_view.refresh()
     
     def save_history(self):
-        """Guardar historial a archivo"""
+        """Exportar el historial a un archivo en un hilo de fondo"""
+        if self.history_export is not None:
+            return
+        filetypes = [("Archivos texto", "*.txt"), ("Archivos CSV", "*.csv"), ("Archivos JSON Lines", "*.jsonl")]
+        if parquet_available():
+            filetypes.append(("Archivos Parquet", "*.parquet"))
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".txt",
+            filetypes=filetypes + [("Todos", "*.*")],
+            title="Guardar historial"
+        )
+        if not file_path:
+            return
+        
+        # La exportación lee el diario, así que antes se escriben las entradas pendientes
+        if self.history_flush_job is not None:
+            self.root.after_cancel(self.history_flush_job)
+        self.flush_history(wait=True)
+        self.history_export = HistoryExport(self.history_journal.path, file_path,
+                                            self.engine.registry, "Historial conversiones")
+        self.save_btn.config(text="Cancelar", command=self.cancel_history_export)
+        self.export_progress["value"] = 0.0
+        self.export_progress.pack(side=tk.LEFT, padx=5)
+        self.root.after(100, self.poll_history_export, self.history_export)
+    
+    def poll_history_export(self, export):
+        """Mostrar el progreso de la exportación y luego su resultado"""
+        if export is not self.history_export:
+            return
+        self.export_progress["value"] = export.done
+        result = export.poll()
+        if result is None:
+            self.root.after(100, self.poll_history_export, export)
+            return
+        self.finish_history_export()
+        
         try:
-            file_path = filedialog.asksaveasfilename(
-                defaultextension=".txt",
-                filetypes=[("Archivos texto", "*.txt"), ("Todos", "*.*")],
-                title="Guardar historial"
-            )
-            if file_path:
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write("Historial conversiones:\n")
-                    f.write("="*50 + "\n")
-                    for i, item in enumerate(self.history, 1):
-                        f.write(f"{i}. {item}\n")
-                messagebox.showinfo("Éxito", "Historial guardado")
+            _, error = result
+            if error is not None:
+                raise error
+            messagebox.showinfo("Éxito", "Historial guardado")
         except Exception as e:
             messagebox.showerror("Error", f"Error guardando: {str(e)}")
     
-    def load_history(self):
+    def cancel_history_export(self):
+        """Cancelar la exportación del historial"""
+        if self.history_export is not None:
+            self.history_export.cancel()
+        self.finish_history_export()
+        self.status_var.set("Exportación del historial cancelada")
+    
+    def finish_history_export(self):
+        """Salir del estado de exportación del historial"""
+        self.history_export = None
+        self.export_progress.pack_forget()
+        self.save_btn.config(text="Guardar historial", command=self.save_history)
+    
+    def flush_history(self, wait=False):
+        """Escribir en el diario las entradas de historial pendientes"""
+        self.history_flush_job = None
+        try:
+            self.history_journal.flush(wait)
+        except OSError as e:
+            self.status_var.set(f"No se pudo guardar el historial: {str(e)}")
+        # Siguen en cola mientras se compacta el diario
+        if not wait and self.history_journal.pending:
+            self.history_flush_job = self.root.after(1000, self.flush_history)
+    
+    def load_history(self, prefetch=None):
         """Cargar historial desde archivo"""
         try:
-            if os.path.exists("converter_history.json"):
-                with open("converter_history.json", "r", encoding="utf-8") as f:
-                    self.history = json.load(f)
-                self.add_to_history("Historial cargado")
-        except:
-            pass
+            if prefetch is not None:
+                records = prefetch.result()
+            else:
+                records = read_records(self.history_journal, self.HISTORY_LIMIT)
+        except (OSError, ValueError) as e:
+            self.status_var.set(f"Error al cargar el historial: {str(e)}")
+            return
+        if records:
+            # Las entradas añadidas mientras se leía el archivo siguen siendo las más recientes
+            self.history.reset(records + list(self.history))
+            self.add_to_history(note("Historial cargado"), save=False)
+    
+    def close(self):
+        """Guardar el historial pendiente y cerrar la ventana"""
+        if self.history_export is not None:
+            self.history_export.cancel()
+        if self.history_flush_job is not None:
+            self.root.after_cancel(self.history_flush_job)
+        self.flush_history(wait=True)
+        self.root.destroy()
 
 if __name__ == "__main__":
+    # --timing muestra cuánto tardó cada fase del inicio
+    timer = PhaseTimer(STARTED)
+    timer.mark("imports")
     root = tk.Tk()
-    app = UniversalConverter(root)
+    timer.mark("tk")
+    app = UniversalConverter(root, timer)
+    if "--timing" in sys.argv:
+        root.after_idle(timer.report)
     root.mainloop()
\ No newline at end of file
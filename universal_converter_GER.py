@@ -1,40 +1,85 @@
+import time
+STARTED = time.perf_counter()  # Beginn der Importe, für --timing
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext, filedialog
+from tkinter import ttk, messagebox, filedialog
 import os
+import sys
 import json
 import math
-from datetime import datetime, timedelta
-import requests
+from datetime import datetime
+from converter_engine import ConversionEngine
+from converter_history import (CURRENCY, EXPRESSION, UNITS, History, Query, describe,
+                               make_record, note, read_records)
+from converter_history_export import HistoryExport, parquet_available
+from converter_history_journal import HistoryJournal
+from converter_providers import build_providers
+from converter_rate_cache import read_rates, write_rate_cache
+from converter_rate_history import RateHistory
+from converter_rates import RateClient, RateFetch, RefreshScheduler
+from converter_tasks import Background
+from converter_timing import PhaseTimer
+from converter_widgets import VirtualList
 
 class UniversalConverter:
-    def __init__(self, root):
+    def __init__(self, root, timer=None):
         self.root = root
+        self.timer = timer or PhaseTimer()
         self.root.title("UNIVERSALUMRECHNER V1")  
         self.root.geometry("1000x750")
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         
         # API-Einstellungen
         self.api_file = "converter_api.json"
-        self.rates_file = "currency_rates.json"
+        self.rates_file = "currency_rates.bin"
+        self.legacy_rates_file = "currency_rates.json"  # alter JSON-Cache, wird einmalig gelesen, wenn der binäre fehlt
+        self.rate_history_file = "currency_history.sqlite"
+        self.HISTORY_LIMIT = 100000  # Einträge, die der Verlauf behält
+        # Jede Umrechnung wird gebündelt an dieses Journal angehängt
+        self.history_journal = HistoryJournal("converter_history.jsonl", keep=self.HISTORY_LIMIT)
+        self.history_flush_job = None
+        self.history_export = None  # laufender HistoryExport, None im Leerlauf
+        # Gespeicherte Kurse und Verlauf in Hintergrund-Threads lesen, während das Fenster entsteht
+        self.startup_rates = Background(read_rates, self.rates_file, self.legacy_rates_file,
+                                        name="load-rates")
+        self.startup_history = Background(read_records, self.history_journal, self.HISTORY_LIMIT,
+                                          name="load-history")
+        # Wann Kurse geladen werden, ohne das Monatslimit zu überschreiten
+        self.rate_schedule = RefreshScheduler("rate_schedule.json")
+        self.BASE_URL = "https://v6.exchangerate-api.com/v6/"  # "base_url" in converter_api.json überschreibt den Wert
+        self.REQUEST_TIMEOUT = 10  # Sekunden, "timeout" in converter_api.json überschreibt den Wert
+        self.provider_config = []  # weitere Kursquellen, "providers" in converter_api.json
         self.API_KEY = self.load_api_key()
-        self.BASE_URL = "https://v6.exchangerate-api.com/v6/"
+        self.rate_client = RateClient(self.REQUEST_TIMEOUT)
+        self.build_rate_providers()
         self.rates = {}
         self.last_update = None
         self.currency_mode = False
+        self.rate_fetch = None
+        self.rate_notify = True
+        self.refresh_job = None
+        self.rate_validators = {}  # ETag / Last-Modified der gespeicherten Kurse je Anbieter
 
         # Stile
         self.setup_styles()
+        self.timer.mark("styles")
         
         # Alle möglichen Umrechnungen
         self.units = self.load_units()
+        self.currency_units = self.load_currency_units()
+        self.engine = ConversionEngine(self.units, self.currency_units,
+                                       RateHistory(self.rate_history_file))
+        self.timer.mark("unit tables")
         
         # Variablen
         self.setup_variables()
         
         # Benutzeroberfläche
         self.create_interface()
+        self.timer.mark("widgets")
         
         # Initialisierung
         self.initialize_data()
+        self.timer.mark("data init")
 
     def setup_styles(self):
         """Stile einrichten"""
@@ -49,155 +94,147 @@ class UniversalConverter:
         self.style.configure('Currency.TButton', background='#90EE90', font=('Segoe UI', 10, 'bold'))
         self.style.configure('Normal.TButton', background='#ADD8E6', font=('Segoe UI', 10, 'bold'))
     
-    def load_units(self):
-        """Einheiten laden"""
-        units = {
+    @staticmethod
+    def load_units():
+        """Bezeichnungen aller Kategorien und Einheiten nach Einheiten-ID laden"""
+        return {
             # Masse
-            "Masse": {
-                "Kilogramm (kg)": 1.0,
-                "Gramm (g)": 0.001,
-                "Milligramm (mg)": 1e-6,
-                "Tonne (t)": 1000.0,
-                "Pfund (lb)": 0.453592,
-                "Unze (oz)": 0.0283495,
-                "Karat (ct)": 0.0002
-            },
+            "mass": "Masse",
+            "mass.kg": "Kilogramm (kg)",
+            "mass.g": "Gramm (g)",
+            "mass.mg": "Milligramm (mg)",
+            "mass.t": "Tonne (t)",
+            "mass.lb": "Pfund (lb)",
+            "mass.oz": "Unze (oz)",
+            "mass.ct": "Karat (ct)",
             
             # Länge
-            "Länge": {
-                "Meter (m)": 1.0,
-                "Kilometer (km)": 1000.0,
-                "Zentimeter (cm)": 0.01,
-                "Millimeter (mm)": 0.001,
-                "Mikrometer (µm)": 1e-6,
-                "Zoll (in)": 0.0254,
-                "Fuß (ft)": 0.3048,
-                "Yard (yd)": 0.9144,
-                "Meile (mi)": 1609.34,
-                "Seemeile (nmi)": 1852.0
-            },
+            "length": "Länge",
+            "length.m": "Meter (m)",
+            "length.km": "Kilometer (km)",
+            "length.cm": "Zentimeter (cm)",
+            "length.mm": "Millimeter (mm)",
+            "length.um": "Mikrometer (µm)",
+            "length.in": "Zoll (in)",
+            "length.ft": "Fuß (ft)",
+            "length.yd": "Yard (yd)",
+            "length.mi": "Meile (mi)",
+            "length.nmi": "Seemeile (nmi)",
             
             # Volumen
-            "Volumen": {
-                "Liter (L)": 1.0,
-                "Milliliter (mL)": 0.001,
-                "Gallone (gal)": 3.78541,
-                "Pinte (pt)": 0.473176,
-                "Kubikmeter (m³)": 1000.0,
-                "Kubikzoll (in³)": 0.0163871,
-                "Teelöffel (tsp)": 0.00492892,
-                "Esslöffel (tbsp)": 0.0147868,
-                "Tasse (cup)": 0.236588
-            },
+            "volume": "Volumen",
+            "volume.L": "Liter (L)",
+            "volume.mL": "Milliliter (mL)",
+            "volume.gal": "Gallone (gal)",
+            "volume.pt": "Pinte (pt)",
+            "volume.m3": "Kubikmeter (m³)",
+            "volume.in3": "Kubikzoll (in³)",
+            "volume.tsp": "Teelöffel (tsp)",
+            "volume.tbsp": "Esslöffel (tbsp)",
+            "volume.cup": "Tasse (cup)",
             
             # Temperatur
-            "Temperatur": {
-                "Celsius (°C)": "celsius",
-                "Fahrenheit (°F)": "fahrenheit",
-                "Kelvin (K)": "kelvin"
-            },
+            "temperature": "Temperatur",
+            "temperature.C": "Celsius (°C)",
+            "temperature.F": "Fahrenheit (°F)",
+            "temperature.K": "Kelvin (K)",
             
             # Fläche
-            "Fläche": {
-                "Quadratmeter (m²)": 1.0,
-                "Quadratkilometer (km²)": 1e6,
-                "Quadratzentimeter (cm²)": 0.0001,
-                "Hektar (ha)": 10000.0,
-                "Acre (ac)": 4046.86,
-                "Quadratmeile (mi²)": 2.59e6,
-                "Quadratfuß (ft²)": 0.092903
-            },
+            "area": "Fläche",
+            "area.m2": "Quadratmeter (m²)",
+            "area.km2": "Quadratkilometer (km²)",
+            "area.cm2": "Quadratzentimeter (cm²)",
+            "area.ha": "Hektar (ha)",
+            "area.ac": "Acre (ac)",
+            "area.mi2": "Quadratmeile (mi²)",
+            "area.ft2": "Quadratfuß (ft²)",
             
             # Geschwindigkeit
-            "Geschwindigkeit": {
-                "m/s": 1.0,
-                "km/h": 0.277778,
-                "mph": 0.44704,
-                "Knoten": 0.514444,
-                "Mach": 343.0
-            },
+            "speed": "Geschwindigkeit",
+            "speed.m/s": "m/s",
+            "speed.km/h": "km/h",
+            "speed.mph": "mph",
+            "speed.knots": "Knoten",
+            "speed.Mach": "Mach",
             
             # Daten
-            "Daten": {
-                "Bit (bit)": 1.0,
-                "Byte (B)": 8.0,
-                "Kilobyte (KB)": 8192.0,
-                "Megabyte (MB)": 8388608.0,
-                "Gigabyte (GB)": 8589934592.0,
-                "Terabyte (TB)": 8796093022208.0
-            },
+            "data": "Daten",
+            "data.bit": "Bit (bit)",
+            "data.B": "Byte (B)",
+            "data.KB": "Kilobyte (KB)",
+            "data.MB": "Megabyte (MB)",
+            "data.GB": "Gigabyte (GB)",
+            "data.TB": "Terabyte (TB)",
             
             # Energie
-            "Energie": {
-                "Joule (J)": 1.0,
-                "Kilojoule (kJ)": 1000.0,
-                "Kalorie (cal)": 4.184,
-                "Kilokalorie (kcal)": 4184.0,
-                "kWh": 3600000.0,
-                "Elektronenvolt (eV)": 1.60218e-19
-            },
+            "energy": "Energie",
+            "energy.J": "Joule (J)",
+            "energy.kJ": "Kilojoule (kJ)",
+            "energy.cal": "Kalorie (cal)",
+            "energy.kcal": "Kilokalorie (kcal)",
+            "energy.kWh": "kWh",
+            "energy.eV": "Elektronenvolt (eV)",
             
             # Druck
-            "Druck": {
-                "Pascal (Pa)": 1.0,
-                "Bar (bar)": 100000.0,
-                "Atmosphäre (atm)": 101325.0,
-                "mmHg": 133.322,
-                "PSI": 6894.76
-            },
+            "pressure": "Druck",
+            "pressure.Pa": "Pascal (Pa)",
+            "pressure.bar": "Bar (bar)",
+            "pressure.atm": "Atmosphäre (atm)",
+            "pressure.mmHg": "mmHg",
+            "pressure.psi": "PSI",
             
             # Zeit
-            "Zeit": {
-                "Sekunde (s)": 1.0,
-                "Minute (min)": 60.0,
-                "Stunde (h)": 3600.0,
-                "Tag": 86400.0,
-                "Woche": 604800.0,
-                "Jahr": 31536000.0
-            },
+            "time": "Zeit",
+            "time.s": "Sekunde (s)",
+            "time.min": "Minute (min)",
+            "time.h": "Stunde (h)",
+            "time.day": "Tag",
+            "time.week": "Woche",
+            "time.year": "Jahr",
             
             # Strahlung
-            "Strahlung": {
-                "Sievert (Sv)": 1.0,
-                "Rem (rem)": 0.01,
-                "Rad (rad)": 0.01,
-                "Gray (Gy)": 1.0,
-                "Röntgen (R)": 0.00933
-            },
+            "radiation": "Strahlung",
+            "radiation.Sv": "Sievert (Sv)",
+            "radiation.rem": "Rem (rem)",
+            "radiation.rad": "Rad (rad)",
+            "radiation.Gy": "Gray (Gy)",
+            "radiation.R": "Röntgen (R)",
             
             # Astronomie
-            "Astronomie": {
-                "Lichtjahr (ly)": 1.0,
-                "Astronomische Einheit (AE)": 63241.1,
-                "Parsec (pc)": 3.26156,
-                "Kilometer (km)": 9.461e12,
-                "Monddistanz (LD)": 384400.0
-            },
+            "astronomy": "Astronomie",
+            "astronomy.ly": "Lichtjahr (ly)",
+            "astronomy.AU": "Astronomische Einheit (AE)",
+            "astronomy.pc": "Parsec (pc)",
+            "astronomy.km": "Kilometer (km)",
+            "astronomy.LD": "Monddistanz (LD)",
             
             # Küche
-            "Küche": {
-                "Gramm (g)": 1.0,
-                "Kilogramm (kg)": 1000.0,
-                "Unze (oz)": 28.3495,
-                "Pfund (lb)": 453.592,
-                "Teelöffel (tsp)": 5.0,
-                "Esslöffel (tbsp)": 15.0,
-                "Tasse (cup)": 240.0,
-                "Milliliter (mL)": 1.0,
-                "Liter (L)": 1000.0
-            },
+            "cooking": "Küche",
+            "cooking.g": "Gramm (g)",
+            "cooking.kg": "Kilogramm (kg)",
+            "cooking.oz": "Unze (oz)",
+            "cooking.lb": "Pfund (lb)",
+            "cooking.tsp": "Teelöffel (tsp)",
+            "cooking.tbsp": "Esslöffel (tbsp)",
+            "cooking.cup": "Tasse (cup)",
+            "cooking.mL": "Milliliter (mL)",
+            "cooking.L": "Liter (L)",
             
             # Winkel
-            "Winkel": {
-                "Grad (°)": 1.0,
-                "Radiant (rad)": 57.2958,
-                "Gon (grad)": 0.9,
-                "Umdrehung (rev)": 360.0
-            }
+            "angles": "Winkel",
+            "angles.deg": "Grad (°)",
+            "angles.rad": "Radiant (rad)",
+            "angles.grad": "Gon (grad)",
+            "angles.rev": "Umdrehung (rev)",
+            
+            # Währungen
+            "currency": "Währung"
         }
-        
-        # Währungen separat
-        self.currency_units = {
+    
+    @staticmethod
+    def load_currency_units():
+        """Währungseinheiten laden"""
+        return {
             "USD (US-Dollar)": 1.0,
             "EUR (Euro)": 0.85,
             "RUB (Russischer Rubel)": 75.0,
@@ -210,8 +247,6 @@ class UniversalConverter:
             "INR (Indische Rupie)": 75.0,
             "BRL (Brasilianischer Real)": 5.25
         }
-        
-        return units
     
     def setup_variables(self):
         """Variablen initialisieren"""
@@ -221,8 +256,11 @@ class UniversalConverter:
         self.input_value = tk.StringVar(value="1.0")
         self.result_value = tk.StringVar(value="")
         self.status_var = tk.StringVar(value="Bereit")
+        self.schedule_var = tk.StringVar(value="")
         self.api_key_var = tk.StringVar(value=self.API_KEY or "")
-        self.history = []
+        self.history = History(self.HISTORY_LIMIT, self.engine.registry)
+        self.history_search = tk.StringVar(value="")
+        self.history_search_job = None
     
     def create_interface(self):
         """Benutzeroberfläche erstellen"""
@@ -254,12 +292,20 @@ class UniversalConverter:
         ttk.Button(self.api_frame, text="API speichern", 
                   command=self.save_api_key).grid(row=0, column=2, padx=5, pady=5)
         
-        ttk.Button(self.api_frame, text="Kurse aktualisieren", 
-                  command=self.update_currency_rates).grid(row=0, column=3, padx=5, pady=5)
+        self.update_btn = ttk.Button(self.api_frame, text="Kurse aktualisieren", 
+                                     command=self.update_currency_rates)
+        self.update_btn.grid(row=0, column=3, padx=5, pady=5)
         
         ttk.Button(self.api_frame, text="Anleitung", 
                   command=self.show_api_instructions).grid(row=0, column=4, padx=5, pady=5)
         
+        # Sichtbar, während Kurse geladen werden
+        self.rate_progress = ttk.Progressbar(self.api_frame, mode='indeterminate', length=80)
+        
+        # Nächste geplante Aktualisierung und Anfragen in diesem Monat
+        ttk.Label(self.api_frame, textvariable=self.schedule_var).grid(
+            row=1, column=0, columnspan=6, padx=5, sticky=tk.W)
+        
         # Umrechnungsrahmen
         self.conv_frame = ttk.LabelFrame(main_frame, text="Umrechnung")
         self.conv_frame.pack(fill=tk.X, pady=5)
@@ -269,7 +315,7 @@ class UniversalConverter:
         self.category_combo = ttk.Combobox(
             self.conv_frame, 
             textvariable=self.current_category, 
-            values=list(self.units.keys()), 
+            values=self.engine.registry.category_labels(), 
             state="readonly", 
             width=25
         )
@@ -309,13 +355,19 @@ class UniversalConverter:
         ttk.Label(main_frame, textvariable=self.status_var, font=('Segoe UI', 9)).pack(anchor=tk.W)
         
         # Verlauf
-        history_frame = ttk.LabelFrame(main_frame, text="Verlauf (letzte 20)")
+        history_frame = ttk.LabelFrame(main_frame, text="Verlauf")
         history_frame.pack(fill=tk.BOTH, expand=True, pady=10)
         
-        self.history_text = scrolledtext.ScrolledText(history_frame, wrap=tk.WORD, 
-                                                    font=('Consolas', 9))
-        self.history_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        self.history_text.config(state=tk.DISABLED)
+        # Verlaufssuche
+        search_frame = ttk.Frame(history_frame)
+        search_frame.pack(fill=tk.X, padx=5, pady=(5, 0))
+        ttk.Label(search_frame, text="Suchen:").pack(side=tk.LEFT)
+        ttk.Entry(search_frame, textvariable=self.history_search).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.history_search.trace_add("write", self.search_history)
+        
+        self.history_view = VirtualList(history_frame, [("Nr.", 70), ("Zeit", 130), ("Umrechnung", 600)],
+                                        count=self.history.visible, row=self.history_row)
+        self.history_view.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
         # Verlauf-Buttons
         history_btn_frame = ttk.Frame(history_frame)
@@ -323,20 +375,30 @@ class UniversalConverter:
 
         ttk.Button(history_btn_frame, text="Verlauf löschen", 
                   command=self.clear_history).pack(side=tk.LEFT, padx=5)
-        ttk.Button(history_btn_frame, text="Verlauf speichern", 
-                  command=self.save_history).pack(side=tk.LEFT, padx=5)
+        self.save_btn = ttk.Button(history_btn_frame, text="Verlauf speichern", 
+                                   command=self.save_history)
+        self.save_btn.pack(side=tk.LEFT, padx=5)
+        self.export_progress = ttk.Progressbar(history_btn_frame, mode='determinate',
+                                               length=150, maximum=1.0)
         
         # Beenden-Button
         btn_frame = ttk.Frame(main_frame)
         btn_frame.pack(fill=tk.X, pady=5)
         
         ttk.Button(btn_frame, text="Beenden", 
-                  command=self.root.quit).pack(side=tk.RIGHT)
+                  command=self.close).pack(side=tk.RIGHT)
     
     def toggle_currency_mode(self):
         """Zwischen normalem und Währungsrechner wechseln"""
         self.currency_mode = not self.currency_mode
+        self.apply_mode()
         
+        # Bei Moduswechsel Eingabe zurücksetzen
+        self.input_value.set("1.0")
+        self.result_value.set("")
+    
+    def apply_mode(self):
+        """Widgets des aktuellen Modus anordnen"""
         if self.currency_mode:
             self.mode_btn.config(text="Normaler Rechner", style='Normal.TButton')
             self.api_frame.pack(fill=tk.X, pady=5, before=self.conv_frame)
@@ -346,12 +408,11 @@ class UniversalConverter:
             self.category_combo.grid_forget()
             
             # Währungseinheiten aktualisieren
-            self.from_combo['values'] = list(self.currency_units.keys())
-            self.to_combo['values'] = list(self.currency_units.keys())
+            self.update_currency_list()
             
-            if not self.from_unit.get() or self.from_unit.get() not in self.currency_units:
+            if self.engine.registry.get(self.from_unit.get(), "currency") is None:
                 self.from_unit.set("USD (US-Dollar)")
-            if not self.to_unit.get() or self.to_unit.get() not in self.currency_units:
+            if self.engine.registry.get(self.to_unit.get(), "currency") is None:
                 self.to_unit.set("EUR (Euro)")
         else:
             self.mode_btn.config(text="Währungsrechner", style='Currency.TButton')
@@ -367,18 +428,23 @@ class UniversalConverter:
         # Layout aktualisieren
         self.units_frame.grid(row=1, column=0, columnspan=3, sticky=tk.EW, pady=5)
         self.value_frame.grid(row=2, column=0, columnspan=3, sticky=tk.EW, pady=5)
-        
-        # Bei Moduswechsel Eingabe zurücksetzen
-        self.input_value.set("1.0")
-        self.result_value.set("")
     
     def initialize_data(self):
         """Daten initialisieren"""
-        self.load_currency_rates()
-        self.update_units()
-        self.load_history()
-        self.toggle_currency_mode()  # Start im normalen Modus
-        self.toggle_currency_mode()  # Zurückschalten für korrekte Initialisierung
+        # Normalmodus einmal anordnen; Kurse und Verlauf kommen aus den Start-Threads
+        self.apply_mode()
+        self.poll_startup()
+    
+    def poll_startup(self):
+        """Beim Start gelesene Kurse und Verlauf übernehmen, sobald sie bereit sind"""
+        if self.startup_rates is not None and self.startup_rates.poll() is not None:
+            self.load_currency_rates(self.startup_rates)
+            self.startup_rates = None
+        if self.startup_history is not None and self.startup_history.poll() is not None:
+            self.load_history(self.startup_history)
+            self.startup_history = None
+        if self.startup_rates is not None or self.startup_history is not None:
+            self.root.after(20, self.poll_startup)
     
     def update_units(self, event=None):
         """Einheitenliste aktualisieren"""
@@ -386,7 +452,7 @@ class UniversalConverter:
             return
             
         category = self.current_category.get()
-        units = list(self.units[category].keys())
+        units = list(self.engine.registry.category(category).labels)
         
         self.from_combo['values'] = units
         self.to_combo['values'] = units
@@ -403,6 +469,9 @@ class UniversalConverter:
             if os.path.exists(self.api_file):
                 with open(self.api_file, 'r') as f:
                     data = json.load(f)
+                    self.REQUEST_TIMEOUT = data.get('timeout', self.REQUEST_TIMEOUT)
+                    self.BASE_URL = data.get('base_url', self.BASE_URL)
+                    self.provider_config = data.get('providers', self.provider_config)
                     return data.get('api_key', "")
         except Exception as e:
             print(f"Fehler beim Laden des API-Schlüssels: {e}")
@@ -411,14 +480,25 @@ class UniversalConverter:
     def save_api_key(self):
         """API-Schlüssel in Datei speichern"""
         self.API_KEY = self.api_key_var.get().strip()
+        self.build_rate_providers()
         try:
             with open(self.api_file, 'w') as f:
-                json.dump({'api_key': self.API_KEY}, f)
+                json.dump({'api_key': self.API_KEY, 'timeout': self.REQUEST_TIMEOUT,
+                           'base_url': self.BASE_URL, 'providers': self.provider_config}, f)
             messagebox.showinfo("Erfolg", "API-Schlüssel gespeichert!")
             self.load_currency_rates()  # Kurse mit neuem Schlüssel laden
         except Exception as e:
             messagebox.showerror("Fehler", f"Fehler beim Speichern: {str(e)}")
     
+    def build_rate_providers(self):
+        """Kursquellen: die API bei gesetztem Schlüssel und die aus converter_api.json"""
+        api_url = f"{self.BASE_URL}{self.API_KEY}/latest/USD" if self.API_KEY else None
+        try:
+            self.rate_providers = build_providers(self.provider_config, api_url, self.rate_client)
+        except (KeyError, ValueError) as e:
+            print(f"Fehler in den Kursquellen: {e}")
+            self.rate_providers = build_providers((), api_url, self.rate_client)
+    
     def show_api_instructions(self):
         """API-Anleitung anzeigen"""
         instructions = """
@@ -436,109 +516,177 @@ class UniversalConverter:
         """
         messagebox.showinfo("API-Anleitung", instructions)
     
-    def load_currency_rates(self):
+    def load_currency_rates(self, prefetch=None):
         """Wechselkurse aus Datei oder API laden"""
         try:
             # Versuch, aus Datei zu laden
-            if os.path.exists(self.rates_file):
-                with open(self.rates_file, 'r') as f:
-                    data = json.load(f)
-                    last_update = datetime.strptime(data['last_update'], '%Y-%m-%d')
-                    
-                    # Wenn letzte Aktualisierung weniger als 7 Tage her
-                    if datetime.now() - last_update < timedelta(days=7):
-                        self.rates = data['rates']
-                        self.last_update = last_update
-                        self.status_var.set(f"Kurse geladen ({last_update.strftime('%d.%m.%Y')})")
-                        
-                        # Koeffizienten in currency_units aktualisieren
-                        for curr, rate in self.rates.items():
-                            for key in list(self.currency_units.keys()):
-                                if key.startswith(curr + " "):
-                                    self.currency_units[key] = rate
-                                    break
-                        return
-            
-            # Wenn keine Datei oder veraltete Daten, aber API-Schlüssel vorhanden - aktualisieren
-            if self.API_KEY:
-                self.update_currency_rates()
+            if prefetch is not None:
+                cache = prefetch.result()
             else:
+                cache = read_rates(self.rates_file, self.legacy_rates_file)
+            if cache is not None:
+                self.rates, self.rate_validators, last_update = cache
+                self.last_update = last_update
+                self.status_var.set(f"Kurse geladen ({last_update.strftime('%d.%m.%Y')})")
+                self.apply_currency_rates()
+            elif not self.rates:
                 self.status_var.set("Verwendete gespeicherte Kurse (nicht aktualisiert)")
-                
         except Exception as e:
             self.status_var.set(f"Fehler beim Laden: {str(e)}")
             # Standardwerte verwenden
+        
+        # Aktualisieren, wenn der Planer neue Kurse erwartet
+        if self.rate_providers and self.rate_schedule.is_due():
+            self.update_currency_rates(notify=False)
+        self.schedule_rate_refresh()
     
-    def update_currency_rates(self):
+    def update_currency_rates(self, notify=True):
         """Wechselkurse via API aktualisieren"""
-        if not self.API_KEY:
+        if not self.rate_providers:
             messagebox.showwarning("Fehler", "API-Schlüssel eingeben zum Aktualisieren")
             return
             
+        if self.rate_fetch is not None:
+            return
+        if not self.rate_schedule.remaining():
+            when = datetime.fromtimestamp(self.rate_schedule.next_fetch()).strftime('%d.%m.%Y %H:%M')
+            messagebox.showwarning("Fehler", f"Monatliches Anfragelimit erreicht, nächste Aktualisierung {when}")
+            return
+        
+        # Die Anfrage läuft in einem Hintergrund-Thread, das Fenster bleibt bedienbar
+        self.status_var.set("Aktualisiere Kurse...")
+        self.update_btn.config(text="Abbrechen", command=self.cancel_rate_update)
+        self.rate_progress.grid(row=0, column=5, padx=5, pady=5)
+        self.rate_progress.start(10)
+        self.rate_notify = notify
+        self.rate_fetch = RateFetch(self.rate_providers, self.rate_validators)
+        self.root.after(100, self.poll_rate_update, self.rate_fetch)
+    
+    def poll_rate_update(self, fetch):
+        """Ergebnis der Hintergrundaktualisierung abholen"""
+        if fetch is not self.rate_fetch:
+            return
+        result = fetch.poll()
+        if result is None:
+            self.root.after(100, self.poll_rate_update, fetch)
+            return
+        self.finish_rate_update()
+        self.record_rate_fetch(fetch, result)
+        
         try:
-            self.status_var.set("Aktualisiere Kurse...")
-            self.root.update()
+            response, error = result
+            if error is not None:
+                raise error
+            self.rate_validators[response.provider] = response.validators
             
-            response = requests.get(f"{self.BASE_URL}{self.API_KEY}/latest/USD")
-            data = response.json()
+            if response.not_modified:
+                # 304: gespeicherte Kurse sind aktuell, nur das Datum wird erneuert
+                self.last_update = datetime.now()
+                self.apply_currency_rates()
+                self.save_currency_rates()
+                self.status_var.set(f"Kurse sind aktuell ({self.last_update.strftime('%d.%m.%Y')})")
+                return
+            data = response.data
             
             if data['result'] == 'success':
-                self.rates = {
-                    'USD': 1.0,
-                    'EUR': data['conversion_rates']['EUR'],
-                    'RUB': data['conversion_rates']['RUB'],
-                    'GBP': data['conversion_rates']['GBP'],
-                    'JPY': data['conversion_rates']['JPY'],
-                    'CNY': data['conversion_rates']['CNY'],
-                    'AUD': data['conversion_rates']['AUD'],
-                    'CAD': data['conversion_rates']['CAD'],
-                    'CHF': data['conversion_rates']['CHF'],
-                    'INR': data['conversion_rates']['INR'],
-                    'BRL': data['conversion_rates']['BRL']
-                }
+                self.rates = data['conversion_rates']
                 
-                # Koeffizienten in currency_units aktualisieren
-                for curr, rate in self.rates.items():
-                    for key in list(self.currency_units.keys()):
-                        if key.startswith(curr + " "):
-                            self.currency_units[key] = rate
-                            break
+                self.apply_currency_rates()
+                # Jeder Kursstand wird für Umrechnungen zu einem Stichtag gespeichert
+                self.engine.history.add(self.rates, data.get('time_last_update_unix'))
                 
                 # In Datei speichern
                 self.last_update = datetime.now()
-                with open(self.rates_file, 'w') as f:
-                    json.dump({
-                        'rates': self.rates,
-                        'last_update': self.last_update.strftime('%Y-%m-%d')
-                    }, f)
+                self.save_currency_rates()
                 
                 self.status_var.set(f"Kurse aktualisiert ({self.last_update.strftime('%d.%m.%Y')})")
-                messagebox.showinfo("Erfolg", "Wechselkurse erfolgreich aktualisiert!")
+                if self.rate_notify:
+                    messagebox.showinfo("Erfolg", "Wechselkurse erfolgreich aktualisiert!")
             else:
                 error_msg = data.get('error-type', 'Unbekannter Fehler')
                 self.status_var.set(f"API-Fehler: {error_msg}")
-                messagebox.showerror("API-Fehler", f"Aktualisierungsfehler: {error_msg}")
+                if self.rate_notify:
+                    messagebox.showerror("API-Fehler", f"Aktualisierungsfehler: {error_msg}")
                 
         except Exception as e:
             self.status_var.set(f"Aktualisierungsfehler: {str(e)}")
-            messagebox.showerror("Fehler", f"Aktualisierungsfehler: {str(e)}")
+            if self.rate_notify:
+                messagebox.showerror("Fehler", f"Aktualisierungsfehler: {str(e)}")
+    
+    def record_rate_fetch(self, fetch, result):
+        """Anfrage auf das Limit anrechnen und die nächste planen"""
+        response, error = result
+        success = error is None and (response.not_modified or (
+            isinstance(response.data, dict) and response.data.get('result') == 'success'))
+        next_update = None
+        if success and not response.not_modified:
+            next_update = response.data.get('time_next_update_unix')
+        self.rate_schedule.record(fetch.count_sent(), success, next_update)
+        self.schedule_rate_refresh()
+    
+    def schedule_rate_refresh(self):
+        """Nächste automatische Kursaktualisierung planen"""
+        if self.refresh_job is not None:
+            self.root.after_cancel(self.refresh_job)
+            self.refresh_job = None
+        if not self.rate_providers:
+            self.schedule_var.set("")
+            return
+        next_fetch = self.rate_schedule.next_fetch()
+        when = datetime.fromtimestamp(next_fetch).strftime('%d.%m.%Y %H:%M')
+        used = self.rate_schedule.quota - self.rate_schedule.remaining()
+        self.schedule_var.set(f"Nächste Aktualisierung: {when} · {used}/{self.rate_schedule.quota} Anfragen in diesem Monat")
+        # Mindestens stündlich prüfen, damit der Ruhezustand nichts verzögert
+        delay = min(max(next_fetch - datetime.now().timestamp(), 1), 3600)
+        self.refresh_job = self.root.after(int(delay * 1000), self.scheduled_refresh)
+    
+    def scheduled_refresh(self):
+        """Automatische Kursaktualisierung"""
+        self.refresh_job = None
+        if self.rate_providers and self.rate_fetch is None and self.rate_schedule.is_due():
+            self.update_currency_rates(notify=False)
+        else:
+            self.schedule_rate_refresh()
+    
+    def apply_currency_rates(self):
+        """Kurse in die Währungstabelle übernehmen"""
+        self.engine.set_rates(self.rates)
+        if self.currency_mode:
+            self.update_currency_list()
+    
+    def save_currency_rates(self):
+        """Kurse in Datei speichern"""
+        write_rate_cache(self.rates_file, self.rates, self.last_update.timestamp(),
+                         self.rate_validators)
+    
+    def cancel_rate_update(self):
+        """Kursaktualisierung abbrechen"""
+        if self.rate_fetch is not None:
+            self.rate_fetch.cancel()
+            self.rate_schedule.record(self.rate_fetch.count_sent(), False)
+        self.finish_rate_update()
+        self.schedule_rate_refresh()
+        self.status_var.set("Aktualisierung abgebrochen")
+    
+    def finish_rate_update(self):
+        """Aktualisierungszustand beenden"""
+        self.rate_fetch = None
+        self.rate_progress.stop()
+        self.rate_progress.grid_remove()
+        self.update_btn.config(text="Kurse aktualisieren", command=self.update_currency_rates)
     
     def get_currency_name(self, code):
         """Währungsname anhand Code erhalten"""
-        names = {
-            'USD': 'US-Dollar',
-            'EUR': 'Euro',
-            'RUB': 'Russischer Rubel',
-            'GBP': 'Britisches Pfund',
-            'JPY': 'Japanischer Yen',
-            'CNY': 'Chinesischer Yuan',
-            'AUD': 'Australischer Dollar',
-            'CAD': 'Kanadischer Dollar',
-            'CHF': 'Schweizer Franken',
-            'INR': 'Indische Rupie',
-            'BRL': 'Brasilianischer Real'
-        }
-        return names.get(code, code)
+        unit = self.engine.registry.get(code, "currency")
+        if unit is None:
+            return code
+        return unit.label.partition(" (")[2].rstrip(")") or code
+    
+    def update_currency_list(self):
+        """Währungsliste aktualisieren"""
+        currencies = list(self.engine.registry.category("currency").labels)
+        self.from_combo['values'] = currencies
+        self.to_combo['values'] = currencies
     
     def convert(self):
         """Umrechnung durchführen"""
@@ -547,9 +695,17 @@ class UniversalConverter:
             if not input_value:
                 raise ValueError("Geben Sie einen Wert ein")
             
-            value = float(input_value)
+            try:
+                value = float(input_value)
+            except ValueError:
+                value = None
             
-            if self.currency_mode:
+            if value is None:
+                # Ausdruck wie "3 ft 2 in to cm" oder "12.5 psi -> bar"
+                result, category, to_unit = self.engine.evaluate(input_value)
+                self.add_to_history(make_record(self.engine.registry, EXPRESSION, category,
+                                                None, to_unit, input_value, result))
+            elif self.currency_mode:
                 from_unit = self.from_unit.get()
                 to_unit = self.to_unit.get()
                 
@@ -561,12 +717,14 @@ class UniversalConverter:
                     return
                 
                 # Überprüfen, ob Währungen im Wörterbuch existieren
-                if from_unit not in self.currency_units or to_unit not in self.currency_units:
+                currencies = self.engine.registry.category("currency")
+                if currencies.get(from_unit) is None or currencies.get(to_unit) is None:
                     raise ValueError("Ausgewählte Währungen nicht gefunden")
                 
                 # Umrechnung mit gespeicherten Werten
-                result = value * (self.currency_units[to_unit] / self.currency_units[from_unit])
-                self.add_to_history(f"{value} {from_unit} → {result:.6f} {to_unit} (Währung)")
+                result = self.engine.convert(value, currencies, from_unit, to_unit)
+                self.add_to_history(make_record(self.engine.registry, CURRENCY, currencies,
+                                                from_unit, to_unit, value, result))
             else:
                 category = self.current_category.get()
                 from_unit = self.from_unit.get()
@@ -579,24 +737,10 @@ class UniversalConverter:
                     self.result_value.set(value)
                     return
                     
-                if category == "Temperatur":
-                    result = self.convert_temperature(value, from_unit, to_unit)
-                else:
-                    # Andere Kategorien verwenden Standardlogik
-                    from_val = self.units[category][from_unit]
-                    to_val = self.units[category][to_unit]
-                    
-                    if callable(from_val):
-                        base = from_val(value, False)
-                    else:
-                        base = value * from_val
-                        
-                    if callable(to_val):
-                        result = to_val(base, True)
-                    else:
-                        result = base / to_val
+                result = self.engine.convert(value, category, from_unit, to_unit)
                 
-                self.add_to_history(f"{value} {from_unit} → {result:.6f} {to_unit} ({category})")
+                self.add_to_history(make_record(self.engine.registry, UNITS, category,
+                                                from_unit, to_unit, value, result))
             
             # Ergebnis formatieren (überflüssige Nullen entfernen)
             formatted_result = "{0:.8f}".format(result).rstrip('0').rstrip('.') if '.' in "{0:.8f}".format(result) else str(result)
@@ -607,27 +751,6 @@ class UniversalConverter:
         except Exception as e:
             messagebox.showerror("Fehler", f"Umrechnungsfehler: {str(e)}")
     
-    def convert_temperature(self, value, from_unit, to_unit):
-        """Temperatur umrechnen"""
-        if from_unit == to_unit:
-            return value
-            
-        # Zu Celsius
-        if "Fahrenheit" in from_unit:
-            celsius = (value - 32) * 5/9
-        elif "Kelvin" in from_unit:
-            celsius = value - 273.15
-        else:
-            celsius = value
-            
-        # Von Celsius
-        if "Fahrenheit" in to_unit:
-            return celsius * 9/5 + 32
-        elif "Kelvin" in to_unit:
-            return celsius + 273.15
-        else:
-            return celsius
-    
     def swap_units(self):
         """Einheiten tauschen"""
         from_unit = self.from_unit.get()
@@ -637,55 +760,144 @@ class UniversalConverter:
         if self.result_value.get():
             self.convert()
     
-    def add_to_history(self, entry):
+    def add_to_history(self, record, save=True):
         """Zum Verlauf hinzufügen"""
-        self.history.append(entry)
-        if len(self.history) > 20:
-            self.history.pop(0)
-        
-        self.history_text.config(state=tk.NORMAL)
-        self.history_text.delete(1.0, tk.END)
-        for i, item in enumerate(reversed(self.history), 1):
-            self.history_text.insert(tk.END, f"{i}. {item}\n")
-        self.history_text.config(state=tk.DISABLED)
-        self.history_text.see(tk.END)
+        visible = self.history.append(record)
+        if save:
+            # flush_history() schreibt es binnen einer Sekunde ins Journal
+            self.history_journal.append(record.as_dict())
+            if self.history_flush_job is None:
+                self.history_flush_job = self.root.after(1000, self.flush_history)
+        self.history_view.inserted(1 if visible else 0)
+    
+    def history_row(self, index):
+        """Werte der Zeile index der Verlaufsansicht, neuester Eintrag zuerst"""
+        number = self.history.visible_number(index)
+        record = self.history[number]
+        when = datetime.fromtimestamp(record.time).strftime('%d.%m.%Y %H:%M') if record.time else ""
+        return (number, when, describe(record, self.engine.registry))
+    
+    def search_history(self, *args):
+        """Verlauf nach den Wörtern im Suchfeld filtern, sobald die Eingabe pausiert"""
+        if self.history_search_job is not None:
+            self.root.after_cancel(self.history_search_job)
+        self.history_search_job = self.root.after(150, self.apply_history_search)
+    
+    def apply_history_search(self):
+        """Suche auf die Verlaufsansicht anwenden"""
+        self.history_search_job = None
+        self.history.search(Query(self.history_search.get(), self.engine.registry))
+        self.history_view.show(0)
     
     def clear_history(self):
         """Verlauf löschen"""
-        self.history = []
-        self.history_text.config(state=tk.NORMAL)
-        self.history_text.delete(1.0, tk.END)
-        self.history_text.config(state=tk.DISABLED)
+        self.history.clear()
+        try:
+            self.history_journal.clear()
+        except OSError as e:
+            self.status_var.set(f"Verlauf konnte nicht gespeichert werden: {str(e)}")
+        self.history_view.refresh()
     
     def save_history(self):
-        """Verlauf speichern"""
+        """Verlauf in einem Hintergrund-Thread in eine Datei exportieren"""
+        if self.history_export is not None:
+            return
+        filetypes = [("Textdateien", "*.txt"), ("CSV-Dateien", "*.csv"), ("JSON-Lines-Dateien", "*.jsonl")]
+        if parquet_available():
+            filetypes.append(("Parquet-Dateien", "*.parquet"))
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".txt",
+            filetypes=filetypes + [("Alle Dateien", "*.*")],
+            title="Verlauf speichern"
+        )
+        if not file_path:
+            return
+        
+        # Der Export liest das Journal, daher zuerst wartende Einträge schreiben
+        if self.history_flush_job is not None:
+            self.root.after_cancel(self.history_flush_job)
+        self.flush_history(wait=True)
+        self.history_export = HistoryExport(self.history_journal.path, file_path,
+                                            self.engine.registry, "Umrechnungsverlauf")
+        self.save_btn.config(text="Abbrechen", command=self.cancel_history_export)
+        self.export_progress["value"] = 0.0
+        self.export_progress.pack(side=tk.LEFT, padx=5)
+        self.root.after(100, self.poll_history_export, self.history_export)
+    
+    def poll_history_export(self, export):
+        """Fortschritt des Verlaufsexports anzeigen, danach sein Ergebnis"""
+        if export is not self.history_export:
+            return
+        self.export_progress["value"] = export.done
+        result = export.poll()
+        if result is None:
+            self.root.after(100, self.poll_history_export, export)
+            return
+        self.finish_history_export()
+        
         try:
-            file_path = filedialog.asksaveasfilename(
-                defaultextension=".txt",
-                filetypes=[("Textdateien", "*.txt"), ("Alle Dateien", "*.*")],
-                title="Verlauf speichern"
-            )
-            if file_path:
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write("Umrechnungsverlauf:\n")
-                    f.write("="*50 + "\n")
-                    for i, item in enumerate(self.history, 1):
-                        f.write(f"{i}. {item}\n")
-                messagebox.showinfo("Erfolg", "Verlauf gespeichert")
+            _, error = result
+            if error is not None:
+                raise error
+            messagebox.showinfo("Erfolg", "Verlauf gespeichert")
         except Exception as e:
             messagebox.showerror("Fehler", f"Speicherfehler: {str(e)}")
     
-    def load_history(self):
+    def cancel_history_export(self):
+        """Verlaufsexport abbrechen"""
+        if self.history_export is not None:
+            self.history_export.cancel()
+        self.finish_history_export()
+        self.status_var.set("Verlaufsexport abgebrochen")
+    
+    def finish_history_export(self):
+        """Laufenden Verlaufsexport beenden"""
+        self.history_export = None
+        self.export_progress.pack_forget()
+        self.save_btn.config(text="Verlauf speichern", command=self.save_history)
+    
+    def flush_history(self, wait=False):
+        """Wartende Verlaufseinträge ins Journal schreiben"""
+        self.history_flush_job = None
+        try:
+            self.history_journal.flush(wait)
+        except OSError as e:
+            self.status_var.set(f"Verlauf konnte nicht gespeichert werden: {str(e)}")
+        # Noch in der Warteschlange, während das Journal verdichtet wird
+        if not wait and self.history_journal.pending:
+            self.history_flush_job = self.root.after(1000, self.flush_history)
+    
+    def load_history(self, prefetch=None):
         """Verlauf laden"""
         try:
-            if os.path.exists("converter_history.json"):
-                with open("converter_history.json", "r", encoding="utf-8") as f:
-                    self.history = json.load(f)
-                self.add_to_history("Verlauf geladen")
-        except:
-            pass
+            if prefetch is not None:
+                records = prefetch.result()
+            else:
+                records = read_records(self.history_journal, self.HISTORY_LIMIT)
+        except (OSError, ValueError) as e:
+            self.status_var.set(f"Fehler beim Laden des Verlaufs: {str(e)}")
+            return
+        if records:
+            # Während des Lesens hinzugefügte Einträge bleiben die neuesten
+            self.history.reset(records + list(self.history))
+            self.add_to_history(note("Verlauf geladen"), save=False)
+    
+    def close(self):
+        """Ausstehenden Verlauf speichern und Fenster schließen"""
+        if self.history_export is not None:
+            self.history_export.cancel()
+        if self.history_flush_job is not None:
+            self.root.after_cancel(self.history_flush_job)
+        self.flush_history(wait=True)
+        self.root.destroy()
 
 if __name__ == "__main__":
+    # --timing gibt die Dauer jeder Startphase aus
+    timer = PhaseTimer(STARTED)
+    timer.mark("imports")
     root = tk.Tk()
-    app = UniversalConverter(root)
+    timer.mark("tk")
+    app = UniversalConverter(root, timer)
+    if "--timing" in sys.argv:
+        root.after_idle(timer.report)
     root.mainloop()
\ No newline at end of file
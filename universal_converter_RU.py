@@ -1,40 +1,85 @@
+import time
+STARTED = time.perf_counter()  # начало импортов, для --timing
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext, filedialog
+from tkinter import ttk, messagebox, filedialog
 import os
+import sys
 import json
 import math
-from datetime import datetime, timedelta
-import requests
+from datetime import datetime
+from converter_engine import ConversionEngine
+from converter_history import (CURRENCY, EXPRESSION, UNITS, History, Query, describe,
+                               make_record, note, read_records)
+from converter_history_export import HistoryExport, parquet_available
+from converter_history_journal import HistoryJournal
+from converter_providers import build_providers
+from converter_rate_cache import read_rates, write_rate_cache
+from converter_rate_history import RateHistory
+from converter_rates import RateClient, RateFetch, RefreshScheduler
+from converter_tasks import Background
+from converter_timing import PhaseTimer
+from converter_widgets import VirtualList
 
 class UniversalConverter:
-    def __init__(self, root):
+    def __init__(self, root, timer=None):
         self.root = root
+        self.timer = timer or PhaseTimer()
         self.root.title("UNIVERSAL CONVERTER V1")  # Изменено на V1
         self.root.geometry("1000x750")
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         
         # Настройки API
         self.api_file = "converter_api.json"
-        self.rates_file = "currency_rates.json"
+        self.rates_file = "currency_rates.bin"
+        self.legacy_rates_file = "currency_rates.json"  # старый JSON-кэш, читается один раз, если нет двоичного
+        self.rate_history_file = "currency_history.sqlite"
+        self.HISTORY_LIMIT = 100000  # сколько записей хранит панель истории
+        # Каждая конвертация дописывается в этот журнал пакетами
+        self.history_journal = HistoryJournal("converter_history.jsonl", keep=self.HISTORY_LIMIT)
+        self.history_flush_job = None
+        self.history_export = None  # текущий HistoryExport, None если экспорта нет
+        # Сохранённые курсы и историю читаем в фоновых потоках, пока строится окно
+        self.startup_rates = Background(read_rates, self.rates_file, self.legacy_rates_file,
+                                        name="load-rates")
+        self.startup_history = Background(read_records, self.history_journal, self.HISTORY_LIMIT,
+                                          name="load-history")
+        # Когда обновлять курсы, не превышая месячный лимит запросов
+        self.rate_schedule = RefreshScheduler("rate_schedule.json")
+        self.BASE_URL = "https://v6.exchangerate-api.com/v6/"  # можно изменить ключом "base_url" в converter_api.json
+        self.REQUEST_TIMEOUT = 10  # секунды, можно изменить ключом "timeout" в converter_api.json
+        self.provider_config = []  # дополнительные источники курсов, "providers" в converter_api.json
         self.API_KEY = self.load_api_key()
-        self.BASE_URL = "https://v6.exchangerate-api.com/v6/"
+        self.rate_client = RateClient(self.REQUEST_TIMEOUT)
+        self.build_rate_providers()
         self.rates = {}
         self.last_update = None
         self.currency_mode = False
+        self.rate_fetch = None
+        self.rate_notify = True
+        self.refresh_job = None
+        self.rate_validators = {}  # ETag / Last-Modified сохранённых курсов по источникам
 
         # Стили
         self.setup_styles()
+        self.timer.mark("styles")
         
         # Все возможные конвертации
         self.units = self.load_units()
+        self.currency_units = self.load_currency_units()
+        self.engine = ConversionEngine(self.units, self.currency_units,
+                                       RateHistory(self.rate_history_file))
+        self.timer.mark("unit tables")
         
         # Переменные
         self.setup_variables()
         
         # Создание интерфейса
         self.create_interface()
+        self.timer.mark("widgets")
         
         # Инициализация данных
         self.initialize_data()
+        self.timer.mark("data init")
 
     def setup_styles(self):
         """Настройка стилей интерфейса"""
@@ -49,155 +94,147 @@ class UniversalConverter:
         self.style.configure('Currency.TButton', background='#90EE90', font=('Segoe UI', 10, 'bold'))
         self.style.configure('Normal.TButton', background='#ADD8E6', font=('Segoe UI', 10, 'bold'))
     
-    def load_units(self):
-        """Загрузка всех единиц измерения"""
-        units = {
+    @staticmethod
+    def load_units():
+        """Загрузка названий всех категорий и единиц измерения по ID единицы"""
+        return {
             # Масса
-            "Масса": {
-                "Килограмм (кг)": 1.0,
-                "Грамм (г)": 0.001,
-                "Миллиграмм (мг)": 1e-6,
-                "Тонна (т)": 1000.0,
-                "Фунт (lb)": 0.453592,
-                "Унция (oz)": 0.0283495,
-                "Карат (кар)": 0.0002
-            },
+            "mass": "Масса",
+            "mass.kg": "Килограмм (кг)",
+            "mass.g": "Грамм (г)",
+            "mass.mg": "Миллиграмм (мг)",
+            "mass.t": "Тонна (т)",
+            "mass.lb": "Фунт (lb)",
+            "mass.oz": "Унция (oz)",
+            "mass.ct": "Карат (кар)",
             
             # Длина
-            "Длина": {
-                "Метр (м)": 1.0,
-                "Километр (км)": 1000.0,
-                "Сантиметр (см)": 0.01,
-                "Миллиметр (мм)": 0.001,
-                "Микрометр (мкм)": 1e-6,
-                "Дюйм (in)": 0.0254,
-                "Фут (ft)": 0.3048,
-                "Ярд (yd)": 0.9144,
-                "Миля (mi)": 1609.34,
-                "Морская миля (nmi)": 1852.0
-            },
+            "length": "Длина",
+            "length.m": "Метр (м)",
+            "length.km": "Километр (км)",
+            "length.cm": "Сантиметр (см)",
+            "length.mm": "Миллиметр (мм)",
+            "length.um": "Микрометр (мкм)",
+            "length.in": "Дюйм (in)",
+            "length.ft": "Фут (ft)",
+            "length.yd": "Ярд (yd)",
+            "length.mi": "Миля (mi)",
+            "length.nmi": "Морская миля (nmi)",
             
             # Объем
-            "Объем": {
-                "Литр (л)": 1.0,
-                "Миллилитр (мл)": 0.001,
-                "Галлон (gal)": 3.78541,
-                "Пинта (pt)": 0.473176,
-                "Куб. метр (м³)": 1000.0,
-                "Куб. дюйм (in³)": 0.0163871,
-                "Чайная ложка (tsp)": 0.00492892,
-                "Столовая ложка (tbsp)": 0.0147868,
-                "Чашка (cup)": 0.236588
-            },
+            "volume": "Объем",
+            "volume.L": "Литр (л)",
+            "volume.mL": "Миллилитр (мл)",
+            "volume.gal": "Галлон (gal)",
+            "volume.pt": "Пинта (pt)",
+            "volume.m3": "Куб. метр (м³)",
+            "volume.in3": "Куб. дюйм (in³)",
+            "volume.tsp": "Чайная ложка (tsp)",
+            "volume.tbsp": "Столовая ложка (tbsp)",
+            "volume.cup": "Чашка (cup)",
             
             # Температура
-            "Температура": {
-                "Цельсий (°C)": "celsius",
-                "Фаренгейт (°F)": "fahrenheit",
-                "Кельвин (K)": "kelvin"
-            },
+            "temperature": "Температура",
+            "temperature.C": "Цельсий (°C)",
+            "temperature.F": "Фаренгейт (°F)",
+            "temperature.K": "Кельвин (K)",
             
             # Площадь
-            "Площадь": {
-                "Кв. метр (м²)": 1.0,
-                "Кв. километр (км²)": 1e6,
-                "Кв. сантиметр (см²)": 0.0001,
-                "Гектар (га)": 10000.0,
-                "Акр (ac)": 4046.86,
-                "Кв. миля (mi²)": 2.59e6,
-                "Кв. фут (ft²)": 0.092903
-            },
+            "area": "Площадь",
+            "area.m2": "Кв. метр (м²)",
+            "area.km2": "Кв. километр (км²)",
+            "area.cm2": "Кв. сантиметр (см²)",
+            "area.ha": "Гектар (га)",
+            "area.ac": "Акр (ac)",
+            "area.mi2": "Кв. миля (mi²)",
+            "area.ft2": "Кв. фут (ft²)",
             
             # Скорость
-            "Скорость": {
-                "м/с": 1.0,
-                "км/ч": 0.277778,
-                "миль/ч": 0.44704,
-                "узлы": 0.514444,
-                "Маха": 343.0
-            },
+            "speed": "Скорость",
+            "speed.m/s": "м/с",
+            "speed.km/h": "км/ч",
+            "speed.mph": "миль/ч",
+            "speed.knots": "узлы",
+            "speed.Mach": "Маха",
             
             # Данные
-            "Данные": {
-                "Бит (bit)": 1.0,
-                "Байт (B)": 8.0,
-                "Килобайт (KB)": 8192.0,
-                "Мегабайт (MB)": 8388608.0,
-                "Гигабайт (GB)": 8589934592.0,
-                "Терабайт (TB)": 8796093022208.0
-            },
+            "data": "Данные",
+            "data.bit": "Бит (bit)",
+            "data.B": "Байт (B)",
+            "data.KB": "Килобайт (KB)",
+            "data.MB": "Мегабайт (MB)",
+            "data.GB": "Гигабайт (GB)",
+            "data.TB": "Терабайт (TB)",
             
             # Энергия
-            "Энергия": {
-                "Джоуль (J)": 1.0,
-                "Килоджоуль (kJ)": 1000.0,
-                "Калория (cal)": 4.184,
-                "Килокалория (kcal)": 4184.0,
-                "кВт·ч": 3600000.0,
-                "Электронвольт (эВ)": 1.60218e-19
-            },
+            "energy": "Энергия",
+            "energy.J": "Джоуль (J)",
+            "energy.kJ": "Килоджоуль (kJ)",
+            "energy.cal": "Калория (cal)",
+            "energy.kcal": "Килокалория (kcal)",
+            "energy.kWh": "кВт·ч",
+            "energy.eV": "Электронвольт (эВ)",
             
             # Давление
-            "Давление": {
-                "Паскаль (Па)": 1.0,
-                "Бар (бар)": 100000.0,
-                "Атмосфера (атм)": 101325.0,
-                "мм рт.ст.": 133.322,
-                "PSI": 6894.76
-            },
+            "pressure": "Давление",
+            "pressure.Pa": "Паскаль (Па)",
+            "pressure.bar": "Бар (бар)",
+            "pressure.atm": "Атмосфера (атм)",
+            "pressure.mmHg": "мм рт.ст.",
+            "pressure.psi": "PSI",
             
             # Время
-            "Время": {
-                "Секунда (с)": 1.0,
-                "Минута (мин)": 60.0,
-                "Час (ч)": 3600.0,
-                "День": 86400.0,
-                "Неделя": 604800.0,
-                "Год": 31536000.0
-            },
+            "time": "Время",
+            "time.s": "Секунда (с)",
+            "time.min": "Минута (мин)",
+            "time.h": "Час (ч)",
+            "time.day": "День",
+            "time.week": "Неделя",
+            "time.year": "Год",
             
             # Радиация
-            "Радиация": {
-                "Зиверт (Sv)": 1.0,
-                "Бэр (rem)": 0.01,
-                "Рад (rad)": 0.01,
-                "Грей (Gy)": 1.0,
-                "Рентген (R)": 0.00933
-            },
+            "radiation": "Радиация",
+            "radiation.Sv": "Зиверт (Sv)",
+            "radiation.rem": "Бэр (rem)",
+            "radiation.rad": "Рад (rad)",
+            "radiation.Gy": "Грей (Gy)",
+            "radiation.R": "Рентген (R)",
             
             # Астрономия
-            "Астрономия": {
-                "Световой год (ly)": 1.0,
-                "Астрономическая единица (AU)": 63241.1,
-                "Парсек (pc)": 3.26156,
-                "Километр (km)": 9.461e12,
-                "Лунное расстояние (LD)": 384400.0
-            },
+            "astronomy": "Астрономия",
+            "astronomy.ly": "Световой год (ly)",
+            "astronomy.AU": "Астрономическая единица (AU)",
+            "astronomy.pc": "Парсек (pc)",
+            "astronomy.km": "Километр (km)",
+            "astronomy.LD": "Лунное расстояние (LD)",
             
             # Кухня
-            "Кухня": {
-                "Грамм (г)": 1.0,
-                "Килограмм (кг)": 1000.0,
-                "Унция (oz)": 28.3495,
-                "Фунт (lb)": 453.592,
-                "Чайная ложка (tsp)": 5.0,
-                "Столовая ложка (tbsp)": 15.0,
-                "Стакан (cup)": 240.0,
-                "Милилитр (мл)": 1.0,
-                "Литр (л)": 1000.0
-            },
+            "cooking": "Кухня",
+            "cooking.g": "Грамм (г)",
+            "cooking.kg": "Килограмм (кг)",
+            "cooking.oz": "Унция (oz)",
+            "cooking.lb": "Фунт (lb)",
+            "cooking.tsp": "Чайная ложка (tsp)",
+            "cooking.tbsp": "Столовая ложка (tbsp)",
+            "cooking.cup": "Стакан (cup)",
+            "cooking.mL": "Милилитр (мл)",
+            "cooking.L": "Литр (л)",
             
             # Углы
-            "Углы": {
-                "Градус (°)": 1.0,
-                "Радиан (rad)": 57.2958,
-                "Град (grad)": 0.9,
-                "Оборот (rev)": 360.0
-            }
+            "angles": "Углы",
+            "angles.deg": "Градус (°)",
+            "angles.rad": "Радиан (rad)",
+            "angles.grad": "Град (grad)",
+            "angles.rev": "Оборот (rev)",
+            
+            # Валюты
+            "currency": "Валюта"
         }
-        
-        # Валюта отдельно
-        self.currency_units = {
+    
+    @staticmethod
+    def load_currency_units():
+        """Загрузка валют"""
+        return {
             "USD (Доллар США)": 1.0,
             "EUR (Евро)": 0.85,
             "RUB (Рубль РФ)": 75.0,
@@ -210,8 +247,6 @@ class UniversalConverter:
             "INR (Индийская рупия)": 75.0,
             "BRL (Бразильский реал)": 5.25
         }
-        
-        return units
     
     def setup_variables(self):
         """Инициализация переменных"""
@@ -221,8 +256,11 @@ class UniversalConverter:
         self.input_value = tk.StringVar(value="1.0")
         self.result_value = tk.StringVar(value="")
         self.status_var = tk.StringVar(value="Готов к работе")
+        self.schedule_var = tk.StringVar(value="")
         self.api_key_var = tk.StringVar(value=self.API_KEY or "")
-        self.history = []
+        self.history = History(self.HISTORY_LIMIT, self.engine.registry)
+        self.history_search = tk.StringVar(value="")
+        self.history_search_job = None
     
     def create_interface(self):
         """Создание интерфейса"""
@@ -254,12 +292,20 @@ class UniversalConverter:
         ttk.Button(self.api_frame, text="Сохранить API", 
                   command=self.save_api_key).grid(row=0, column=2, padx=5, pady=5)
         
-        ttk.Button(self.api_frame, text="Обновить курсы", 
-                  command=self.update_currency_rates).grid(row=0, column=3, padx=5, pady=5)
+        self.update_btn = ttk.Button(self.api_frame, text="Обновить курсы", 
+                                     command=self.update_currency_rates)
+        self.update_btn.grid(row=0, column=3, padx=5, pady=5)
         
         ttk.Button(self.api_frame, text="Инструкция", 
                   command=self.show_api_instructions).grid(row=0, column=4, padx=5, pady=5)
         
+        # Показывается во время загрузки курсов
+        self.rate_progress = ttk.Progressbar(self.api_frame, mode='indeterminate', length=80)
+        
+        # Время следующего обновления и число запросов за месяц
+        ttk.Label(self.api_frame, textvariable=self.schedule_var).grid(
+            row=1, column=0, columnspan=6, padx=5, sticky=tk.W)
+        
         # Фрейм конвертации
         self.conv_frame = ttk.LabelFrame(main_frame, text="Конвертация")
         self.conv_frame.pack(fill=tk.X, pady=5)
@@ -269,7 +315,7 @@ class UniversalConverter:
         self.category_combo = ttk.Combobox(
             self.conv_frame, 
             textvariable=self.current_category, 
-            values=list(self.units.keys()), 
+            values=self.engine.registry.category_labels(), 
             state="readonly", 
             width=25
         )
@@ -309,13 +355,19 @@ class UniversalConverter:
         ttk.Label(main_frame, textvariable=self.status_var, font=('Segoe UI', 9)).pack(anchor=tk.W)
         
         # История
-        history_frame = ttk.LabelFrame(main_frame, text="История конвертаций (последние 20)")
+        history_frame = ttk.LabelFrame(main_frame, text="История конвертаций")
         history_frame.pack(fill=tk.BOTH, expand=True, pady=10)
         
-        self.history_text = scrolledtext.ScrolledText(history_frame, wrap=tk.WORD, 
-                                                    font=('Consolas', 9))
-        self.history_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        self.history_text.config(state=tk.DISABLED)
+        # Поиск по истории
+        search_frame = ttk.Frame(history_frame)
+        search_frame.pack(fill=tk.X, padx=5, pady=(5, 0))
+        ttk.Label(search_frame, text="Поиск:").pack(side=tk.LEFT)
+        ttk.Entry(search_frame, textvariable=self.history_search).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.history_search.trace_add("write", self.search_history)
+        
+        self.history_view = VirtualList(history_frame, [("№", 70), ("Время", 130), ("Конвертация", 600)],
+                                        count=self.history.visible, row=self.history_row)
+        self.history_view.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
         # Кнопки под историей
         history_btn_frame = ttk.Frame(history_frame)
@@ -323,20 +375,30 @@ class UniversalConverter:
 
         ttk.Button(history_btn_frame, text="Очистить историю", 
                   command=self.clear_history).pack(side=tk.LEFT, padx=5)
-        ttk.Button(history_btn_frame, text="Сохранить историю", 
-                  command=self.save_history).pack(side=tk.LEFT, padx=5)
+        self.save_btn = ttk.Button(history_btn_frame, text="Сохранить историю", 
+                                   command=self.save_history)
+        self.save_btn.pack(side=tk.LEFT, padx=5)
+        self.export_progress = ttk.Progressbar(history_btn_frame, mode='determinate',
+                                               length=150, maximum=1.0)
         
         # Кнопка выхода
         btn_frame = ttk.Frame(main_frame)
         btn_frame.pack(fill=tk.X, pady=5)
         
         ttk.Button(btn_frame, text="Выход", 
-                  command=self.root.quit).pack(side=tk.RIGHT)
+                  command=self.close).pack(side=tk.RIGHT)
     
     def toggle_currency_mode(self):
         """Переключение между обычным и валютным конвертером"""
         self.currency_mode = not self.currency_mode
+        self.apply_mode()
         
+        # Очищаем поле ввода при переключении режима
+        self.input_value.set("1.0")
+        self.result_value.set("")
+    
+    def apply_mode(self):
+        """Размещение виджетов текущего режима"""
         if self.currency_mode:
             self.mode_btn.config(text="Обычный конвертер", style='Normal.TButton')
             self.api_frame.pack(fill=tk.X, pady=5, before=self.conv_frame)
@@ -346,12 +408,11 @@ class UniversalConverter:
             self.category_combo.grid_forget()
             
             # Обновляем единицы измерения для валют
-            self.from_combo['values'] = list(self.currency_units.keys())
-            self.to_combo['values'] = list(self.currency_units.keys())
+            self.update_currency_list()
             
-            if not self.from_unit.get() or self.from_unit.get() not in self.currency_units:
+            if self.engine.registry.get(self.from_unit.get(), "currency") is None:
                 self.from_unit.set("USD (Доллар США)")
-            if not self.to_unit.get() or self.to_unit.get() not in self.currency_units:
+            if self.engine.registry.get(self.to_unit.get(), "currency") is None:
                 self.to_unit.set("EUR (Евро)")
         else:
             self.mode_btn.config(text="Конвертер валют", style='Currency.TButton')
@@ -367,18 +428,23 @@ class UniversalConverter:
         # Обновляем layout
         self.units_frame.grid(row=1, column=0, columnspan=3, sticky=tk.EW, pady=5)
         self.value_frame.grid(row=2, column=0, columnspan=3, sticky=tk.EW, pady=5)
-        
-        # Очищаем поле ввода при переключении режима
-        self.input_value.set("1.0")
-        self.result_value.set("")
     
     def initialize_data(self):
         """Инициализация данных при запуске"""
-        self.load_currency_rates()
-        self.update_units()
-        self.load_history()
-        self.toggle_currency_mode()  # Начинаем с обычного режима
-        self.toggle_currency_mode()  # Переключаем обратно для правильной инициализации
+        # Обычный режим размещается один раз; курсы и история приходят из фоновых потоков
+        self.apply_mode()
+        self.poll_startup()
+    
+    def poll_startup(self):
+        """Применение курсов и истории, прочитанных при запуске, по мере готовности"""
+        if self.startup_rates is not None and self.startup_rates.poll() is not None:
+            self.load_currency_rates(self.startup_rates)
+            self.startup_rates = None
+        if self.startup_history is not None and self.startup_history.poll() is not None:
+            self.load_history(self.startup_history)
+            self.startup_history = None
+        if self.startup_rates is not None or self.startup_history is not None:
+            self.root.after(20, self.poll_startup)
     
     def update_units(self, event=None):
         """Обновление списка единиц измерения"""
@@ -386,7 +452,7 @@ class UniversalConverter:
             return
             
         category = self.current_category.get()
-        units = list(self.units[category].keys())
+        units = list(self.engine.registry.category(category).labels)
         
         self.from_combo['values'] = units
         self.to_combo['values'] = units
@@ -403,6 +469,9 @@ class UniversalConverter:
             if os.path.exists(self.api_file):
                 with open(self.api_file, 'r') as f:
                     data = json.load(f)
+                    self.REQUEST_TIMEOUT = data.get('timeout', self.REQUEST_TIMEOUT)
+                    self.BASE_URL = data.get('base_url', self.BASE_URL)
+                    self.provider_config = data.get('providers', self.provider_config)
                     return data.get('api_key', "")
         except Exception as e:
             print(f"Ошибка загрузки API ключа: {e}")
@@ -411,14 +480,25 @@ class UniversalConverter:
     def save_api_key(self):
         """Сохранение API ключа в файл"""
         self.API_KEY = self.api_key_var.get().strip()
+        self.build_rate_providers()
         try:
             with open(self.api_file, 'w') as f:
-                json.dump({'api_key': self.API_KEY}, f)
+                json.dump({'api_key': self.API_KEY, 'timeout': self.REQUEST_TIMEOUT,
+                           'base_url': self.BASE_URL, 'providers': self.provider_config}, f)
             messagebox.showinfo("Успех", "API ключ сохранен!")
             self.load_currency_rates()  # Попробуем загрузить курсы с новым ключом
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось сохранить ключ: {str(e)}")
     
+    def build_rate_providers(self):
+        """Источники курсов: API при наличии ключа и источники из converter_api.json"""
+        api_url = f"{self.BASE_URL}{self.API_KEY}/latest/USD" if self.API_KEY else None
+        try:
+            self.rate_providers = build_providers(self.provider_config, api_url, self.rate_client)
+        except (KeyError, ValueError) as e:
+            print(f"Ошибка в настройке источников курсов: {e}")
+            self.rate_providers = build_providers((), api_url, self.rate_client)
+    
     def show_api_instructions(self):
         """Показать инструкцию по получению API ключа"""
         instructions = """
@@ -436,110 +516,177 @@ class UniversalConverter:
         """
         messagebox.showinfo("Инструкция по получению API ключа", instructions)
     
-    def load_currency_rates(self):
+    def load_currency_rates(self, prefetch=None):
         """Загрузка курсов валют из файла или API"""
         try:
             # Пытаемся загрузить из файла
-            if os.path.exists(self.rates_file):
-                with open(self.rates_file, 'r') as f:
-                    data = json.load(f)
-                    last_update = datetime.strptime(data['last_update'], '%Y-%m-%d')
-                    
-                    # Если с последнего обновления прошло меньше 7 дней
-                    if datetime.now() - last_update < timedelta(days=7):
-                        self.rates = data['rates']
-                        self.last_update = last_update
-                        self.status_var.set(f"Курсы загружены из файла ({last_update.strftime('%d.%m.%Y')})")
-                        
-                        # Обновляем коэффициенты в currency_units
-                        for curr, rate in self.rates.items():
-                            # Найти валюту в currency_units по коду (начало строки)
-                            for key in list(self.currency_units.keys()):
-                                if key.startswith(curr + " "):
-                                    self.currency_units[key] = rate
-                                    break
-                        return
-            
-            # Если файла нет, или данные устарели, но есть API ключ - обновляем
-            if self.API_KEY:
-                self.update_currency_rates()
+            if prefetch is not None:
+                cache = prefetch.result()
             else:
+                cache = read_rates(self.rates_file, self.legacy_rates_file)
+            if cache is not None:
+                self.rates, self.rate_validators, last_update = cache
+                self.last_update = last_update
+                self.status_var.set(f"Курсы загружены из файла ({last_update.strftime('%d.%m.%Y')})")
+                self.apply_currency_rates()
+            elif not self.rates:
                 self.status_var.set("Используются сохраненные курсы (без обновления)")
-                
         except Exception as e:
             self.status_var.set(f"Ошибка загрузки курсов: {str(e)}")
             # Используем сохраненные значения по умолчанию
+        
+        # Обновляем, если планировщик считает, что пора
+        if self.rate_providers and self.rate_schedule.is_due():
+            self.update_currency_rates(notify=False)
+        self.schedule_rate_refresh()
     
-    def update_currency_rates(self):
+    def update_currency_rates(self, notify=True):
         """Обновление курсов валют через API"""
-        if not self.API_KEY:
+        if not self.rate_providers:
             messagebox.showwarning("Ошибка", "Введите API ключ для обновления курсов")
             return
             
+        if self.rate_fetch is not None:
+            return
+        if not self.rate_schedule.remaining():
+            when = datetime.fromtimestamp(self.rate_schedule.next_fetch()).strftime('%d.%m.%Y %H:%M')
+            messagebox.showwarning("Ошибка", f"Месячный лимит запросов исчерпан, следующее обновление {when}")
+            return
+        
+        # Запрос выполняется в фоновом потоке, окно не блокируется
+        self.status_var.set("Обновление курсов...")
+        self.update_btn.config(text="Отмена", command=self.cancel_rate_update)
+        self.rate_progress.grid(row=0, column=5, padx=5, pady=5)
+        self.rate_progress.start(10)
+        self.rate_notify = notify
+        self.rate_fetch = RateFetch(self.rate_providers, self.rate_validators)
+        self.root.after(100, self.poll_rate_update, self.rate_fetch)
+    
+    def poll_rate_update(self, fetch):
+        """Получение результата фонового обновления курсов"""
+        if fetch is not self.rate_fetch:
+            return
+        result = fetch.poll()
+        if result is None:
+            self.root.after(100, self.poll_rate_update, fetch)
+            return
+        self.finish_rate_update()
+        self.record_rate_fetch(fetch, result)
+        
         try:
-            self.status_var.set("Обновление курсов...")
-            self.root.update()
+            response, error = result
+            if error is not None:
+                raise error
+            self.rate_validators[response.provider] = response.validators
             
-            response = requests.get(f"{self.BASE_URL}{self.API_KEY}/latest/USD")
-            data = response.json()
+            if response.not_modified:
+                # 304: сохранённые курсы актуальны, обновляем только дату
+                self.last_update = datetime.now()
+                self.apply_currency_rates()
+                self.save_currency_rates()
+                self.status_var.set(f"Курсы актуальны ({self.last_update.strftime('%d.%m.%Y')})")
+                return
+            data = response.data
             
             if data['result'] == 'success':
-                self.rates = {
-                    'USD': 1.0,
-                    'EUR': data['conversion_rates']['EUR'],
-                    'RUB': data['conversion_rates']['RUB'],
-                    'GBP': data['conversion_rates']['GBP'],
-                    'JPY': data['conversion_rates']['JPY'],
-                    'CNY': data['conversion_rates']['CNY'],
-                    'AUD': data['conversion_rates']['AUD'],
-                    'CAD': data['conversion_rates']['CAD'],
-                    'CHF': data['conversion_rates']['CHF'],
-                    'INR': data['conversion_rates']['INR'],
-                    'BRL': data['conversion_rates']['BRL']
-                }
+                self.rates = data['conversion_rates']
                 
-                # Обновляем коэффициенты в currency_units
-                for curr, rate in self.rates.items():
-                    for key in list(self.currency_units.keys()):
-                        if key.startswith(curr + " "):
-                            self.currency_units[key] = rate
-                            break
+                self.apply_currency_rates()
+                # Каждый полученный снимок курсов сохраняется для пересчёта на дату
+                self.engine.history.add(self.rates, data.get('time_last_update_unix'))
                 
                 # Сохраняем в файл
                 self.last_update = datetime.now()
-                with open(self.rates_file, 'w') as f:
-                    json.dump({
-                        'rates': self.rates,
-                        'last_update': self.last_update.strftime('%Y-%m-%d')
-                    }, f)
+                self.save_currency_rates()
                 
                 self.status_var.set(f"Курсы обновлены ({self.last_update.strftime('%d.%m.%Y')})")
-                messagebox.showinfo("Успех", "Курсы валют успешно обновлены!")
+                if self.rate_notify:
+                    messagebox.showinfo("Успех", "Курсы валют успешно обновлены!")
             else:
                 error_msg = data.get('error-type', 'Unknown error')
                 self.status_var.set(f"Ошибка API: {error_msg}")
-                messagebox.showerror("Ошибка API", f"Не удалось обновить курсы: {error_msg}")
+                if self.rate_notify:
+                    messagebox.showerror("Ошибка API", f"Не удалось обновить курсы: {error_msg}")
                 
         except Exception as e:
             self.status_var.set(f"Ошибка обновления: {str(e)}")
-            messagebox.showerror("Ошибка", f"Не удалось обновить курсы: {str(e)}")
+            if self.rate_notify:
+                messagebox.showerror("Ошибка", f"Не удалось обновить курсы: {str(e)}")
+    
+    def record_rate_fetch(self, fetch, result):
+        """Учёт запроса в лимите и планирование следующего"""
+        response, error = result
+        success = error is None and (response.not_modified or (
+            isinstance(response.data, dict) and response.data.get('result') == 'success'))
+        next_update = None
+        if success and not response.not_modified:
+            next_update = response.data.get('time_next_update_unix')
+        self.rate_schedule.record(fetch.count_sent(), success, next_update)
+        self.schedule_rate_refresh()
+    
+    def schedule_rate_refresh(self):
+        """Планирование следующего автоматического обновления курсов"""
+        if self.refresh_job is not None:
+            self.root.after_cancel(self.refresh_job)
+            self.refresh_job = None
+        if not self.rate_providers:
+            self.schedule_var.set("")
+            return
+        next_fetch = self.rate_schedule.next_fetch()
+        when = datetime.fromtimestamp(next_fetch).strftime('%d.%m.%Y %H:%M')
+        used = self.rate_schedule.quota - self.rate_schedule.remaining()
+        self.schedule_var.set(f"Следующее обновление: {when} · запросов в этом месяце: {used}/{self.rate_schedule.quota}")
+        # Проверяем не реже раза в час, чтобы спящий режим не задерживал обновление
+        delay = min(max(next_fetch - datetime.now().timestamp(), 1), 3600)
+        self.refresh_job = self.root.after(int(delay * 1000), self.scheduled_refresh)
+    
+    def scheduled_refresh(self):
+        """Автоматическое обновление курсов"""
+        self.refresh_job = None
+        if self.rate_providers and self.rate_fetch is None and self.rate_schedule.is_due():
+            self.update_currency_rates(notify=False)
+        else:
+            self.schedule_rate_refresh()
+    
+    def apply_currency_rates(self):
+        """Перенос курсов в таблицу валют"""
+        self.engine.set_rates(self.rates)
+        if self.currency_mode:
+            self.update_currency_list()
+    
+    def save_currency_rates(self):
+        """Сохранение курсов в файл"""
+        write_rate_cache(self.rates_file, self.rates, self.last_update.timestamp(),
+                         self.rate_validators)
+    
+    def cancel_rate_update(self):
+        """Отмена обновления курсов"""
+        if self.rate_fetch is not None:
+            self.rate_fetch.cancel()
+            self.rate_schedule.record(self.rate_fetch.count_sent(), False)
+        self.finish_rate_update()
+        self.schedule_rate_refresh()
+        self.status_var.set("Обновление курсов отменено")
+    
+    def finish_rate_update(self):
+        """Выход из состояния обновления курсов"""
+        self.rate_fetch = None
+        self.rate_progress.stop()
+        self.rate_progress.grid_remove()
+        self.update_btn.config(text="Обновить курсы", command=self.update_currency_rates)
     
     def get_currency_name(self, code):
         """Получение названия валюты по коду"""
-        names = {
-            'USD': 'Доллар США',
-            'EUR': 'Евро',
-            'RUB': 'Рубль РФ',
-            'GBP': 'Фунт стерлингов',
-            'JPY': 'Японская иена',
-            'CNY': 'Китайский юань',
-            'AUD': 'Австралийский доллар',
-            'CAD': 'Канадский доллар',
-            'CHF': 'Швейцарский франк',
-            'INR': 'Индийская рупия',
-            'BRL': 'Бразильский реал'
-        }
-        return names.get(code, code)
+        unit = self.engine.registry.get(code, "currency")
+        if unit is None:
+            return code
+        return unit.label.partition(" (")[2].rstrip(")") or code
+    
+    def update_currency_list(self):
+        """Обновление списка валют"""
+        currencies = list(self.engine.registry.category("currency").labels)
+        self.from_combo['values'] = currencies
+        self.to_combo['values'] = currencies
     
     def convert(self):
         """Выполнение конвертации"""
@@ -548,9 +695,17 @@ class UniversalConverter:
             if not input_value:
                 raise ValueError("Введите значение для конвертации")
             
-            value = float(input_value)
+            try:
+                value = float(input_value)
+            except ValueError:
+                value = None
             
-            if self.currency_mode:
+            if value is None:
+                # Выражение вида "3 ft 2 in to cm" или "12.5 psi -> bar"
+                result, category, to_unit = self.engine.evaluate(input_value)
+                self.add_to_history(make_record(self.engine.registry, EXPRESSION, category,
+                                                None, to_unit, input_value, result))
+            elif self.currency_mode:
                 from_unit = self.from_unit.get()
                 to_unit = self.to_unit.get()
                 
@@ -562,12 +717,14 @@ class UniversalConverter:
                     return
                 
                 # Проверяем наличие валют в словаре
-                if from_unit not in self.currency_units or to_unit not in self.currency_units:
+                currencies = self.engine.registry.category("currency")
+                if currencies.get(from_unit) is None or currencies.get(to_unit) is None:
                     raise ValueError("Выбранные валюты не найдены")
                 
                 # Конвертация с использованием сохраненных значений
-                result = value * (self.currency_units[to_unit] / self.currency_units[from_unit])
-                self.add_to_history(f"{value} {from_unit} → {result:.6f} {to_unit} (Валюта)")
+                result = self.engine.convert(value, currencies, from_unit, to_unit)
+                self.add_to_history(make_record(self.engine.registry, CURRENCY, currencies,
+                                                from_unit, to_unit, value, result))
             else:
                 category = self.current_category.get()
                 from_unit = self.from_unit.get()
@@ -580,24 +737,10 @@ class UniversalConverter:
                     self.result_value.set(value)
                     return
                     
-                if category == "Температура":
-                    result = self.convert_temperature(value, from_unit, to_unit)
-                else:
-                    # Для других категорий используем стандартную логику
-                    from_val = self.units[category][from_unit]
-                    to_val = self.units[category][to_unit]
-                    
-                    if callable(from_val):
-                        base = from_val(value, False)
-                    else:
-                        base = value * from_val
-                        
-                    if callable(to_val):
-                        result = to_val(base, True)
-                    else:
-                        result = base / to_val
+                result = self.engine.convert(value, category, from_unit, to_unit)
                 
-                self.add_to_history(f"{value} {from_unit} → {result:.6f} {to_unit} ({category})")
+                self.add_to_history(make_record(self.engine.registry, UNITS, category,
+                                                from_unit, to_unit, value, result))
             
             # Форматирование результата (удаление лишних нулей)
             formatted_result = "{0:.8f}".format(result).rstrip('0').rstrip('.') if '.' in "{0:.8f}".format(result) else str(result)
@@ -608,27 +751,6 @@ class UniversalConverter:
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка конвертации: {str(e)}")
     
-    def convert_temperature(self, value, from_unit, to_unit):
-        """Конвертация температуры"""
-        if from_unit == to_unit:
-            return value
-            
-        # Конвертация в Цельсии
-        if "Фаренгейт" in from_unit:
-            celsius = (value - 32) * 5/9
-        elif "Кельвин" in from_unit:
-            celsius = value - 273.15
-        else:
-            celsius = value
-            
-        # Конвертация из Цельсиев
-        if "Фаренгейт" in to_unit:
-            return celsius * 9/5 + 32
-        elif "Кельвин" in to_unit:
-            return celsius + 273.15
-        else:
-            return celsius
-    
     def swap_units(self):
         """Обмен единицами измерения"""
         from_unit = self.from_unit.get()
@@ -638,55 +760,144 @@ class UniversalConverter:
         if self.result_value.get():
             self.convert()
     
-    def add_to_history(self, entry):
+    def add_to_history(self, record, save=True):
         """Добавление записи в историю"""
-        self.history.append(entry)
-        if len(self.history) > 20:
-            self.history.pop(0)
-        
-        self.history_text.config(state=tk.NORMAL)
-        self.history_text.delete(1.0, tk.END)
-        for i, item in enumerate(reversed(self.history), 1):
-            self.history_text.insert(tk.END, f"{i}. {item}\n")
-        self.history_text.config(state=tk.DISABLED)
-        self.history_text.see(tk.END)
+        visible = self.history.append(record)
+        if save:
+            # В журнал записывается через flush_history() в течение секунды
+            self.history_journal.append(record.as_dict())
+            if self.history_flush_job is None:
+                self.history_flush_job = self.root.after(1000, self.flush_history)
+        self.history_view.inserted(1 if visible else 0)
+    
+    def history_row(self, index):
+        """Значения строки index панели истории, новые записи первыми"""
+        number = self.history.visible_number(index)
+        record = self.history[number]
+        when = datetime.fromtimestamp(record.time).strftime('%d.%m.%Y %H:%M') if record.time else ""
+        return (number, when, describe(record, self.engine.registry))
+    
+    def search_history(self, *args):
+        """Фильтрация истории по словам из поля поиска, когда ввод приостановлен"""
+        if self.history_search_job is not None:
+            self.root.after_cancel(self.history_search_job)
+        self.history_search_job = self.root.after(150, self.apply_history_search)
+    
+    def apply_history_search(self):
+        """Применение поиска к панели истории"""
+        self.history_search_job = None
+        self.history.search(Query(self.history_search.get(), self.engine.registry))
+        self.history_view.show(0)
     
     def clear_history(self):
         """Очистка истории"""
-        self.history = []
-        self.history_text.config(state=tk.NORMAL)
-        self.history_text.delete(1.0, tk.END)
-        self.history_text.config(state=tk.DISABLED)
+        self.history.clear()
+        try:
+            self.history_journal.clear()
+        except OSError as e:
+            self.status_var.set(f"Не удалось сохранить историю: {str(e)}")
+        self.history_view.refresh()
     
     def save_history(self):
-        """Сохранение истории в файл"""
+        """Экспорт истории в файл в фоновом потоке"""
+        if self.history_export is not None:
+            return
+        filetypes = [("Текстовые файлы", "*.txt"), ("Файлы CSV", "*.csv"), ("Файлы JSON Lines", "*.jsonl")]
+        if parquet_available():
+            filetypes.append(("Файлы Parquet", "*.parquet"))
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".txt",
+            filetypes=filetypes + [("Все файлы", "*.*")],
+            title="Сохранить историю конвертаций"
+        )
+        if not file_path:
+            return
+        
+        # Экспорт читает журнал, поэтому сначала записываем накопленные записи
+        if self.history_flush_job is not None:
+            self.root.after_cancel(self.history_flush_job)
+        self.flush_history(wait=True)
+        self.history_export = HistoryExport(self.history_journal.path, file_path,
+                                            self.engine.registry, "История конвертаций")
+        self.save_btn.config(text="Отмена", command=self.cancel_history_export)
+        self.export_progress["value"] = 0.0
+        self.export_progress.pack(side=tk.LEFT, padx=5)
+        self.root.after(100, self.poll_history_export, self.history_export)
+    
+    def poll_history_export(self, export):
+        """Отображение хода экспорта истории, затем его результата"""
+        if export is not self.history_export:
+            return
+        self.export_progress["value"] = export.done
+        result = export.poll()
+        if result is None:
+            self.root.after(100, self.poll_history_export, export)
+            return
+        self.finish_history_export()
+        
         try:
-            file_path = filedialog.asksaveasfilename(
-                defaultextension=".txt",
-                filetypes=[("Текстовые файлы", "*.txt"), ("Все файлы", "*.*")],
-                title="Сохранить историю конвертаций"
-            )
-            if file_path:
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write("История конвертаций:\n")
-                    f.write("="*50 + "\n")
-                    for i, item in enumerate(self.history, 1):
-                        f.write(f"{i}. {item}\n")
-                messagebox.showinfo("Успех", "История успешно сохранена")
+            _, error = result
+            if error is not None:
+                raise error
+            messagebox.showinfo("Успех", "История успешно сохранена")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось сохранить: {str(e)}")
     
-    def load_history(self):
+    def cancel_history_export(self):
+        """Отмена экспорта истории"""
+        if self.history_export is not None:
+            self.history_export.cancel()
+        self.finish_history_export()
+        self.status_var.set("Экспорт истории отменён")
+    
+    def finish_history_export(self):
+        """Выход из состояния экспорта истории"""
+        self.history_export = None
+        self.export_progress.pack_forget()
+        self.save_btn.config(text="Сохранить историю", command=self.save_history)
+    
+    def flush_history(self, wait=False):
+        """Запись накопленных записей истории в журнал"""
+        self.history_flush_job = None
+        try:
+            self.history_journal.flush(wait)
+        except OSError as e:
+            self.status_var.set(f"Не удалось сохранить историю: {str(e)}")
+        # Записи ждут, пока журнал сжимается
+        if not wait and self.history_journal.pending:
+            self.history_flush_job = self.root.after(1000, self.flush_history)
+    
+    def load_history(self, prefetch=None):
         """Загрузка истории из файла"""
         try:
-            if os.path.exists("converter_history.json"):
-                with open("converter_history.json", "r", encoding="utf-8") as f:
-                    self.history = json.load(f)
-                self.add_to_history("История загружена")
-        except:
-            pass
+            if prefetch is not None:
+                records = prefetch.result()
+            else:
+                records = read_records(self.history_journal, self.HISTORY_LIMIT)
+        except (OSError, ValueError) as e:
+            self.status_var.set(f"Ошибка загрузки истории: {str(e)}")
+            return
+        if records:
+            # Записи, добавленные пока читался файл, остаются самыми новыми
+            self.history.reset(records + list(self.history))
+            self.add_to_history(note("История загружена"), save=False)
+    
+    def close(self):
+        """Сохранение истории и закрытие окна"""
+        if self.history_export is not None:
+            self.history_export.cancel()
+        if self.history_flush_job is not None:
+            self.root.after_cancel(self.history_flush_job)
+        self.flush_history(wait=True)
+        self.root.destroy()
 
 if __name__ == "__main__":
+    # --timing выводит длительность каждого этапа запуска
+    timer = PhaseTimer(STARTED)
+    timer.mark("imports")
     root = tk.Tk()
-    app = UniversalConverter(root)
+    timer.mark("tk")
+    app = UniversalConverter(root, timer)
+    if "--timing" in sys.argv:
+        root.after_idle(timer.report)
     root.mainloop()
\ No newline at end of file